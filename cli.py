@@ -1,36 +1,87 @@
+import os
 import click
-from core.photo_dumper import PhotoDumper
+from core.photo_dumper import PhotoDumper, CATEGORIZER_MODELS, DEFAULT_CATEGORIZER_MODEL
+from core.streaming import StreamingPhotoDumper
+from core.autotune import PROFILE_FILE, device_profile
+from utils.telemetry import telemetry
+from utils.timing import stage_timer
+from core.backends import BACKENDS, DEFAULT_ARTIFACTS_DIR
+from utils.materialize import OUTPUT_MODES, DEFAULT_OUTPUT_MODE
 
 @click.command()
 @click.argument('album_path', type=click.Path(exists=True))
 @click.argument('categories_file', type=click.Path(exists=True), default='defaults/photodump_list.txt')
-@click.option('--batch-size', default=1, help='Number of images to process in each batch')
+@click.option('--batch-size', type=int, default=None, help='Number of images to process in each batch (default: tuned per model)')
 @click.option('--pre-filter', default=100, help='Number of photos to pre-filter per category')
 @click.option('--keep-top-k', default=1, help='Number of top photos to keep per category')
 @click.option('--output-dir', default='output', help='Directory to save output files')
 @click.option('--aesthetic-weight', default=0.6, help='Weight given to aesthetic score vs CLIP score')
-def main(album_path, categories_file, batch_size, pre_filter, keep_top_k, output_dir, aesthetic_weight):
+@click.option('--output-mode', type=click.Choice(OUTPUT_MODES), default=DEFAULT_OUTPUT_MODE,
+              help='How selected photos appear in the output folders (auto: reflink, else hardlink, else copy)')
+@click.option('--cache-dir', default='cache', help='Directory for the persistent embedding cache')
+@click.option('--cache-size-mb', default=2048, help='Maximum size of the embedding cache in megabytes')
+@click.option('--no-cache', is_flag=True, help='Disable the embedding cache')
+@click.option('--no-dedupe', is_flag=True, help='Send every photo to the models, even exact or near duplicates')
+@click.option('--dedupe-distance', default=6, help='Max perceptual-hash distance (of 64 bits) between near-duplicates')
+@click.option('--full', is_flag=True, help='Re-score every photo instead of reusing scores from the previous run')
+@click.option('--num-workers', default=1, help='Processes to shard inference across, each with its own model copy')
+@click.option('--categorizer', type=click.Choice(CATEGORIZER_MODELS), default=DEFAULT_CATEGORIZER_MODEL,
+              help='Model choosing categories (smolvlm: describe each photo first, slower but more accurate)')
+@click.option('--backend', type=click.Choice(BACKENDS), default='torch', help='Inference backend of the encoders')
+@click.option('--artifacts-dir', default=DEFAULT_ARTIFACTS_DIR, help='Directory of encoders exported with optimize.py')
+@click.option('--screen-keep', default=0, help='Photos per category a small CLIP model passes to the full scorer (0: score all)')
+@click.option('--audit-cascade', is_flag=True, help='Also fully score screened-out photos and report the recall of the cascade')
+@click.option('--streaming', is_flag=True, help='Process the album in journaled chunks with bounded memory, resuming after interruptions')
+@click.option('--no-autotune', is_flag=True, help='Use default dtypes and batch sizes for models not yet tuned on this machine')
+@click.option('--trace', type=click.Path(), default=None, help='Write a Chrome trace of the run to this JSON file')
+def main(album_path, categories_file, batch_size, pre_filter, keep_top_k, output_dir, aesthetic_weight, output_mode,
+         cache_dir, cache_size_mb, no_cache, no_dedupe, dedupe_distance, full, num_workers, backend, artifacts_dir,
+         screen_keep, audit_cascade, streaming, no_autotune, trace, categorizer):
     """Generate AI photo dump by categorizing photos and selecting the best ones.
     
     ALBUM_PATH: Path to folder containing photos
     CATEGORIES_FILE: Path to text file containing numbered categories
     """
+    device_profile.path = os.path.join(cache_dir, PROFILE_FILE)
+    device_profile.enabled = not no_autotune
     click.echo("Categorizing photos...")
-    photo_dumper = PhotoDumper(
+    dumper_class = StreamingPhotoDumper if streaming else PhotoDumper
+    photo_dumper = dumper_class(
         album_path=album_path,
         categories_file=categories_file,
         batch_size=batch_size,
         pre_filter=pre_filter,
         keep_top_k=keep_top_k,
         output_dir=output_dir,
-        aesthetic_weight=aesthetic_weight
+        aesthetic_weight=aesthetic_weight,
+        cache_dir=None if no_cache else cache_dir,
+        cache_size_mb=cache_size_mb,
+        dedupe=not no_dedupe,
+        dedupe_max_distance=dedupe_distance,
+        incremental=not full,
+        num_workers=num_workers,
+        backend=backend,
+        artifacts_dir=artifacts_dir,
+        screen_keep=screen_keep,
+        audit_cascade=audit_cascade,
+        output_mode=output_mode,
+        categorizer_model=categorizer
     )
     click.echo("Grouping photos by category...")
-    ranked_categories = photo_dumper.process()
+    with telemetry.trace() as recorded:
+        ranked_categories = photo_dumper.process()
+    if trace:
+        recorded.save(trace)
+        click.echo(f"Saved trace to {trace} (open in chrome://tracing or Perfetto)")
     click.echo("Ranking photos...")
     
-    click.echo("\nProcessing complete! Results saved in the 'output' directory.")
+    click.echo(f"\nProcessing complete! Results saved in '{output_dir}' (see selection.json).")
     click.echo(f"Selected {sum(len(photos) for photos in ranked_categories.values())} photos across {len(ranked_categories)} categories.")
+    for stage, totals in stage_timer.snapshot().items():
+        click.echo(f"  {stage}: {totals['seconds']:.2f}s over {totals['calls']} calls")
+    if photo_dumper.cache:
+        stats = photo_dumper.cache.stats()
+        click.echo(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses, {stats['size_mb']:.1f} MB")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,123 @@
+import json
+import os
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+ALBUM_STATE_FILE = "album_state.json"
+ALBUM_STATE_VERSION = 1
+
+
+class AlbumState:
+    def __init__(self, path: str, signature: Dict[str, object]):
+        """
+        Per-photo intermediate results of the last run, so a re-run only scores what changed.
+
+        Photos are keyed by the SHA-256 of their bytes. For each one the state keeps its
+        BLIP probability over the categories, its aesthetic score and its CLIP score for
+        every category it was ranked in, plus the same two signals from the screening model
+        when the ranking cascade is on. Probabilities depend on the whole category list
+        and are dropped when it changes; the other scores depend only on the photo (and
+        the category name) and are kept.
+
+        Args:
+            path: JSON file the state is stored in
+            signature: Model ids and preprocessing versions the scores were produced with;
+                state saved under a different signature is discarded on load
+        """
+        self.path = path
+        self.signature = dict(signature)
+        self.categories: List[str] = []
+        self.photos: Dict[str, dict] = {}
+        self.selection: Dict[str, List[str]] = {}  # Output folder -> file names copied into it
+
+    @classmethod
+    def load(cls, path: str, signature: Dict[str, object]) -> "AlbumState":
+        """Read the state saved at `path`, or start empty if it is missing, unreadable or stale."""
+        state = cls(path, signature)
+        if not os.path.exists(path):
+            return state
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable album state {path}: {e}")
+            return state
+        if data.get("version") != ALBUM_STATE_VERSION or data.get("signature") != state.signature:
+            return state
+        state.categories = data.get("categories", [])
+        state.photos = data.get("photos", {})
+        state.selection = data.get("selection", {})
+        return state
+
+    def save(self):
+        """Write the state atomically, so an interrupted run never leaves a truncated file."""
+        temp_path = f"{self.path}.{uuid.uuid4().hex}.part"
+        with open(temp_path, 'w') as f:
+            json.dump({
+                "version": ALBUM_STATE_VERSION,
+                "signature": self.signature,
+                "categories": self.categories,
+                "photos": self.photos,
+                "selection": self.selection,
+            }, f)
+        os.replace(temp_path, self.path)
+
+    def set_categories(self, categories: List[str]) -> bool:
+        """
+        Record the category list, forgetting probabilities computed for a different one.
+
+        Returns:
+            True if the category list changed
+        """
+        if categories == self.categories:
+            return False
+        self.categories = list(categories)
+        for entry in self.photos.values():
+            entry.pop("probabilities", None)
+        return True
+
+    def prune(self, digests: Iterable[str]) -> int:
+        """
+        Forget photos that are no longer in the album.
+
+        Args:
+            digests: Content hashes of the photos still in the album
+
+        Returns:
+            Number of photos forgotten
+        """
+        keep = set(digests)
+        removed = [digest for digest in self.photos if digest not in keep]
+        for digest in removed:
+            del self.photos[digest]
+        return len(removed)
+
+    def probabilities(self, digest: str) -> Optional[List[float]]:
+        return self.photos.get(digest, {}).get("probabilities")
+
+    def set_probabilities(self, digest: str, probabilities: List[float]):
+        self.photos.setdefault(digest, {})["probabilities"] = [float(p) for p in probabilities]
+
+    def aesthetic(self, digest: str) -> Optional[float]:
+        return self.photos.get(digest, {}).get("aesthetic")
+
+    def set_aesthetic(self, digest: str, score: float):
+        self.photos.setdefault(digest, {})["aesthetic"] = float(score)
+
+    def clip_score(self, digest: str, category: str) -> Optional[float]:
+        return self.photos.get(digest, {}).get("clip", {}).get(category)
+
+    def set_clip_score(self, digest: str, category: str, score: float):
+        self.photos.setdefault(digest, {}).setdefault("clip", {})[category] = float(score)
+
+    def screen_quality(self, digest: str) -> Optional[float]:
+        return self.photos.get(digest, {}).get("screen_quality")
+
+    def set_screen_quality(self, digest: str, score: float):
+        self.photos.setdefault(digest, {})["screen_quality"] = float(score)
+
+    def screen_clip_score(self, digest: str, category: str) -> Optional[float]:
+        return self.photos.get(digest, {}).get("screen_clip", {}).get(category)
+
+    def set_screen_clip_score(self, digest: str, category: str, score: float):
+        self.photos.setdefault(digest, {}).setdefault("screen_clip", {})[category] = float(score)
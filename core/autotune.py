@@ -0,0 +1,299 @@
+import copy
+import gc
+import itertools
+import json
+import os
+import platform
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Sequence
+
+import torch
+import torch.nn.functional as F
+
+PROFILE_FILE = "device_profile.json"
+DEFAULT_PROFILE_PATH = os.path.join("cache", PROFILE_FILE)
+PROFILE_VERSION = 1
+BATCH_SIZES = (1, 2, 4, 8, 16)
+MIN_COSINE = 0.995          # Outputs of a dtype must stay this close to float32 to be acceptable
+MIN_SPEEDUP = 1.05          # A larger batch must be at least this much faster per item to keep growing
+TUNE_REPEATS = 2            # Timed runs per configuration, after one warm-up run
+TUNE_BUDGET_SECONDS = 60.0  # Time spent on one dtype before its larger batch sizes are skipped
+
+# Candidate dtypes per device, float32 (the reference) first. fp16 is left out on the
+# CPU, where its matmuls are emulated and much slower than float32.
+DTYPE_CANDIDATES = {
+    "cuda": ("float32", "float16", "bfloat16"),
+    "mps": ("float32", "float16"),
+    "cpu": ("float32", "bfloat16"),
+}
+DEFAULT_DTYPES = {"cuda": "float16", "mps": "float16", "cpu": "float32"}
+
+
+def select_device() -> str:
+    """The device every model runs on: CUDA, then Apple MPS, then the CPU."""
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+DEVICE = select_device()
+
+
+def machine_fingerprint(device: str = DEVICE) -> Dict[str, object]:
+    """What a profile was measured on; a profile from another machine or torch version is not reused."""
+    if device == "cuda":
+        name = torch.cuda.get_device_name(0)
+    else:
+        name = platform.processor() or platform.machine()
+    return {"device": device, "device_name": name, "cpu_count": os.cpu_count(), "torch": torch.__version__}
+
+
+def _synchronize(device: str):
+    if device == "cuda":
+        torch.cuda.synchronize()
+    elif device == "mps":
+        torch.mps.synchronize()
+
+
+def _to(inputs: Dict[str, torch.Tensor], device: str, dtype: torch.dtype) -> Dict[str, torch.Tensor]:
+    """Move inputs to a device, casting only floating-point ones (pixels, not token ids)."""
+    return {name: x.to(device, dtype) if x.is_floating_point() else x.to(device) for name, x in inputs.items()}
+
+
+def _call(module: torch.nn.Module, inputs: Dict[str, torch.Tensor]) -> torch.Tensor:
+    return module(**inputs)
+
+
+def _cast_copy(module: torch.nn.Module, device: str, dtype: torch.dtype) -> torch.nn.Module:
+    """
+    Copy of a module whose floating-point tensors are created directly in `dtype` on `device`.
+
+    Unlike `copy.deepcopy(module).to(device, dtype)`, no float32 copy of the weights is
+    made on the way, and tensors that already have the device and dtype are shared with
+    `module` rather than copied, so the float32 candidate on the CPU costs no memory.
+    """
+    memo = {}
+    for tensor in itertools.chain(module.parameters(), module.buffers()):
+        if id(tensor) in memo:
+            continue
+        cast = tensor.detach().to(device, dtype) if tensor.is_floating_point() else tensor.detach().to(device)
+        if isinstance(tensor, torch.nn.Parameter):
+            cast = torch.nn.Parameter(cast, requires_grad=False)
+        memo[id(tensor)] = cast
+    return copy.deepcopy(module, memo)
+
+
+def _release(device: str):
+    gc.collect()
+    if device == "cuda":
+        torch.cuda.empty_cache()
+
+
+def _benchmark_dtype(module: torch.nn.Module, make_inputs: Callable[[int], Dict[str, torch.Tensor]],
+                     forward: Callable[[torch.nn.Module, Dict[str, torch.Tensor]], torch.Tensor],
+                     device: str, dtype_name: str, batch_sizes: Sequence[int],
+                     reference: Optional[torch.Tensor]) -> Optional[tuple]:
+    """
+    Measure one dtype at increasing batch sizes.
+
+    Returns:
+        Tuple of (float32 CPU output for the smallest batch, trials), or None if the dtype
+        cannot run or is not close enough to `reference`. The candidate module is dropped
+        on return.
+    """
+    dtype = getattr(torch, dtype_name)
+    started = time.perf_counter()
+    try:
+        candidate = _cast_copy(module, device, dtype).eval()
+        with torch.no_grad():
+            output = forward(candidate, _to(make_inputs(batch_sizes[0]), device, dtype)).float().cpu()
+    except (RuntimeError, TypeError) as e:
+        print(f"Skipping {dtype_name} on {device}: {e}")
+        return None
+    cosine = 1.0 if reference is None else float(
+        F.cosine_similarity(output.flatten(1), reference.flatten(1), dim=1).min()
+    )
+    if cosine < MIN_COSINE:
+        print(f"Skipping {dtype_name} on {device}: cosine similarity {cosine:.4f} to float32")
+        return None
+
+    trials = []
+    best_speed = 0.0
+    for batch_size in batch_sizes:
+        inputs = _to(make_inputs(batch_size), device, dtype)
+        try:
+            with torch.no_grad():
+                forward(candidate, inputs)  # Warm-up
+                _synchronize(device)
+                timings = []
+                for _ in range(TUNE_REPEATS):
+                    start = time.perf_counter()
+                    forward(candidate, inputs)
+                    _synchronize(device)
+                    timings.append(time.perf_counter() - start)
+        except RuntimeError as e:  # Typically out of memory
+            print(f"Stopping at batch size {batch_size} for {dtype_name}: {e}")
+            break
+        speed = batch_size / min(timings)
+        trials.append({"dtype": dtype_name, "batch_size": batch_size, "items_per_second": speed, "cosine": cosine})
+        if speed < best_speed * MIN_SPEEDUP or time.perf_counter() - started > TUNE_BUDGET_SECONDS:
+            break
+        best_speed = max(best_speed, speed)
+    return output, trials
+
+
+def autotune(module: torch.nn.Module, make_inputs: Callable[[int], Dict[str, torch.Tensor]],
+             forward: Callable[[torch.nn.Module, Dict[str, torch.Tensor]], torch.Tensor] = _call,
+             device: str = DEVICE, dtypes: Optional[Sequence[str]] = None,
+             batch_sizes: Sequence[int] = BATCH_SIZES) -> Dict[str, object]:
+    """
+    Micro-benchmark a model in each candidate dtype and batch size and pick the fastest acceptable one.
+
+    A dtype is acceptable when its outputs have a cosine similarity of at least
+    MIN_COSINE to the float32 outputs for the same inputs. Batch sizes are tried in
+    increasing order until throughput stops improving by MIN_SPEEDUP, a batch runs
+    out of memory, or the dtype has used up TUNE_BUDGET_SECONDS. Each candidate runs
+    on its own copy of the module, created directly in its dtype and released before
+    the next one, so at most one candidate exists next to the untouched float32 module.
+
+    Args:
+        module: Float32 model to benchmark, on the CPU
+        make_inputs: Function returning deterministic float32 CPU inputs for a batch size
+        forward: Function running the model on inputs and returning the output to compare
+        device: Device to benchmark on
+        dtypes: Names of the candidate torch dtypes; defaults to DTYPE_CANDIDATES of the device
+        batch_sizes: Candidate batch sizes
+
+    Returns:
+        Chosen {"dtype", "batch_size", "items_per_second", "cosine"}, plus every measurement under "trials"
+    """
+    dtypes = list(dtypes or DTYPE_CANDIDATES[device])
+    if "float32" not in dtypes:
+        dtypes.insert(0, "float32")
+    dtypes.sort(key=lambda name: name != "float32")  # The reference runs first
+    reference = None
+    trials: List[Dict[str, object]] = []
+
+    for dtype_name in dtypes:
+        try:
+            trial = _benchmark_dtype(module, make_inputs, forward, device, dtype_name, batch_sizes, reference)
+        finally:
+            _release(device)
+        if trial is None:
+            continue
+        output, dtype_trials = trial
+        if reference is None:
+            reference = output
+        trials += dtype_trials
+
+    if not trials:
+        raise RuntimeError(f"No dtype of {dtypes} could run on {device}")
+    best = max(trials, key=lambda trial: trial["items_per_second"])
+    return {**best, "trials": trials}
+
+
+class DeviceProfile:
+    def __init__(self, path: str = DEFAULT_PROFILE_PATH, enabled: bool = True):
+        """
+        Per-machine choice of dtype and batch size for each model, persisted as JSON.
+
+        The first time a model is loaded on a machine, `resolve` benchmarks it with
+        `autotune` and stores the result, so later runs start straight away with the
+        tuned configuration. Profiles measured on another device, CPU count or torch
+        version are ignored and re-tuned.
+
+        Args:
+            path: JSON file holding the profile
+            enabled: Whether missing models are tuned; when False they get the device defaults
+        """
+        self.path = path
+        self.enabled = enabled
+        self._models: Optional[Dict[str, dict]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, dict]:
+        if self._models is None:
+            self._models = {}
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                if data.get("version") == PROFILE_VERSION and data.get("machine") == machine_fingerprint():
+                    self._models = data.get("models", {})
+            except (OSError, ValueError):
+                pass
+        return self._models
+
+    def save(self):
+        """Write the profile to `path`, atomically."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = {"version": PROFILE_VERSION, "machine": machine_fingerprint(), "models": self._load()}
+        temp_path = f"{self.path}.{uuid.uuid4().hex}.part"
+        with open(temp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def get(self, name: str) -> Optional[Dict[str, object]]:
+        """The tuned configuration of a model, or None if it has not been tuned on this machine."""
+        with self._lock:
+            return self._load().get(name)
+
+    def dtype(self, name: str) -> torch.dtype:
+        """Tuned dtype of a model, or the default of the device."""
+        config = self.get(name)
+        return getattr(torch, config["dtype"] if config else DEFAULT_DTYPES[DEVICE])
+
+    def batch_size(self, name: str, default: int) -> int:
+        """Tuned batch size of a model, or `default`."""
+        config = self.get(name)
+        return int(config["batch_size"]) if config else default
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Configurations of every tuned model, e.g. to hand to worker processes."""
+        with self._lock:
+            return copy.deepcopy(self._load())
+
+    def use(self, models: Dict[str, dict]):
+        """Use these configurations from now on, without reading or writing `path`."""
+        with self._lock:
+            self._models = copy.deepcopy(models)
+
+    def forget(self, name: str):
+        """Drop a model from the profile, so it is tuned again the next time it is loaded."""
+        with self._lock:
+            if self._load().pop(name, None) is not None:
+                self.save()
+
+    def resolve(self, name: str, module: torch.nn.Module, make_inputs: Callable[[int], Dict[str, torch.Tensor]],
+                forward: Callable[[torch.nn.Module, Dict[str, torch.Tensor]], torch.Tensor] = _call) -> torch.dtype:
+        """
+        Tune a model if this machine has no profile for it yet, and return its dtype.
+
+        Args:
+            name: Name of the model in the profile (e.g. its Hugging Face id)
+            module: Float32 model to benchmark, on the CPU
+            make_inputs: Function returning deterministic float32 CPU inputs for a batch size
+            forward: Function running the model on inputs and returning the output to compare
+
+        Returns:
+            The dtype to load the model in
+        """
+        if self.enabled and self.get(name) is None:
+            print(f"Autotuning {name} on {DEVICE}...")
+            config = autotune(module, make_inputs, forward)
+            print(f"Using {config['dtype']} with batch size {config['batch_size']} for {name} "
+                  f"({config['items_per_second']:.1f} items/s)")
+            with self._lock:
+                self._load()[name] = config
+                self.save()
+        return self.dtype(name)
+
+
+# Shared by every model wrapper in this process
+device_profile = DeviceProfile(os.environ.get("PHOTODUMP_DEVICE_PROFILE", DEFAULT_PROFILE_PATH),
+                               enabled=os.environ.get("PHOTODUMP_AUTOTUNE", "1") == "1")
@@ -0,0 +1,81 @@
+from typing import Dict, Optional
+
+import numpy as np
+
+from utils.utils import list_images
+from .backends import DEFAULT_BACKEND
+from .blip_categorizer import BlipCategorizer, assign_categories
+from .photo_ranker import AestheticClipSelector, get_category_list, pre_filter_candidates
+
+MIN_CATEGORY_AGREEMENT = 0.95  # Share of photos that must get the same category as with the reference
+MIN_TOPK_OVERLAP = 0.8         # Mean share of each category's top-k that must match the reference
+
+
+def _top_k(scored_photos, k: int):
+    return [photo for photo, _ in sorted(scored_photos, key=lambda x: x[1], reverse=True)[:k]]
+
+
+def check_backend(album_path: str, categories_file: str, backend: str, artifacts_dir: Optional[str] = None,
+                  reference: str = DEFAULT_BACKEND, batch_size: Optional[int] = None, pre_filter: int = 100,
+                  keep_top_k: int = 3, aesthetic_weight: float = 0.6) -> Dict[str, object]:
+    """
+    Compare category assignments and rankings of a backend against a reference backend.
+
+    Both backends see the same photos, and ranking is compared on the candidates the
+    reference selects, so differences come from the encoders alone. No cache is used.
+
+    Args:
+        album_path: Folder of photos to compare on
+        categories_file: Path to text file containing numbered categories
+        backend: Backend to check, one of core.backends.BACKENDS
+        artifacts_dir: Directory of exported encoders, used by the optimized backends
+        reference: Backend taken as ground truth
+        batch_size: Number of photos to run through the models at once; None uses the tuned sizes
+        pre_filter: Number of photos to rank per category
+        keep_top_k: Size of the top-k rankings to compare
+        aesthetic_weight: Weight given to aesthetic score vs CLIP score
+
+    Returns:
+        Report with the category agreement, largest probability difference, top-1
+        agreement and mean top-k overlap (overall and per category), and whether the
+        backend passes MIN_CATEGORY_AGREEMENT and MIN_TOPK_OVERLAP
+    """
+    photos = list_images(album_path)
+    probabilities = {}
+    for name in (reference, backend):
+        categorizer = BlipCategorizer(categories_file, backend=name, artifacts_dir=artifacts_dir)
+        probabilities[name] = categorizer.predict_probabilities(photos, batch_size)
+    categories = categorizer.categories
+    same_category = probabilities[reference].argmax(axis=1) == probabilities[backend].argmax(axis=1)
+
+    reference_results = assign_categories(photos, probabilities[reference], categories)
+    candidates = pre_filter_candidates(get_category_list(reference_results), pre_filter)
+    scores = {
+        name: AestheticClipSelector(backend=name, artifacts_dir=artifacts_dir).score_photos(
+            candidates, batch_size=batch_size, aesthetic_weight=aesthetic_weight
+        )
+        for name in (reference, backend)
+    }
+
+    per_category = {}
+    for category in candidates:
+        expected = _top_k(scores[reference][category], keep_top_k)
+        found = _top_k(scores[backend][category], keep_top_k)
+        per_category[category] = {
+            "top1_match": expected[:1] == found[:1],
+            "topk_overlap": len(set(expected) & set(found)) / len(expected),
+        }
+
+    category_agreement = float(same_category.mean()) if photos else 1.0
+    topk_overlap = float(np.mean([c["topk_overlap"] for c in per_category.values()])) if per_category else 1.0
+    return {
+        "backend": backend,
+        "reference": reference,
+        "photos": len(photos),
+        "category_agreement": category_agreement,
+        "max_probability_diff": float(np.abs(probabilities[reference] - probabilities[backend]).max()) if photos else 0.0,
+        "top1_agreement": float(np.mean([c["top1_match"] for c in per_category.values()])) if per_category else 1.0,
+        "topk_overlap": topk_overlap,
+        "per_category": per_category,
+        "passed": category_agreement >= MIN_CATEGORY_AGREEMENT and topk_overlap >= MIN_TOPK_OVERLAP,
+    }
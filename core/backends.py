@@ -0,0 +1,204 @@
+import json
+import os
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import torch
+
+from utils.timing import stage_timer
+
+BACKENDS = ("torch", "int8", "onnx", "onnx-int8")
+DEFAULT_BACKEND = "torch"
+DEFAULT_ARTIFACTS_DIR = "artifacts"
+ONNX_OPSET = 17
+METADATA_FILE = "metadata.json"
+
+# Named encoder modules of a model (e.g. {"image": ..., "text": ...}) plus values the
+# wrappers need besides the encoders themselves (e.g. CLIP's logit scale)
+ModuleBuilder = Callable[[], Tuple[Dict[str, torch.nn.Module], Dict[str, object]]]
+
+
+def cache_model_id(model_id: str, backend: str) -> str:
+    """Id under which a backend's outputs are cached; optimized backends do not share entries with the reference."""
+    return model_id if backend == DEFAULT_BACKEND else f"{model_id}+{backend}"
+
+
+def artifacts_path(artifacts_dir: str, model_id: str, backend: str) -> str:
+    """Directory holding the exported encoders of one model for one backend."""
+    return os.path.join(artifacts_dir, model_id.replace("/", "--"), backend)
+
+
+class TorchEncoder:
+    def __init__(self, module: torch.nn.Module, device: str = "cpu", dtype: Optional[torch.dtype] = None):
+        """
+        Run a PyTorch encoder module.
+
+        Args:
+            module: Module whose forward takes the encoder inputs positionally
+            device: Device the module lives on
+            dtype: Floating-point inputs are cast to this dtype; None keeps them as they are
+        """
+        self.module = module
+        self.device = device
+        self.dtype = dtype
+
+    def __call__(self, *inputs: torch.Tensor) -> torch.Tensor:
+        """Encode a batch and return float32 outputs on the CPU."""
+        inputs = [
+            x.to(self.device, self.dtype) if self.dtype is not None and x.is_floating_point() else x.to(self.device)
+            for x in inputs
+        ]
+        with stage_timer.stage("forward"), torch.no_grad():
+            return self.module(*inputs).float().cpu()
+
+
+class OnnxEncoder:
+    def __init__(self, path: str):
+        """
+        Run an encoder exported to ONNX with ONNX Runtime on the CPU.
+
+        Args:
+            path: Path of the .onnx file
+        """
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("The onnx backends need onnxruntime: pip install -r requirements-onnx.txt") from e
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def __call__(self, *inputs: torch.Tensor) -> torch.Tensor:
+        """Encode a batch and return float32 outputs on the CPU."""
+        feeds = {name: x.detach().cpu().numpy() for name, x in zip(self.input_names, inputs)}
+        feeds = {name: x.astype(np.float32) if x.dtype.kind == "f" else x for name, x in feeds.items()}
+        with stage_timer.stage("forward"):
+            return torch.from_numpy(self.session.run(None, feeds)[0]).float()
+
+
+class EncoderSet:
+    def __init__(self, encoders: Dict[str, Callable[..., torch.Tensor]], processor, metadata: Dict[str, object],
+                 backend: str = DEFAULT_BACKEND):
+        """
+        The encoders of one model on one backend, with the processor preparing their inputs.
+
+        Args:
+            encoders: Callables by name (e.g. "image", "text") returning float32 CPU tensors
+            processor: Hugging Face processor of the model
+            metadata: Extra values needed next to the encoders (e.g. "logit_scale")
+            backend: Name of the backend, one of BACKENDS
+        """
+        self.encoders = encoders
+        self.processor = processor
+        self.metadata = metadata
+        self.backend = backend
+
+    def __getitem__(self, name: str) -> Callable[..., torch.Tensor]:
+        return self.encoders[name]
+
+
+def _quantize_int8(module: torch.nn.Module) -> torch.nn.Module:
+    """Dynamically quantize the Linear layers (where transformer encoders spend their time) to int8."""
+    return torch.ao.quantization.quantize_dynamic(module.float().cpu().eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_optimized_encoders(model_id: str, backend: str, build_modules: ModuleBuilder,
+                            load_processor: Callable[[str], object],
+                            artifacts_dir: Optional[str] = None) -> EncoderSet:
+    """
+    Load the encoders of a model on an optimized CPU backend.
+
+    Exported artifacts in `artifacts_dir` are used when present. Without them, "int8"
+    quantizes the reference modules on the fly; the onnx backends need an export first.
+
+    Args:
+        model_id: Hugging Face id of the model
+        backend: One of BACKENDS other than "torch"
+        build_modules: Function returning the float32 reference encoder modules and metadata
+        load_processor: Function loading the processor from a model id or local directory
+        artifacts_dir: Directory passed to export_encoders, or None
+
+    Returns:
+        The loaded encoders
+    """
+    if backend not in BACKENDS or backend == DEFAULT_BACKEND:
+        raise ValueError(f"Unknown optimized backend '{backend}', expected one of {BACKENDS[1:]}")
+    directory = artifacts_path(artifacts_dir, model_id, backend) if artifacts_dir else None
+    metadata_path = os.path.join(directory, METADATA_FILE) if directory else None
+
+    if metadata_path and os.path.exists(metadata_path):
+        with open(metadata_path, 'r') as f:
+            metadata = json.load(f)
+        encoders = {}
+        for name in metadata["encoders"]:
+            if backend == "int8":
+                module = torch.load(os.path.join(directory, f"{name}.pt"), weights_only=False)
+                encoders[name] = TorchEncoder(module.eval())
+            else:
+                encoders[name] = OnnxEncoder(os.path.join(directory, f"{name}.onnx"))
+        return EncoderSet(encoders, load_processor(directory), metadata, backend)
+
+    if backend != "int8":
+        raise FileNotFoundError(
+            f"No {backend} export of {model_id} in {directory or 'the artifacts directory'}; "
+            f"run `python optimize.py export --backend {backend}` first"
+        )
+    modules, metadata = build_modules()
+    encoders = {name: TorchEncoder(_quantize_int8(module)) for name, module in modules.items()}
+    return EncoderSet(encoders, load_processor(model_id), metadata, backend)
+
+
+def export_encoders(model_id: str, backend: str, build_modules: ModuleBuilder, processor,
+                    example_inputs: Dict[str, Dict[str, torch.Tensor]], artifacts_dir: str,
+                    dynamic_axes: Optional[Dict[str, Dict[str, Dict[int, str]]]] = None) -> str:
+    """
+    Export the encoders of a model for an optimized backend.
+
+    Args:
+        model_id: Hugging Face id of the model
+        backend: One of BACKENDS other than "torch"
+        build_modules: Function returning the float32 reference encoder modules and metadata
+        processor: Processor saved next to the encoders, so loading needs no download
+        example_inputs: Per encoder, its named example inputs in forward order
+        artifacts_dir: Root directory of exported artifacts
+        dynamic_axes: Per encoder, ONNX dynamic axes of its inputs; batch is always dynamic
+
+    Returns:
+        Directory the encoders were written to
+    """
+    if backend not in BACKENDS or backend == DEFAULT_BACKEND:
+        raise ValueError(f"Nothing to export for backend '{backend}', expected one of {BACKENDS[1:]}")
+    directory = artifacts_path(artifacts_dir, model_id, backend)
+    os.makedirs(directory, exist_ok=True)
+    modules, metadata = build_modules()
+
+    for name, module in modules.items():
+        module = module.float().cpu().eval()
+        if backend == "int8":
+            torch.save(_quantize_int8(module), os.path.join(directory, f"{name}.pt"))
+            continue
+
+        inputs = example_inputs[name]
+        axes = {input_name: {0: "batch"} for input_name in inputs}
+        for input_name, extra in (dynamic_axes or {}).get(name, {}).items():
+            axes[input_name] = {**axes[input_name], **extra}
+        onnx_path = os.path.join(directory, f"{name}.onnx")
+        with torch.no_grad():
+            torch.onnx.export(
+                module, tuple(inputs.values()), onnx_path,
+                input_names=list(inputs), output_names=["embeds"],
+                dynamic_axes={**axes, "embeds": {0: "batch"}},
+                opset_version=ONNX_OPSET
+            )
+        if backend == "onnx-int8":
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            float_path = onnx_path + ".float"
+            os.replace(onnx_path, float_path)
+            quantize_dynamic(float_path, onnx_path, weight_type=QuantType.QInt8)
+            os.remove(float_path)
+
+    processor.save_pretrained(directory)
+    with open(os.path.join(directory, METADATA_FILE), 'w') as f:
+        json.dump({**metadata, "model_id": model_id, "backend": backend, "encoders": list(modules)}, f, indent=2)
+    return directory
@@ -1,89 +1,322 @@
 import os
 import json
+import numpy as np
 import torch
+import torch.nn.functional as F
+from contextlib import contextmanager
 from PIL import Image
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from transformers import AutoProcessor, Blip2ForImageTextRetrieval
-from utils.utils import load_categories, save_results
+from utils.utils import load_categories, save_results, list_images
+from utils.image import processor_input_size
+from utils.prefetch import PrefetchLoader
+from utils.timing import stage_timer
+from .embedding_cache import EmbeddingCache
+from .model_pool import model_pool
+from .autotune import DEVICE, device_profile
+from .backends import (
+    DEFAULT_BACKEND, EncoderSet, TorchEncoder, cache_model_id, load_optimized_encoders, export_encoders
+)
+
+MODEL_ID = "Salesforce/blip2-itm-vit-g"
+PREPROCESS_VERSION = 2  # Bump when image preprocessing changes to invalidate cached embeddings
+DEFAULT_BATCH_SIZE = 4  # Used until the model has been autotuned on this machine
+
+def load_model():
+    """Load the BLIP-2 retrieval model and its processor, in the dtype tuned for this machine."""
+    model = Blip2ForImageTextRetrieval.from_pretrained(MODEL_ID, torch_dtype=torch.float32).eval()
+    processor = AutoProcessor.from_pretrained(MODEL_ID)
+    size = processor_input_size(processor.image_processor)
+    dtype = device_profile.resolve(
+        MODEL_ID, BlipImageEncoder(model),
+        lambda n: {"pixel_values": torch.randn(n, 3, size, size, generator=torch.Generator().manual_seed(0))}
+    )
+    return model.to(DEVICE, dtype).eval(), processor
+
+model_pool.register(MODEL_ID, load_model)
+
+class BlipImageEncoder(torch.nn.Module):
+    def __init__(self, model: Blip2ForImageTextRetrieval):
+        """Vision encoder, Q-Former and projection of BLIP-2, as one module that can be exported."""
+        super().__init__()
+        self.vision_model = model.vision_model
+        self.query_tokens = model.query_tokens
+        self.qformer = model.qformer
+        self.vision_projection = model.vision_projection
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """Return normalized query embeddings of shape (batch, num_query_tokens, embed_dim)."""
+        image_embeds = self.vision_model(pixel_values=pixel_values)[0]
+        image_attention_mask = torch.ones(image_embeds.size()[:-1], dtype=torch.long, device=image_embeds.device)
+        query_tokens = self.query_tokens.expand(image_embeds.shape[0], -1, -1)
+        query_outputs = self.qformer(
+            query_embeds=query_tokens,
+            encoder_hidden_states=image_embeds,
+            encoder_attention_mask=image_attention_mask
+        )
+        query_embeds = query_outputs[0].to(dtype=self.vision_projection.weight.dtype)
+        return F.normalize(self.vision_projection(query_embeds), dim=-1)
+
+class BlipTextEncoder(torch.nn.Module):
+    def __init__(self, model: Blip2ForImageTextRetrieval):
+        """Q-Former text encoder and projection of BLIP-2, as one module that can be exported."""
+        super().__init__()
+        self.embeddings = model.embeddings
+        self.qformer = model.qformer
+        self.text_projection = model.text_projection
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        """Return normalized text embeddings of shape (batch, embed_dim)."""
+        query_embeds = self.embeddings(input_ids=input_ids)
+        text_outputs = self.qformer(
+            query_embeds=query_embeds,
+            query_length=0,
+            attention_mask=attention_mask
+        )
+        text_embeds = text_outputs[0].to(dtype=self.text_projection.weight.dtype)
+        return F.normalize(self.text_projection(text_embeds[:, 0, :]), dim=-1)
+
+def _reference_modules():
+    """Float32 CPU encoders, the starting point for quantization and export."""
+    model = Blip2ForImageTextRetrieval.from_pretrained(MODEL_ID, torch_dtype=torch.float32).eval()
+    return {"image": BlipImageEncoder(model), "text": BlipTextEncoder(model)}, {}
+
+def _pool_entry(backend: str, artifacts_dir: Optional[str]) -> Tuple[str, Optional[Callable[[], Any]]]:
+    """Name and loader of the BLIP-2 encoders on a backend in the shared model pool."""
+    if backend == DEFAULT_BACKEND:
+        return MODEL_ID, None
+    return f"{MODEL_ID}#{backend}", lambda: load_optimized_encoders(
+        MODEL_ID, backend, _reference_modules, AutoProcessor.from_pretrained, artifacts_dir
+    )
+
+def _encoder_set(pooled: Any, backend: str) -> EncoderSet:
+    if backend == DEFAULT_BACKEND:
+        model, processor = pooled
+        return EncoderSet({
+            "image": TorchEncoder(BlipImageEncoder(model), DEVICE, model.dtype),
+            "text": TorchEncoder(BlipTextEncoder(model), DEVICE),
+        }, processor, {})
+    return pooled
+
+def get_encoders(backend: str = DEFAULT_BACKEND, artifacts_dir: Optional[str] = None) -> EncoderSet:
+    """
+    Get the BLIP-2 encoders on a backend from the shared model pool, loading them on first use.
+
+    Args:
+        backend: One of core.backends.BACKENDS
+        artifacts_dir: Directory of exported encoders, used by the optimized backends
+    """
+    return _encoder_set(model_pool.get(*_pool_entry(backend, artifacts_dir)), backend)
+
+@contextmanager
+def checkout_encoders(backend: str = DEFAULT_BACKEND, artifacts_dir: Optional[str] = None) -> Iterator[EncoderSet]:
+    """Like get_encoders, but the model pool does not evict the model until the block exits."""
+    with model_pool.checkout(*_pool_entry(backend, artifacts_dir)) as pooled:
+        yield _encoder_set(pooled, backend)
+
+def export(backend: str, artifacts_dir: str) -> str:
+    """Export the BLIP-2 encoders for an optimized backend and return the directory they were written to."""
+    processor = AutoProcessor.from_pretrained(MODEL_ID)
+    size = processor_input_size(processor.image_processor)
+    pixel_values = processor(images=[Image.new("RGB", (size, size))] * 2, return_tensors="pt")["pixel_values"]
+    text = processor(text=["A photo of a dog", "A photo of friends at the beach"], return_tensors="pt", padding=True)
+    return export_encoders(
+        MODEL_ID, backend, _reference_modules, processor,
+        example_inputs={
+            "image": {"pixel_values": pixel_values},
+            "text": {"input_ids": text["input_ids"], "attention_mask": text["attention_mask"]},
+        },
+        artifacts_dir=artifacts_dir,
+        dynamic_axes={"text": {"input_ids": {1: "sequence"}, "attention_mask": {1: "sequence"}}}
+    )
 
 class BlipCategorizer:
-    def __init__(self, categories_file: str):
+    def __init__(self, categories_file: str, cache: Optional[EmbeddingCache] = None,
+                 backend: str = DEFAULT_BACKEND, artifacts_dir: Optional[str] = None):
         """
         Initialize the BlipCategorizer with categories from a file.
-        
+
         Args:
             categories_file: Path to text file containing numbered categories
+            cache: Optional embedding cache used to skip the vision encoder for photos seen before
+            backend: Inference backend of the encoders, one of core.backends.BACKENDS
+            artifacts_dir: Directory of exported encoders, used by the optimized backends
         """
         self.categories = load_categories(categories_file)
-        self.device = "cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu"
-        self.model = Blip2ForImageTextRetrieval.from_pretrained(
-            "Salesforce/blip2-itm-vit-g", 
-            torch_dtype=torch.float16
-        )
-        self.processor = AutoProcessor.from_pretrained("Salesforce/blip2-itm-vit-g")
-        self.model.to(self.device)
+        self.cache = cache
+        self.backend = backend
+        self.artifacts_dir = artifacts_dir
+        self.cache_id = cache_model_id(MODEL_ID, backend)
+        # Shared across categorizers; only the first one in the process pays the load
+        self.encoders = get_encoders(backend, artifacts_dir)
+        self.processor = self.encoders.processor
+        self._category_feats = None
+
+    def _encode_images(self, images: List[Image.Image]) -> torch.Tensor:
+        """
+        Run the vision encoder and Q-Former on a batch of images.
+
+        Returns:
+            Normalized float32 query embeddings on the CPU, of shape (batch, num_query_tokens, embed_dim)
+        """
+        with stage_timer.stage("preprocess"):
+            inputs = self.processor(images=images, return_tensors="pt")
+        return self.encoders["image"](inputs["pixel_values"])
+
+    def _encode_texts(self, texts: List[str]) -> torch.Tensor:
+        """
+        Run the Q-Former text encoder on a list of prompts.
+
+        Returns:
+            Normalized float32 text embeddings on the CPU, of shape (num_texts, embed_dim)
+        """
+        inputs = self.processor(text=texts, return_tensors="pt", padding=True)
+        return self.encoders["text"](inputs["input_ids"], inputs["attention_mask"])
+
+    def _get_image_features(self, paths: List[str], batch_size: Optional[int] = None,
+                            progress: Optional[Callable[[int, int], None]] = None) -> torch.Tensor:
+        """
+        Get Q-Former image features for photos, reading from the cache where possible.
+
+        Photos missing from the cache are decoded and downscaled on worker threads ahead
+        of the vision encoder, then encoded in batches of `batch_size`.
+
+        Returns:
+            Normalized float32 image features on the CPU, of shape (len(paths), num_query_tokens, embed_dim)
+        """
+        batch_size = batch_size or device_profile.batch_size(MODEL_ID, DEFAULT_BATCH_SIZE)
+        cached = self.cache.get_many(paths, self.cache_id, PREPROCESS_VERSION, "image_feats") if self.cache else {}
+        missing = [path for path in paths if path not in cached]
+        done = len(paths) - len(missing)
+        if progress:
+            progress(done, len(paths))
+
+        loader = PrefetchLoader(missing, batch_size, min_side=processor_input_size(self.processor.image_processor))
+        for batch_paths, images in loader:
+            features = self._encode_images(images).numpy()
+            computed = dict(zip(batch_paths, features))
+            if self.cache:
+                self.cache.put_many(computed, self.cache_id, PREPROCESS_VERSION, "image_feats")
+            cached.update(computed)
+            done += len(batch_paths)
+            if progress:
+                progress(done, len(paths))
+
+        return torch.from_numpy(np.stack([cached[path] for path in paths]))
+
+    def get_category_features(self) -> torch.Tensor:
+        """
+        Encode the category prompts, once per categorizer.
+
+        Returns:
+            Normalized float32 text features on the CPU, of shape (num_categories, embed_dim)
+        """
+        if self._category_feats is None:
+            texts = [f"A photo of {c}" for c in self.categories.values()]
+            self._category_feats = self._encode_texts(texts)
+        return self._category_feats
 
+    @staticmethod
+    def similarity(image_feats: torch.Tensor, text_feats: torch.Tensor) -> torch.Tensor:
+        """
+        Compute photos x categories logits as a single matrix product.
+
+        Each photo is scored by the cosine similarity of its best matching query token.
 
-    def categorize_album(self, album_path: str, batch_size: int = 4, output_file: Optional[str] = None) -> Dict[str, dict]:
+        Args:
+            image_feats: Normalized image features of shape (num_photos, num_query_tokens, embed_dim)
+            text_feats: Normalized text features of shape (num_categories, embed_dim)
+
+        Returns:
+            Logits of shape (num_photos, num_categories)
+        """
+        num_photos, num_queries, embed_dim = image_feats.shape
+        logits = image_feats.reshape(-1, embed_dim) @ text_feats.t()
+        return logits.reshape(num_photos, num_queries, -1).max(dim=1).values
+
+    def categorize_album(self, album_path: str, batch_size: Optional[int] = None, output_file: Optional[str] = None,
+                         progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, dict]:
         """
         Categorize all photos in an album using BLIP-2 model.
-        
+
         Args:
             album_path: Path to folder containing photos
-            batch_size: Number of images to process in each batch
+            batch_size: Number of images to process in each batch; None uses the size tuned for this machine
             output_file: Optional path to save results as JSON
-            
+            progress: Optional function called with (images done, total images) after each batch
+
         Returns:
             Dictionary mapping photo paths to their category details
         """
-        results = {}
-        image_paths = []
-
-        # Collect valid image paths
-        for filename in os.listdir(album_path):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                image_path = os.path.join(album_path, filename)
-                image_paths.append(image_path)
-
-        # Process images in batches
-        for i in range(0, len(image_paths), batch_size):
-            batch_paths = image_paths[i:i + batch_size]
-            batch_images = [Image.open(path) for path in batch_paths]
-            
-            # Prepare text prompts
-            texts = [f"A photo of {c}" for c in self.categories.values()]
-            
-            # Get model predictions
-            inputs = self.processor(
-                images=batch_images,
-                text=texts,
-                return_tensors="pt",
-                padding=True
-            ).to(self.device, torch.float16)
-
-            with torch.no_grad():
-                outputs = self.model(
-                    **inputs,
-                    use_image_text_matching_head=False
-                )
-                # Get similarity scores and probabilities
-                logits = outputs.logits_per_image
-                probs = logits.softmax(dim=1)
-                
-                # Get best matching categories and probabilities for batch
-                category_indices = probs.argmax(dim=1)
-                best_probs = probs.max(dim=1).values
-                
-                # Store results
-                for path, category_idx, prob in zip(batch_paths, category_indices, best_probs):
-                    category_num = category_idx.item()
-                    results[path] = {
-                        "categoryName": self.categories[category_num],
-                        "categoryNumber": int(category_num),
-                        "probability": float(prob)
-                    }
+        return self.categorize_photos(list_images(album_path), batch_size, output_file, progress)
+
+    def predict_probabilities(self, image_paths: List[str], batch_size: Optional[int] = None,
+                              progress: Optional[Callable[[int, int], None]] = None) -> np.ndarray:
+        """
+        Compute each photo's probability distribution over the categories.
+
+        Args:
+            image_paths: Paths of the photos to score
+            batch_size: Number of images to process in each batch; None uses the size tuned for this machine
+            progress: Optional function called with (images done, total images) after each batch
+
+        Returns:
+            Array of shape (len(image_paths), num_categories), rows summing to one
+        """
+        if not image_paths:
+            return np.zeros((0, len(self.categories)), dtype=np.float32)
+        # Keep the model checked out for the whole album, however long it takes
+        with checkout_encoders(self.backend, self.artifacts_dir) as self.encoders:
+            # Run only the vision side per batch; the category prompts are encoded once
+            text_feats = self.get_category_features()
+            image_feats = self._get_image_features(image_paths, batch_size, progress)
+        return self.similarity(image_feats, text_feats).softmax(dim=1).numpy()
+
+    def categorize_photos(self, image_paths: List[str], batch_size: Optional[int] = None, output_file: Optional[str] = None,
+                          progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, dict]:
+        """
+        Categorize the given photos using BLIP-2 model.
+
+        Args:
+            image_paths: Paths of the photos to categorize
+            batch_size: Number of images to process in each batch; None uses the size tuned for this machine
+            output_file: Optional path to save results as JSON
+            progress: Optional function called with (images done, total images) after each batch
+
+        Returns:
+            Dictionary mapping photo paths to their category details
+        """
+        probs = self.predict_probabilities(image_paths, batch_size, progress)
+        results = assign_categories(image_paths, probs, self.categories)
 
         if output_file:
             save_results(results, output_file)
-                
+
+        return results
+
+
+def assign_categories(image_paths: List[str], probs: np.ndarray, categories: Dict[int, str]) -> Dict[str, dict]:
+    """
+    Pick the most likely category of each photo.
+
+    Args:
+        image_paths: Paths of the photos, in the row order of `probs`
+        probs: Category probabilities of shape (len(image_paths), num_categories)
+        categories: Category names by index, as returned by load_categories
+
+    Returns:
+        Dictionary mapping photo paths to their category details
+    """
+    results = {}
+    if not image_paths:
         return results
+    probs = np.asarray(probs)
+    category_indices = probs.argmax(axis=1)
+    best_probs = probs[np.arange(len(image_paths)), category_indices]
+    for path, category_idx, prob in zip(image_paths, category_indices.tolist(), best_probs.tolist()):
+        results[path] = {
+            "categoryName": categories[category_idx],
+            "categoryNumber": int(category_idx),
+            "probability": float(prob)
+        }
+    return results
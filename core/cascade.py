@@ -0,0 +1,107 @@
+from typing import Dict, List
+
+import numpy as np
+
+CASCADE_REPORT_FILE = "cascade_report.json"
+
+
+def _standardize(values: np.ndarray) -> np.ndarray:
+    """Zero mean, unit variance; constant values all become 0."""
+    std = values.std()
+    return (values - values.mean()) / std if std > 0 else np.zeros_like(values)
+
+
+def screen_scores(quality: Dict[str, float], relevance: Dict[str, float],
+                  aesthetic_weight: float) -> Dict[str, float]:
+    """
+    Combine the screening model's two signals for the photos of one category.
+
+    The quality margin and the CLIP score live on different scales, so each is
+    standardized over the category before the same convex combination as the full
+    scorer is applied. Only the order within the category matters.
+
+    Args:
+        quality: Photo path -> quality margin, for at least the photos in `relevance`
+        relevance: Photo path -> CLIP score against the category
+        aesthetic_weight: Weight given to quality vs relevance
+
+    Returns:
+        Photo path -> screening score
+    """
+    photos = list(relevance)
+    if not photos:
+        return {}
+    combined = (
+        aesthetic_weight * _standardize(np.array([quality[photo] for photo in photos], dtype=np.float64))
+        + (1 - aesthetic_weight) * _standardize(np.array([relevance[photo] for photo in photos], dtype=np.float64))
+    )
+    return dict(zip(photos, combined.tolist()))
+
+
+def screen_candidates(candidates: Dict[str, List[str]], scores: Dict[str, Dict[str, float]],
+                      keep: int) -> Dict[str, List[str]]:
+    """
+    Keep the `keep` best screened photos of each category for the full scorer.
+
+    Args:
+        candidates: Dictionary mapping categories to candidate photos
+        scores: Dictionary mapping categories to photo path -> screening score; categories
+            with at most `keep` candidates need no scores
+        keep: Number of photos to keep per category, or 0 to keep all
+
+    Returns:
+        Dictionary mapping categories to the kept photos, in their original order
+    """
+    screened = {}
+    for category, photos in candidates.items():
+        if not keep or len(photos) <= keep:
+            screened[category] = list(photos)
+            continue
+        category_scores = scores[category]
+        kept = set(sorted(photos, key=lambda photo: category_scores[photo], reverse=True)[:keep])
+        screened[category] = [photo for photo in photos if photo in kept]
+    return screened
+
+
+def _top_k(scored_photos: List[tuple], keep_top_k: int) -> List[str]:
+    return [photo for photo, _ in sorted(scored_photos, key=lambda x: x[1], reverse=True)[:keep_top_k]]
+
+
+def cascade_recall(full_scores: Dict[str, List[tuple]], screened: Dict[str, List[str]],
+                   keep_top_k: int) -> Dict[str, object]:
+    """
+    Compare the photos the cascade keeps with those the full scorer alone would keep.
+
+    Args:
+        full_scores: Dictionary mapping categories to (photo path, score) tuples of the
+            full scorer for every candidate, before screening
+        screened: Dictionary mapping categories to the photos that passed screening
+        keep_top_k: Number of top photos kept per category
+
+    Returns:
+        {"recall": fraction of the full scorer's top photos the cascade also kept,
+        "scored_fraction": fraction of candidates the full scorer had to score,
+        "categories": {category: {"candidates", "screened", "recall", "missed"}}}
+    """
+    categories = {}
+    hits = expected = num_candidates = num_screened = 0
+    for category, scored_photos in full_scores.items():
+        passed = set(screened.get(category, []))
+        reference = _top_k(scored_photos, keep_top_k)
+        cascade = set(_top_k([(photo, score) for photo, score in scored_photos if photo in passed], keep_top_k))
+        missed = [photo for photo in reference if photo not in cascade]
+        categories[category] = {
+            "candidates": len(scored_photos),
+            "screened": len(passed),
+            "recall": 1 - len(missed) / len(reference) if reference else 1.0,
+            "missed": missed,
+        }
+        hits += len(reference) - len(missed)
+        expected += len(reference)
+        num_candidates += len(scored_photos)
+        num_screened += len(passed)
+    return {
+        "recall": hits / expected if expected else 1.0,
+        "scored_fraction": num_screened / num_candidates if num_candidates else 1.0,
+        "categories": categories,
+    }
@@ -0,0 +1,135 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from utils.hashing import file_sha256
+from utils.prefetch import DEFAULT_DECODE_WORKERS
+from .embedding_cache import EmbeddingCache
+
+DHASH_ID = "dhash"
+DHASH_VERSION = 1
+DEFAULT_MAX_DISTANCE = 6  # Hamming distance (out of 64 bits) below which photos count as near-duplicates
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def dhash(path: str, hash_size: int = 8) -> int:
+    """
+    Compute the difference hash of an image.
+
+    The image is decoded at a reduced size (JPEG draft mode), shrunk to
+    (hash_size + 1) x hash_size grayscale pixels, and each bit records whether a pixel
+    is brighter than its right-hand neighbour.
+
+    Args:
+        path: Path to the image file
+        hash_size: Number of rows and comparisons per row; the hash has hash_size**2 bits
+
+    Returns:
+        The hash as an integer
+    """
+    with Image.open(path) as img:
+        img.draft('L', (hash_size * 8, hash_size * 8))
+        small = img.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(sum(1 << i for i, bit in enumerate(bits) if bit))
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i != root_j:
+            self.parent[max(root_i, root_j)] = min(root_i, root_j)
+
+
+def _near_duplicate_pairs(hashes: np.ndarray, max_distance: int, chunk_size: int = 256):
+    """Yield index pairs (i, j), i < j, whose 64-bit hashes differ in at most `max_distance` bits."""
+    as_bytes = hashes.view(np.uint8).reshape(-1, 8)
+    for start in range(0, len(hashes), chunk_size):
+        chunk = as_bytes[start:start + chunk_size]
+        distances = _POPCOUNT[chunk[:, None, :] ^ as_bytes[None, :, :]].sum(axis=2, dtype=np.int32)
+        rows, cols = np.nonzero(distances <= max_distance)
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            if start + row < col:
+                yield start + row, col
+
+
+def find_duplicate_groups(paths: List[str], cache: Optional[EmbeddingCache] = None,
+                          max_distance: int = DEFAULT_MAX_DISTANCE,
+                          num_workers: int = DEFAULT_DECODE_WORKERS,
+                          progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, List[str]]:
+    """
+    Group photos that are byte-identical or look nearly the same (burst shots, retakes).
+
+    Exact duplicates are found by SHA-256, near-duplicates by comparing difference hashes
+    of the remaining photos. Groups are transitive: if A is close to B and B to C, all
+    three end up together. The representative of a group is its largest file, which for
+    JPEGs of the same scene usually means the sharpest, most detailed frame.
+
+    Args:
+        paths: Photos to group
+        cache: Optional embedding cache, used to memoize content and difference hashes
+        max_distance: Maximum Hamming distance between difference hashes of near-duplicates
+        num_workers: Number of threads used for hashing
+        progress: Optional function called with (photos hashed, total photos)
+
+    Returns:
+        Dictionary mapping each representative to the photos of its group (itself included);
+        photos without duplicates form a group of one
+    """
+    if not paths:
+        return {}
+    content_hash = cache.content_hash if cache else file_sha256
+    with ThreadPoolExecutor(max_workers=max(1, num_workers), thread_name_prefix="dedupe") as pool:
+        digests = list(pool.map(content_hash, paths))
+
+        # One difference hash per distinct file content
+        unique = list(dict.fromkeys(digests))
+        first_path = {}
+        for path, digest in zip(paths, digests):
+            first_path.setdefault(digest, path)
+        unique_paths = [first_path[digest] for digest in unique]
+
+        cached = cache.get_many(unique_paths, DHASH_ID, DHASH_VERSION, "dhash") if cache else {}
+        missing = [path for path in unique_paths if path not in cached]
+        if progress:
+            progress(len(paths) - len(missing), len(paths))
+        computed = {}
+        for i, value in enumerate(pool.map(dhash, missing), 1):
+            computed[missing[i - 1]] = value
+            if progress:
+                progress(len(paths) - len(missing) + i, len(paths))
+    if cache and computed:
+        cache.put_many({path: np.array([value], dtype=np.uint64) for path, value in computed.items()},
+                       DHASH_ID, DHASH_VERSION, "dhash")
+
+    hashes = np.array(
+        [int(cached[path][0]) if path in cached else computed[path] for path in unique_paths],
+        dtype=np.uint64
+    )
+    groups = _UnionFind(len(unique))
+    for i, j in _near_duplicate_pairs(hashes, max_distance):
+        groups.union(i, j)
+
+    index_of = {digest: i for i, digest in enumerate(unique)}
+    members: Dict[int, List[str]] = {}
+    for path, digest in zip(paths, digests):
+        members.setdefault(groups.find(index_of[digest]), []).append(path)
+
+    result = {}
+    for group in members.values():
+        representative = max(group, key=lambda path: (os.path.getsize(path), path))
+        result[representative] = group
+    return result
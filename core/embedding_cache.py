@@ -0,0 +1,425 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.hashing import file_sha256
+
+DEFAULT_CACHE_DIR = "cache"
+DEFAULT_MAX_SIZE_MB = 2048
+DEFAULT_MEMORY_SIZE_MB = 1024
+_SQLITE_MAX_PARAMS = 500  # Stay well below SQLite's bound-parameter limit
+_ACCESS_FLUSH_SIZE = 4096  # Pending last-access updates written in one transaction
+# How long a write waits for another process (e.g. a shard worker) to release the database
+_BUSY_TIMEOUT_SECONDS = 120.0
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_size_mb: float = DEFAULT_MAX_SIZE_MB):
+        """
+        Initialize an on-disk, content-addressed cache for per-photo model outputs.
+
+        Entries are keyed by the SHA-256 of the photo bytes together with the model id,
+        the preprocessing version and the kind of value stored, so renaming or
+        re-uploading a photo still hits the cache while changing the model does not.
+        Once the cache grows past `max_size_mb`, least recently used entries are evicted.
+        Lookups are read-only: access times are kept in memory and written in batches
+        with the next store, so reading the cache never takes the database write lock.
+
+        Args:
+            cache_dir: Directory holding the cache database
+            max_size_mb: Maximum total size of stored values in megabytes
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.db_path = os.path.join(cache_dir, "embeddings.sqlite")
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, timeout=_BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                dtype TEXT NOT NULL,
+                shape TEXT NOT NULL,
+                data BLOB NOT NULL,
+                nbytes INTEGER NOT NULL,
+                last_access INTEGER NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_access)")
+        # Remember file hashes by (path, size, mtime) so unchanged photos are not re-read
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL
+            )"""
+        )
+        self._conn.commit()
+        self._size_bytes = self._total_bytes()
+        # Logical clock for LRU ordering; wall-clock time is too coarse for back-to-back accesses
+        self._clock = self._conn.execute("SELECT COALESCE(MAX(last_access), 0) FROM entries").fetchone()[0]
+        self._accessed: Dict[str, int] = {}  # Key -> clock of its last lookup, not yet written
+
+    def content_hash(self, path: str) -> str:
+        """Return the SHA-256 of a file, reusing the stored digest if the file is unchanged."""
+        return self.content_hashes([path])[path]
+
+    def content_hashes(self, paths: List[str]) -> Dict[str, str]:
+        """
+        Return the SHA-256 of several files, reading each stored digest once and
+        saving the digests of new or changed files in a single transaction.
+        """
+        absolute = {path: os.path.abspath(path) for path in paths}
+        stats = {path: os.stat(absolute[path]) for path in paths}
+        stored = {}
+        with self._lock:
+            unique_paths = list(set(absolute.values()))
+            for i in range(0, len(unique_paths), _SQLITE_MAX_PARAMS):
+                chunk = unique_paths[i:i + _SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(chunk))
+                for row in self._conn.execute(
+                    f"SELECT path, size, mtime_ns, sha256 FROM files WHERE path IN ({placeholders})", chunk
+                ):
+                    stored[row[0]] = row[1:]
+
+        digests, computed = {}, {}
+        for path in paths:
+            stat, row = stats[path], stored.get(absolute[path])
+            if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+                digests[path] = row[2]
+            elif absolute[path] in computed:
+                digests[path] = computed[absolute[path]][0]
+            else:
+                digests[path] = file_sha256(path)
+                computed[absolute[path]] = (digests[path], stat.st_size, stat.st_mtime_ns)
+        if computed:
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                    [(path, size, mtime_ns, digest) for path, (digest, size, mtime_ns) in computed.items()]
+                )
+                self._conn.commit()
+        return digests
+
+    def remember_hash(self, path: str, digest: str, size: int, mtime_ns: int):
+        """Record a digest that was computed elsewhere (e.g. while a file was uploaded)."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                (os.path.abspath(path), size, mtime_ns, digest)
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def _key(digest: str, model_id: str, version: int, kind: str) -> str:
+        return f"{digest}:{model_id}:{version}:{kind}"
+
+    def get_many(self, paths: List[str], model_id: str, version: int, kind: str) -> Dict[str, np.ndarray]:
+        """
+        Look up cached values for several photos at once.
+
+        Args:
+            paths: Photo paths to look up
+            model_id: Identifier of the model that produced the values
+            version: Preprocessing version of the producing code
+            kind: Name of the stored value (e.g. "image_embeds")
+
+        Returns:
+            Dictionary mapping each photo path with a cached value to that value
+        """
+        keys = {path: self._key(digest, model_id, version, kind) for path, digest in self.content_hashes(paths).items()}
+        found = {}
+        with self._lock:
+            self._clock += 1
+            unique_keys = list(set(keys.values()))
+            for i in range(0, len(unique_keys), _SQLITE_MAX_PARAMS):
+                chunk = unique_keys[i:i + _SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, dtype, shape, data FROM entries WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, dtype, shape, data in rows:
+                    shape = tuple(int(dim) for dim in shape.split(",") if dim)
+                    found[key] = np.frombuffer(data, dtype=dtype).reshape(shape)
+                    self._accessed[key] = self._clock
+            if len(self._accessed) >= _ACCESS_FLUSH_SIZE:
+                self._flush_accesses()
+                self._conn.commit()
+
+            results = {path: found[key] for path, key in keys.items() if key in found}
+            self.hits += len(results)
+            self.misses += len(paths) - len(results)
+        return results
+
+    def get(self, path: str, model_id: str, version: int, kind: str) -> Optional[np.ndarray]:
+        """Look up the cached value for a single photo, or None on a miss."""
+        return self.get_many([path], model_id, version, kind).get(path)
+
+    def put_many(self, values: Dict[str, np.ndarray], model_id: str, version: int, kind: str):
+        """
+        Store values for several photos and evict old entries if the cache is over its size limit.
+
+        Args:
+            values: Dictionary mapping photo paths to the arrays to store
+            model_id: Identifier of the model that produced the values
+            version: Preprocessing version of the producing code
+            kind: Name of the stored value (e.g. "image_embeds")
+        """
+        rows = []
+        digests = self.content_hashes(list(values))
+        for path, value in values.items():
+            value = np.ascontiguousarray(value)
+            key = self._key(digests[path], model_id, version, kind)
+            shape = ",".join(str(dim) for dim in value.shape)
+            rows.append([key, value.dtype.str, shape, value.tobytes(), value.nbytes])
+
+        with self._lock:
+            self._clock += 1
+            for row in rows:
+                row.append(self._clock)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, dtype, shape, data, nbytes, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", row
+                )
+                self._accessed.pop(row[0], None)
+            self._flush_accesses()
+            # Other processes (e.g. shard workers) write to the same database, so the size is
+            # re-read while this transaction holds the write lock rather than tracked locally
+            self._size_bytes = self._total_bytes()
+            self._evict()
+            self._conn.commit()
+
+    def put(self, path: str, model_id: str, version: int, kind: str, value: np.ndarray):
+        """Store the value for a single photo."""
+        self.put_many({path: value}, model_id, version, kind)
+
+    def _total_bytes(self) -> int:
+        """Total size of the stored values, including those written by other processes."""
+        return self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM entries").fetchone()[0]
+
+    def _flush_accesses(self):
+        """Write pending last-access times in one batch. Caller holds the lock and commits."""
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE entries SET last_access = ? WHERE key = ?",
+                [(clock, key) for key, clock in self._accessed.items()]
+            )
+            self._accessed.clear()
+
+    def _evict(self):
+        """
+        Drop least recently used entries until the cache fits its size limit, along with
+        the file digests no entry refers to anymore. Caller holds the lock.
+        """
+        evicted = False
+        while self._size_bytes > self.max_size_bytes:
+            rows = self._conn.execute(
+                "SELECT key, nbytes FROM entries ORDER BY last_access ASC LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._size_bytes = 0
+                break
+            for key, nbytes in rows:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._size_bytes -= nbytes
+                self.evictions += 1
+                evicted = True
+                if self._size_bytes <= self.max_size_bytes:
+                    break
+        if evicted:
+            # Keys start with "<sha256>:", and ";" sorts right after ":", so this is a range scan of the key index
+            self._conn.execute(
+                "DELETE FROM files WHERE NOT EXISTS ("
+                "SELECT 1 FROM entries WHERE key > files.sha256 || ':' AND key < files.sha256 || ';')"
+            )
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and the current cache size."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            self._size_bytes = self._total_bytes()
+            hits, misses, evictions, size_bytes = self.hits, self.misses, self.evictions, self._size_bytes
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "evictions": evictions,
+            "entries": entries,
+            "size_mb": size_bytes / (1024 * 1024),
+        }
+
+    def clear(self):
+        """Remove every cached value and file digest."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM files")
+            self._conn.commit()
+            self._size_bytes = 0
+            self._accessed.clear()
+
+    def close(self):
+        """Write pending access times and close the underlying database connection."""
+        with self._lock:
+            self._flush_accesses()
+            self._conn.commit()
+            self._conn.close()
+
+
+class MemoryEmbeddingCache:
+    def __init__(self, backing: Optional[EmbeddingCache] = None, max_size_mb: float = DEFAULT_MEMORY_SIZE_MB):
+        """
+        Keep recently used per-photo model outputs in memory, in front of an on-disk cache.
+
+        It has the same interface as EmbeddingCache, so the categorizer and the ranker
+        can use either. A long-running process that keeps one instance around serves
+        repeat runs over the same album (e.g. after only the category list changed)
+        without touching the database: file digests are memoized by (size, mtime) and
+        values by content hash. Misses fall through to `backing`, and new values are
+        written to both.
+
+        Args:
+            backing: Optional on-disk cache to read misses from and persist values to
+            max_size_mb: Maximum total size of values held in memory in megabytes
+        """
+        self.backing = backing
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()  # Least recently used first
+        self._size_bytes = 0
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}  # Path -> (size, mtime_ns, sha256)
+
+    def content_hash(self, path: str) -> str:
+        """Return the SHA-256 of a file, reusing the digest if the file is unchanged."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            known = self._hashes.get(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+
+        digest = self.backing.content_hash(path) if self.backing else file_sha256(path)
+        with self._lock:
+            self._hashes[path] = (stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+    def remember_hash(self, path: str, digest: str, size: int, mtime_ns: int):
+        """Record a digest that was computed elsewhere (e.g. while a file was uploaded)."""
+        with self._lock:
+            self._hashes[os.path.abspath(path)] = (size, mtime_ns, digest)
+        if self.backing:
+            self.backing.remember_hash(path, digest, size, mtime_ns)
+
+    def get_many(self, paths: List[str], model_id: str, version: int, kind: str) -> Dict[str, np.ndarray]:
+        """
+        Look up values for several photos, in memory first and then in the backing cache.
+
+        Args:
+            paths: Photo paths to look up
+            model_id: Identifier of the model that produced the values
+            version: Preprocessing version of the producing code
+            kind: Name of the stored value (e.g. "image_embeds")
+
+        Returns:
+            Dictionary mapping each photo path with a cached value to that value
+        """
+        keys = {path: EmbeddingCache._key(self.content_hash(path), model_id, version, kind) for path in paths}
+        results = {}
+        with self._lock:
+            for path, key in keys.items():
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                    results[path] = value
+
+        missing = [path for path in paths if path not in results]
+        if missing and self.backing:
+            loaded = self.backing.get_many(missing, model_id, version, kind)
+            self._store({keys[path]: value for path, value in loaded.items()})
+            results.update(loaded)
+        with self._lock:
+            self.hits += len(results)
+            self.misses += len(paths) - len(results)
+        return results
+
+    def get(self, path: str, model_id: str, version: int, kind: str) -> Optional[np.ndarray]:
+        """Look up the value for a single photo, or None on a miss."""
+        return self.get_many([path], model_id, version, kind).get(path)
+
+    def put_many(self, values: Dict[str, np.ndarray], model_id: str, version: int, kind: str):
+        """
+        Store values for several photos in memory and in the backing cache.
+
+        Args:
+            values: Dictionary mapping photo paths to the arrays to store
+            model_id: Identifier of the model that produced the values
+            version: Preprocessing version of the producing code
+            kind: Name of the stored value (e.g. "image_embeds")
+        """
+        self._store({
+            EmbeddingCache._key(self.content_hash(path), model_id, version, kind): np.ascontiguousarray(value)
+            for path, value in values.items()
+        })
+        if self.backing:
+            self.backing.put_many(values, model_id, version, kind)
+
+    def put(self, path: str, model_id: str, version: int, kind: str, value: np.ndarray):
+        """Store the value for a single photo."""
+        self.put_many({path: value}, model_id, version, kind)
+
+    def _store(self, values: Dict[str, np.ndarray]):
+        with self._lock:
+            for key, value in values.items():
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self._size_bytes -= previous.nbytes
+                self._entries[key] = value
+                self._size_bytes += value.nbytes
+            while self._size_bytes > self.max_size_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and the current in-memory size; hits include values read from the backing cache."""
+        with self._lock:
+            entries = len(self._entries)
+            hits, misses, evictions, size_bytes = self.hits, self.misses, self.evictions, self._size_bytes
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "evictions": evictions,
+            "entries": entries,
+            "size_mb": size_bytes / (1024 * 1024),
+        }
+
+    def clear(self):
+        """Drop everything held in memory and in the backing cache."""
+        with self._lock:
+            self._entries.clear()
+            self._hashes.clear()
+            self._size_bytes = 0
+        if self.backing:
+            self.backing.clear()
+
+    def close(self):
+        """Close the backing cache."""
+        if self.backing:
+            self.backing.close()
@@ -0,0 +1,213 @@
+import gc
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import torch
+
+from utils.timing import stage_timer
+
+
+def _memory_bytes(model: Any) -> int:
+    """Bytes of the parameters and buffers of the modules in a loaded model (a module, tuple, dict or encoder set)."""
+    if isinstance(model, torch.nn.Module):
+        tensors = itertools.chain(model.parameters(), model.buffers())
+        return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+    if isinstance(model, (tuple, list)):
+        return sum(_memory_bytes(item) for item in model)
+    if isinstance(model, dict):
+        return sum(_memory_bytes(item) for item in model.values())
+    for attribute in ("encoders", "module"):  # EncoderSet, TorchEncoder
+        if hasattr(model, attribute):
+            return _memory_bytes(getattr(model, attribute))
+    return 0
+
+
+class ModelPool:
+    def __init__(self, idle_timeout: Optional[float] = None):
+        """
+        Initialize a process-wide registry of loaded models.
+
+        Models are loaded lazily on first use and shared by every caller afterwards.
+        Models that have not been used for `idle_timeout` seconds can be evicted by
+        `evict_idle`, or automatically by the background reaper. A model is in use from
+        `get` until the idle timeout passes, or for as long as it is checked out with
+        `checkout`, which is what long-running inference should use.
+
+        Args:
+            idle_timeout: Seconds of inactivity after which a model may be evicted, or None to keep models forever
+        """
+        self.idle_timeout = idle_timeout
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._models: Dict[str, Any] = {}
+        self._last_used: Dict[str, float] = {}
+        self._checkouts: Dict[str, int] = {}  # Name -> number of callers using the model right now
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._stop_reaper = threading.Event()
+
+    def register(self, name: str, loader: Callable[[], Any]):
+        """Register the loader for a model so it can be preloaded by name."""
+        with self._lock:
+            self._loaders.setdefault(name, loader)
+
+    def get(self, name: str, loader: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Return a loaded model, loading it on first use.
+
+        Args:
+            name: Unique name of the model (e.g. its Hugging Face id)
+            loader: Function that loads the model; defaults to the registered loader
+
+        Returns:
+            Whatever the loader returned, shared with every other caller
+        """
+        return self._acquire(name, loader, checkout=False)
+
+    @contextmanager
+    def checkout(self, name: str, loader: Optional[Callable[[], Any]] = None) -> Iterator[Any]:
+        """
+        Use a model for the duration of a block, loading it on first use.
+
+        The model is not evicted as idle while any caller has it checked out, however
+        long the block runs, and its idle time starts when the last caller releases it.
+
+        Args:
+            name: Unique name of the model (e.g. its Hugging Face id)
+            loader: Function that loads the model; defaults to the registered loader
+
+        Yields:
+            Whatever the loader returned, shared with every other caller
+        """
+        model = self._acquire(name, loader, checkout=True)
+        try:
+            yield model
+        finally:
+            with self._lock:
+                self._checkouts[name] -= 1
+                if not self._checkouts[name]:
+                    del self._checkouts[name]
+                if name in self._models:
+                    self._last_used[name] = time.monotonic()
+
+    def _acquire(self, name: str, loader: Optional[Callable[[], Any]], checkout: bool) -> Any:
+        with self._lock:
+            if loader is not None:
+                self._loaders.setdefault(name, loader)
+            if name not in self._loaders:
+                raise KeyError(f"No loader registered for model '{name}'")
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # Loads of the same model are serialized; different models may load concurrently
+        with load_lock:
+            with self._lock:
+                if name in self._models:
+                    return self._use(name, checkout)
+                loader = self._loaders[name]
+
+            # Collect garbage from evicted models before allocating a new one
+            gc.collect()
+            with stage_timer.stage("model_load"):
+                model = loader()
+
+            with self._lock:
+                self._models[name] = model
+                return self._use(name, checkout)
+
+    def _use(self, name: str, checkout: bool) -> Any:
+        """Mark a loaded model as just used, and as checked out if requested. Caller holds the lock."""
+        self._last_used[name] = time.monotonic()
+        if checkout:
+            self._checkouts[name] = self._checkouts.get(name, 0) + 1
+        return self._models[name]
+
+    def preload(self, names: Optional[List[str]] = None) -> List[str]:
+        """Load the given registered models, or all of them, ahead of the first request."""
+        names = names if names is not None else list(self._loaders)
+        for name in names:
+            self.get(name)
+        return names
+
+    def evict(self, name: str) -> bool:
+        """
+        Drop a model from the pool.
+
+        Callers that still hold a reference keep working; the memory is released once they finish.
+        """
+        with self._lock:
+            model = self._models.pop(name, None)
+            self._last_used.pop(name, None)
+        if model is None:
+            return False
+        del model
+        self._release_memory()
+        return True
+
+    @staticmethod
+    def _release_memory():
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def evict_idle(self) -> List[str]:
+        """Evict every model unused for longer than the idle timeout; checked out models are never idle."""
+        if self.idle_timeout is None:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            # Checked and dropped under one lock, so a model cannot be checked out in between
+            idle = [
+                name for name, used in self._last_used.items()
+                if name not in self._checkouts and now - used > self.idle_timeout
+            ]
+            evicted = [name for name in idle if self._models.pop(name, None) is not None]
+            for name in idle:
+                del self._last_used[name]
+        if evicted:
+            self._release_memory()
+        return evicted
+
+    def start_reaper(self, interval: Optional[float] = None):
+        """Start a daemon thread that periodically evicts idle models."""
+        if self.idle_timeout is None or (self._reaper and self._reaper.is_alive()):
+            return
+        interval = interval or min(60.0, max(1.0, self.idle_timeout / 4))
+        self._stop_reaper.clear()
+
+        def reap():
+            while not self._stop_reaper.wait(interval):
+                for name in self.evict_idle():
+                    print(f"Evicted idle model {name}")
+
+        self._reaper = threading.Thread(target=reap, name="model-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def stop_reaper(self):
+        """Stop the idle reaper thread, if running."""
+        self._stop_reaper.set()
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """Approximate memory held by each loaded model; exported ONNX sessions are not counted."""
+        with self._lock:
+            models = dict(self._models)
+        return {name: _memory_bytes(model) for name, model in models.items()}
+
+    def status(self) -> Dict[str, dict]:
+        """Return which registered models are loaded and how long they have been idle."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "loaded": name in self._models,
+                    "checkouts": self._checkouts.get(name, 0),
+                    "idle_seconds": now - self._last_used[name] if name in self._last_used else None
+                }
+                for name in self._loaders
+            }
+
+
+# Shared by every categorizer and selector in this process
+model_pool = ModelPool()
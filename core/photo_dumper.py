@@ -1,22 +1,108 @@
+import hashlib
 import os
-import shutil
-from .blip_categorizer import BlipCategorizer
-from .photo_ranker import get_category_list, AestheticClipSelector
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+
+from .blip_categorizer import BlipCategorizer, assign_categories
+from .blip_categorizer import MODEL_ID as BLIP_MODEL_ID, PREPROCESS_VERSION as BLIP_PREPROCESS_VERSION
+from .photo_ranker import (
+    get_category_list, pre_filter_candidates, combine_scores, select_top_photos, AestheticClipSelector, ClipScreener,
+    AESTHETIC_MODEL_ID, CLIP_MODEL_ID, SCREEN_CLIP_MODEL_ID, PREPROCESS_VERSION as CLIP_PREPROCESS_VERSION
+)
+from .cascade import screen_scores, screen_candidates, cascade_recall, CASCADE_REPORT_FILE
+from .embedding_cache import EmbeddingCache, MemoryEmbeddingCache, DEFAULT_MAX_SIZE_MB
+from .album_state import AlbumState, ALBUM_STATE_FILE
+from .vector_index import VectorIndex, SEARCH_INDEX_FILE
+from .sharding import ShardPool
+from .backends import DEFAULT_BACKEND, cache_model_id
+from .progress import ProgressTracker, ProgressCallback
+from .dedupe import find_duplicate_groups, DEFAULT_MAX_DISTANCE
+from utils.hashing import file_sha256
+from utils.prefetch import DEFAULT_DECODE_WORKERS
+from utils.timing import stage_timer
+from utils.telemetry import images_processed
+from utils.materialize import (
+    DEFAULT_OUTPUT_MODE, materialize, is_materialized, link_method, read_selection, write_selection
+)
+from utils.utils import list_images, save_results, load_categories
+
+CATEGORIZER_MODELS = ("blip", "smolvlm")
+DEFAULT_CATEGORIZER_MODEL = "blip"  # SmolVLM describes each photo first: slower, but it reads the content
+
+def state_signature(backend: str = DEFAULT_BACKEND,
+                    categorizer_model: str = DEFAULT_CATEGORIZER_MODEL) -> Dict[str, str]:
+    """Scores in the album state are only reused when produced by the same models, backend and preprocessing."""
+    signature = {
+        "blip": f"{cache_model_id(BLIP_MODEL_ID, backend)}@{BLIP_PREPROCESS_VERSION}",
+        "clip": f"{cache_model_id(CLIP_MODEL_ID, backend)}@{CLIP_PREPROCESS_VERSION}",
+        "aesthetic": AESTHETIC_MODEL_ID,
+        "screen": f"{cache_model_id(SCREEN_CLIP_MODEL_ID, backend)}@{CLIP_PREPROCESS_VERSION}",
+    }
+    if categorizer_model == "smolvlm":
+        from .smolvlm_categorizer import MODEL_NAME as SMOLVLM_MODEL_ID
+        signature["categorizer"] = SMOLVLM_MODEL_ID
+    return signature
 
 class PhotoDumper:
-    def __init__(self, album_path: str, categories_file: str, batch_size: int = 1,
+    def __init__(self, album_path: str, categories_file: str, batch_size: Optional[int] = None,
                  pre_filter: int = 100, keep_top_k: int = 1, output_dir: str = 'output',
-                 aesthetic_weight: float = 0.6):
+                 aesthetic_weight: float = 0.6, cache_dir: Optional[str] = 'cache',
+                 cache_size_mb: float = DEFAULT_MAX_SIZE_MB, dedupe: bool = True,
+                 dedupe_max_distance: int = DEFAULT_MAX_DISTANCE, incremental: bool = True,
+                 cache: Optional[Union[EmbeddingCache, MemoryEmbeddingCache]] = None,
+                 search_index: bool = False, num_workers: int = 1, shard_pool: Optional[ShardPool] = None,
+                 backend: str = DEFAULT_BACKEND, artifacts_dir: Optional[str] = None,
+                 screen_keep: int = 0, audit_cascade: bool = False, output_mode: str = DEFAULT_OUTPUT_MODE,
+                 sources: Optional[List[str]] = None, categorizer: Optional[BlipCategorizer] = None,
+                 selector: Optional[AestheticClipSelector] = None,
+                 categorizer_model: str = DEFAULT_CATEGORIZER_MODEL):
         """Initialize PhotoDumper with configuration parameters.
-        
+
         Args:
             album_path: Path to folder containing photos
             categories_file: Path to text file containing numbered categories
-            batch_size: Number of images to process in each batch
+            batch_size: Number of images to process in each batch; None uses the size tuned
+                for each model on this machine
             pre_filter: Number of photos to pre-filter per category
             keep_top_k: Number of top photos to keep per category
             output_dir: Directory to save output files
             aesthetic_weight: Weight given to aesthetic score vs CLIP score
+            cache_dir: Directory for the persistent embedding cache, or None to disable caching
+            cache_size_mb: Maximum size of the embedding cache in megabytes
+            dedupe: Whether to send only one photo per group of (near-)duplicates to the models
+            dedupe_max_distance: Maximum difference-hash Hamming distance between near-duplicates
+            incremental: Whether to reuse per-photo scores of the previous run in `output_dir`,
+                so only added photos are scored
+            cache: Already open cache to use instead of opening one in `cache_dir`, e.g. a
+                MemoryEmbeddingCache kept across runs so re-runs with new categories only
+                encode the category prompts
+            search_index: Whether to also save a vector index for free-text search in
+                `output_dir`, over the CLIP embeddings of the photos ranking scored
+            num_workers: Number of processes to shard model inference across; 1 runs the
+                models in this process
+            shard_pool: Already running worker pool to use instead of starting
+                `num_workers` processes for this run
+            backend: Inference backend of the BLIP and CLIP encoders, one of core.backends.BACKENDS
+            artifacts_dir: Directory of exported encoders, used by the optimized backends
+            screen_keep: Number of photos per category that a small CLIP model lets through to
+                the full aesthetic and CLIP scorer, or 0 to score every candidate fully;
+                never fewer than `keep_top_k`
+            audit_cascade: Whether to also score every candidate fully and save how many of
+                the full scorer's top photos the cascade kept to `output_dir`
+            output_mode: How selected photos appear in the category folders, one of
+                utils.materialize.OUTPUT_MODES; links fall back to copies where the
+                filesystem cannot make them
+            sources: Photos outside `album_path` to process in place as part of the album,
+                e.g. those of folders registered with utils.folders.FolderRegistry
+            categorizer: Already loaded categorizer for `categories_file` to use instead of
+                creating one for this run
+            selector: Already loaded selector to use instead of creating one once a photo
+                needs CLIP
+            categorizer_model: Model choosing each photo's category, one of CATEGORIZER_MODELS;
+                "smolvlm" describes every photo before classifying it and always runs in
+                this process
         """
         self.album_path = album_path
         self.categories_file = categories_file
@@ -25,46 +111,360 @@ class PhotoDumper:
         self.keep_top_k = keep_top_k
         self.output_dir = output_dir
         self.aesthetic_weight = aesthetic_weight
-        
+        if cache is not None:
+            self.cache = cache
+        else:
+            self.cache = EmbeddingCache(cache_dir, cache_size_mb) if cache_dir else None
+        self.dedupe = dedupe
+        self.dedupe_max_distance = dedupe_max_distance
+        self.incremental = incremental
+        self.search_index = search_index
+        self.num_workers = num_workers
+        self.shard_pool = shard_pool
+        self.backend = backend
+        self.artifacts_dir = artifacts_dir
+        self.screen_keep = screen_keep
+        self.audit_cascade = audit_cascade
+        self.output_mode = output_mode
+        self.sources = list(sources or [])
+        self.categorizer_model = categorizer_model
+        self._categorizer = categorizer
+        self._selector = selector
+        self._screener = None
+
         os.makedirs(output_dir, exist_ok=True)
-        
-    def process(self):
-        """Run the photo processing pipeline."""
-        # Step 1: Categorize photos using BLIP
-        categorizer = BlipCategorizer(self.categories_file)
-        category_results = categorizer.categorize_album(
-            self.album_path,
-            batch_size=self.batch_size,
-            output_file=os.path.join(self.output_dir, "category_results.json")
-        )
 
-        # Step 2: Group photos by category
-        category_list = get_category_list(
-            category_results,
-            save_path=os.path.join(self.output_dir, "category_list.json")
+    def process(self, progress_callback: Optional[ProgressCallback] = None):
+        """Run the photo processing pipeline.
+
+        Per-photo probabilities and scores are kept in the album state in `output_dir`,
+        so after adding or removing photos only the new ones go through the models and
+        the ranking is recomputed from stored scores. Models are not even loaded when
+        nothing needs scoring.
+
+        Args:
+            progress_callback: Optional function receiving rate-limited progress events
+                for the dedupe, categorize, group, rank and copy stages. It runs on the pipeline
+                thread, so it should hand events off rather than block; raising from it
+                aborts the run.
+        """
+        owns_pool = self.shard_pool is None and self.num_workers > 1
+        if owns_pool:
+            self.shard_pool = ShardPool(
+                self.num_workers, cache_dir=self._disk_cache_dir(),
+                backend=self.backend, artifacts_dir=self.artifacts_dir
+            )
+        try:
+            return self._run(progress_callback)
+        finally:
+            if owns_pool:
+                self.shard_pool.shutdown()
+                self.shard_pool = None
+
+    def _run(self, progress_callback: Optional[ProgressCallback]):
+        # Step 0: Collapse duplicates and burst shots so only one photo per group reaches the models
+        photos = list_images(self.album_path) + self.sources
+        if self.dedupe:
+            with stage_timer.stage("dedupe"):
+                duplicate_groups = find_duplicate_groups(
+                    photos,
+                    cache=self.cache,
+                    max_distance=self.dedupe_max_distance,
+                    progress=ProgressTracker("dedupe", progress_callback).update
+                )
+            save_results(duplicate_groups, os.path.join(self.output_dir, "duplicate_groups.json"))
+        else:
+            duplicate_groups = {photo: [photo] for photo in photos}
+
+        images_processed.inc(len(photos), stage="album")
+        representatives = list(duplicate_groups)
+        digests = self._content_hashes(representatives)
+        categories = load_categories(self.categories_file)
+        state = AlbumState.load(
+            os.path.join(self.output_dir, ALBUM_STATE_FILE), state_signature(self.backend, self.categorizer_model)
         )
+        if not self.incremental:
+            state.photos.clear()
+        state.set_categories(list(categories.values()))
+        state.prune(digests.values())
+
+        # Step 1: Categorize new photos using BLIP
+        categorize_progress = ProgressTracker("categorize", progress_callback)
+        new_photos = [photo for photo in representatives if state.probabilities(digests[photo]) is None]
+        if new_photos:
+            with stage_timer.stage("categorize"):
+                probabilities = self._predict_probabilities(new_photos, categorize_progress.update)
+            images_processed.inc(len(new_photos), stage="categorize")
+            for photo, row in zip(new_photos, probabilities):
+                state.set_probabilities(digests[photo], row.tolist())
+        else:
+            categorize_progress.update(len(representatives), len(representatives))
 
-        # Step 3: Rank photos using aesthetic and CLIP scores
-        selector = AestheticClipSelector()
-        ranked_categories = selector.rank_photos(
-            category_list,
-            batch_size=1,
-            pre_filter=self.pre_filter,
-            keep_top_k=self.keep_top_k,
-            aesthetic_weight=self.aesthetic_weight,
-            save_path=os.path.join(self.output_dir, "ranked_categories.json")
+        category_results = assign_categories(
+            representatives,
+            np.array([state.probabilities(digests[photo]) for photo in representatives]),
+            categories
         )
-        
-        # Step 4: Organize selected photos into category folders
-        for category, photos in ranked_categories.items():
+        save_results(
+            self._propagate_to_duplicates(category_results, duplicate_groups),
+            os.path.join(self.output_dir, "category_results.json")
+        )
+
+        # Step 2: Group photos by category
+        with stage_timer.stage("grouping"):
+            category_list = get_category_list(
+                category_results,
+                save_path=os.path.join(self.output_dir, "category_list.json")
+            )
+        ProgressTracker("group", progress_callback).update(len(category_results), len(category_results))
+
+        # Step 3: Screen candidates with the small model, score the survivors without stored scores,
+        # then rank them using aesthetic and CLIP scores
+        candidates = pre_filter_candidates(category_list, self.pre_filter)
+        screened = candidates
+        if self.screen_keep:
+            with stage_timer.stage("screen"):
+                screened = self._screen(candidates, state, digests, ProgressTracker("screen", progress_callback))
+        audit = self.audit_cascade and bool(self.screen_keep)
+        rank_progress = ProgressTracker("rank", progress_callback)
+        unscored = {
+            category: [
+                photo for photo in photos
+                if state.aesthetic(digests[photo]) is None or state.clip_score(digests[photo], category) is None
+            ]
+            for category, photos in (candidates if audit else screened).items()
+        }
+        unscored = {category: photos for category, photos in unscored.items() if photos}
+        if unscored:
+            with stage_timer.stage("score"):
+                aesthetic_scores, clip_scores = self._score_components(unscored, rank_progress.update)
+            images_processed.inc(len(aesthetic_scores), stage="score")
+            for photo, score in aesthetic_scores.items():
+                state.set_aesthetic(digests[photo], score)
+            for category, scores in clip_scores.items():
+                for photo, score in scores.items():
+                    state.set_clip_score(digests[photo], category, score)
+        else:
+            num_candidates = sum(len(photos) for photos in screened.values())
+            rank_progress.update(num_candidates, num_candidates)
+
+        with stage_timer.stage("ranking"):
+            scored_categories = self._full_scores(screened, state, digests)
+            ranked_categories = select_top_photos(
+                scored_categories, self.keep_top_k,
+                save_path=os.path.join(self.output_dir, "ranked_categories.json")
+            )
+        if audit:
+            report = cascade_recall(self._full_scores(candidates, state, digests), screened, self.keep_top_k)
+            save_results(report, os.path.join(self.output_dir, CASCADE_REPORT_FILE))
+            print(f"Cascade kept {report['recall']:.1%} of the full scorer's top photos "
+                  f"while fully scoring {report['scored_fraction']:.1%} of candidates")
+
+        # Step 4: Index the album for free-text search from the embeddings ranking computed
+        if self.search_index:
+            with stage_timer.stage("index"):
+                self._build_search_index(representatives, ProgressTracker("index", progress_callback))
+
+        # Step 5: Link or copy selected photos into category folders and describe them in the selection manifest
+        with stage_timer.stage("copy"):
+            self._sync_output(ranked_categories, state, ProgressTracker("copy", progress_callback))
+        state.save()
+
+        return ranked_categories
+
+    def _full_scores(self, photos: Dict[str, List[str]], state: AlbumState,
+                     digests: Dict[str, str]) -> Dict[str, List[tuple]]:
+        """(photo, combined score) of every photo in each category, from the scores stored in the state."""
+        return {
+            category: [
+                (photo, combine_scores(
+                    state.aesthetic(digests[photo]), state.clip_score(digests[photo], category), self.aesthetic_weight
+                ))
+                for photo in category_photos
+            ]
+            for category, category_photos in photos.items()
+        }
+
+    def _screen(self, candidates: Dict[str, List[str]], state: AlbumState, digests: Dict[str, str],
+                progress: ProgressTracker) -> Dict[str, List[str]]:
+        """
+        First stage of the ranking cascade: keep the best `screen_keep` candidates of each category.
+
+        Only categories with more candidates than that are screened, and the small CLIP
+        model only runs on photos without screening scores in the album state.
+        """
+        keep = max(self.screen_keep, self.keep_top_k)
+        crowded = {category: photos for category, photos in candidates.items() if len(photos) > keep}
+        unscreened = {
+            category: [
+                photo for photo in photos
+                if state.screen_quality(digests[photo]) is None
+                or state.screen_clip_score(digests[photo], category) is None
+            ]
+            for category, photos in crowded.items()
+        }
+        unscreened = {category: photos for category, photos in unscreened.items() if photos}
+        if unscreened:
+            if self._screener is None:
+                self._screener = ClipScreener(cache=self.cache, backend=self.backend, artifacts_dir=self.artifacts_dir)
+            quality, clip_scores = self._screener.score_components(unscreened, self.batch_size, progress.update)
+            images_processed.inc(len(quality), stage="screen")
+            for photo, score in quality.items():
+                state.set_screen_quality(digests[photo], score)
+            for category, scores in clip_scores.items():
+                for photo, score in scores.items():
+                    state.set_screen_clip_score(digests[photo], category, score)
+        else:
+            num_crowded = sum(len(photos) for photos in crowded.values())
+            progress.update(num_crowded, num_crowded)
+
+        scores = {
+            category: screen_scores(
+                {photo: state.screen_quality(digests[photo]) for photo in photos},
+                {photo: state.screen_clip_score(digests[photo], category) for photo in photos},
+                self.aesthetic_weight
+            )
+            for category, photos in crowded.items()
+        }
+        return screen_candidates(candidates, scores, keep)
+
+    def _build_search_index(self, photos: List[str], progress: ProgressTracker):
+        """
+        Save a vector index over the CLIP embeddings of `photos` that ranking computed now or in an earlier run.
+
+        The index is read from the embedding cache, where ranking stores every ViT-L/14
+        embedding under the same key, so indexing never runs CLIP itself. Photos ranking
+        has not scored, because they were no candidate of any category or the cascade
+        screened them out, are left out of the index.
+        """
+        clip_cache_id = cache_model_id(CLIP_MODEL_ID, self.backend)
+        embeds = self.cache.get_many(photos, clip_cache_id, CLIP_PREPROCESS_VERSION, "clip_image_embeds") if self.cache else {}
+        indexed = [photo for photo in photos if photo in embeds]
+        progress.update(len(photos), len(photos))
+
+        index_path = os.path.join(self.output_dir, SEARCH_INDEX_FILE)
+        if indexed:
+            VectorIndex(indexed, np.stack([embeds[photo] for photo in indexed])).save(index_path)
+        elif os.path.exists(index_path):
+            os.remove(index_path)
+
+    def _predict_probabilities(self, photos: List[str], progress: Callable[[int, int], None]) -> np.ndarray:
+        if self.shard_pool and self.categorizer_model == "blip":
+            return self.shard_pool.predict_probabilities(self.categories_file, photos, self.batch_size, progress)
+        return self._get_categorizer().predict_probabilities(photos, batch_size=self.batch_size, progress=progress)
+
+    def _score_components(self, photos: Dict[str, List[str]], progress: Callable[[int, int], None]) -> tuple:
+        if self.shard_pool:
+            return self.shard_pool.score_components(photos, self.batch_size, progress)
+        return self._get_selector().score_components(photos, batch_size=self.batch_size, progress=progress)
+
+    def _get_categorizer(self):
+        """Categorizer created on first use and kept for the rest of the run, so the category prompts are encoded once."""
+        if self._categorizer is None:
+            if self.categorizer_model == "smolvlm":
+                from .smolvlm_categorizer import SmolVLMCategorizer
+                self._categorizer = SmolVLMCategorizer(self.categories_file)
+            else:
+                self._categorizer = BlipCategorizer(
+                    self.categories_file, cache=self.cache, backend=self.backend, artifacts_dir=self.artifacts_dir
+                )
+        return self._categorizer
+
+    def _get_selector(self) -> AestheticClipSelector:
+        """Selector created only once a photo needs CLIP, and kept for the rest of the run."""
+        if self._selector is None:
+            self._selector = AestheticClipSelector(
+                cache=self.cache, backend=self.backend, artifacts_dir=self.artifacts_dir
+            )
+        return self._selector
+
+    def _disk_cache_dir(self) -> Optional[str]:
+        """Directory of the on-disk cache behind `self.cache`, which worker processes open themselves."""
+        cache = self.cache.backing if isinstance(self.cache, MemoryEmbeddingCache) else self.cache
+        return cache.cache_dir if cache else None
+
+    def _content_hashes(self, paths: List[str]) -> Dict[str, str]:
+        """SHA-256 of each photo, read from the embedding cache when it has seen the file before."""
+        content_hash = self.cache.content_hash if self.cache else file_sha256
+        with ThreadPoolExecutor(max_workers=DEFAULT_DECODE_WORKERS, thread_name_prefix="hash") as pool:
+            return dict(zip(paths, pool.map(content_hash, paths)))
+
+    def _sync_output(self, ranked_categories: Dict[str, List[str]], state: AlbumState, progress: ProgressTracker):
+        """
+        Materialize selected photos into category folders and remove the ones the previous run selected but this one did not.
+
+        Photos already linked or copied by an earlier run are left alone. The selection,
+        with the source and output path of every photo and how it was materialized, is
+        saved to the selection manifest read by /download and scripts/open_results.sh.
+        """
+        sources = {category: self._output_names(photos) for category, photos in ranked_categories.items()}
+        selection = {category: list(names) for category, names in sources.items()}
+        for category, filenames in state.selection.items():
+            keep = set(selection.get(category, []))
+            category_dir = os.path.join(self.output_dir, category)
+            for filename in filenames:
+                stale = os.path.join(category_dir, filename)
+                if filename not in keep and os.path.lexists(stale):
+                    os.remove(stale)
+            if os.path.isdir(category_dir) and not os.listdir(category_dir):
+                os.rmdir(category_dir)
+
+        previous = read_selection(self.output_dir) or {}
+        previous_methods = {
+            (category, entry["file"]): entry["method"]
+            for category, entries in previous.get("categories", {}).items()
+            for entry in entries
+        }
+        total = sum(len(filenames) for filenames in selection.values())
+        done = 0
+        manifest = {}
+        for category, filenames in selection.items():
             category_dir = os.path.join(self.output_dir, category)
             os.makedirs(category_dir, exist_ok=True)
-            
-            for photo_path in photos:
-                filename = os.path.basename(photo_path)
-                src = os.path.join(self.album_path, filename)
+            manifest[category] = []
+
+            for filename in filenames:
+                src = sources[category][filename]
                 dst = os.path.join(category_dir, filename)
                 if os.path.exists(src):
-                    shutil.copy2(src, dst)
-        
-        return ranked_categories
\ No newline at end of file
+                    if is_materialized(src, dst, self.output_mode):
+                        method = previous_methods.get((category, filename)) or link_method(src, dst)
+                    else:
+                        method = materialize(src, dst, self.output_mode)
+                    manifest[category].append({
+                        "file": filename,
+                        "source": os.path.abspath(src),
+                        "path": os.path.join(category, filename),
+                        "method": method,
+                    })
+                done += 1
+                progress.update(done, total)
+        state.selection = selection
+        write_selection(self.output_dir, self.album_path, manifest)
+
+    @staticmethod
+    def _output_names(photos: List[str]) -> Dict[str, str]:
+        """
+        File name in the category folder -> photo, in ranking order.
+
+        Photos keep their own name unless another photo of the category, from a different
+        folder, already took it; those get a suffix derived from their folder.
+        """
+        names = {}
+        for photo in photos:
+            name = os.path.basename(photo)
+            if name in names:
+                stem, extension = os.path.splitext(name)
+                folder_id = hashlib.sha1(os.path.dirname(os.path.abspath(photo)).encode()).hexdigest()[:8]
+                name = f"{stem}-{folder_id}{extension}"
+            names[name] = photo
+        return names
+
+    @staticmethod
+    def _propagate_to_duplicates(results: dict, duplicate_groups: dict) -> dict:
+        """Copy each representative's result to the other photos of its group."""
+        propagated = {}
+        for representative, result in results.items():
+            for photo in duplicate_groups.get(representative, [representative]):
+                propagated[photo] = result if photo == representative else {**result, "duplicateOf": representative}
+        return propagated
@@ -1,9 +1,30 @@
-from typing import Dict, List, Optional
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
 from PIL import Image
 from torchmetrics.multimodal.clip_score import CLIPScore
 import torch
+import torch.nn.functional as F
 from aesthetics_predictor import AestheticsPredictorV1
 from transformers import CLIPProcessor, CLIPModel
+from utils.image import processor_input_size
+from utils.prefetch import PrefetchLoader
+from utils.timing import stage_timer
+from .embedding_cache import EmbeddingCache
+from .model_pool import model_pool
+from .autotune import DEVICE, device_profile
+from .backends import (
+    DEFAULT_BACKEND, EncoderSet, TorchEncoder, cache_model_id, load_optimized_encoders, export_encoders
+)
+
+PREPROCESS_VERSION = 2  # Bump when image preprocessing changes to invalidate cached scores
+DEFAULT_BATCH_SIZE = 16  # Used until the model has been autotuned on this machine
+AESTHETIC_MODEL_ID = "shunk031/aesthetics-predictor-v1-vit-large-patch14"
+CLIP_MODEL_ID = "openai/clip-vit-large-patch14"
+SCREEN_CLIP_MODEL_ID = "openai/clip-vit-base-patch32"  # Cheap first stage of the ranking cascade
+SCREEN_BATCH_SIZE = 32  # Used until the screening model has been autotuned on this machine
+# Zero-shot stand-in for the aesthetic head, which only exists for ViT-L/14 embeddings
+QUALITY_PROMPTS = ("a beautiful, well composed, high quality photo", "a blurry, badly composed, low quality photo")
 
 def get_category_list(photo_dict: Dict[str, Dict], save_path: str = None) -> Dict[str, List[str]]:
     """
@@ -38,6 +59,53 @@ def get_category_list(photo_dict: Dict[str, Dict], save_path: str = None) -> Dic
     
     return category_list
 
+def pre_filter_candidates(category_list: Dict[str, List[str]], pre_filter: int) -> Dict[str, List[str]]:
+    """
+    Keep the `pre_filter` most likely photos of each category and drop the "None" category.
+
+    Args:
+        category_list: Dictionary mapping categories to photos sorted by descending probability
+        pre_filter: Number of photos to keep per category, or 0 to keep all
+
+    Returns:
+        Dictionary mapping each real category to its candidate photos
+    """
+    return {
+        category: photos[:pre_filter] if pre_filter else photos
+        for category, photos in category_list.items()
+        if category != "None"
+    }
+
+def combine_scores(aesthetic_score: float, clip_score: float, aesthetic_weight: float) -> float:
+    """Combine aesthetic and CLIP scores using convex combination."""
+    return aesthetic_weight * aesthetic_score + (1 - aesthetic_weight) * clip_score
+
+def select_top_photos(scored_categories: Dict[str, List[tuple]], keep_top_k: int,
+                      save_path: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    Keep the highest scoring photos of each category.
+
+    Args:
+        scored_categories: Dictionary mapping categories to lists of (photo path, score) tuples
+        keep_top_k: Number of top photos to keep per category
+        save_path: Optional path to save the kept photos and their scores as JSON
+
+    Returns:
+        Dictionary mapping categories to lists of top ranked photos
+    """
+    ranked_categories = {}
+    kept_scores = {}
+    for category, scored_photos in scored_categories.items():
+        top = sorted(scored_photos, key=lambda x: x[1], reverse=True)[:keep_top_k]
+        ranked_categories[category] = [photo for photo, _ in top]
+        kept_scores[category] = {photo: score for photo, score in top}
+
+    if save_path:
+        import json
+        with open(save_path, 'w') as f:
+            json.dump(kept_scores, f, indent=2)
+    return ranked_categories
+
 class ClipSelector:
     def __init__(self, model_name_or_path: str = 'openai/clip-vit-large-patch14'):
         """Initialize CLIP-based photo selector."""
@@ -92,18 +160,279 @@ class ClipSelector:
                 
         return ranked_categories
 
+def load_clip(clip_model_id: str = CLIP_MODEL_ID):
+    """Load a CLIP model and its processor, in the dtype tuned for this machine."""
+    model = CLIPModel.from_pretrained(clip_model_id).float().eval()
+    processor = CLIPProcessor.from_pretrained(clip_model_id)
+    size = processor_input_size(processor.image_processor)
+    dtype = device_profile.resolve(
+        clip_model_id, ClipImageEncoder(model),
+        lambda n: {"pixel_values": torch.randn(n, 3, size, size, generator=torch.Generator().manual_seed(0))}
+    )
+    return model.to(DEVICE, dtype).eval(), processor
+
+def load_aesthetic_head(aestethic_model_id: str = AESTHETIC_MODEL_ID) -> torch.nn.Module:
+    """Load the aesthetics predictor and keep only its linear head, dropping the duplicate vision tower."""
+    predictor = AestheticsPredictorV1.from_pretrained(aestethic_model_id, low_cpu_mem_usage=True)
+    head = predictor.layers
+    head.projection_dim = predictor.config.projection_dim
+    del predictor
+    return head.to(DEVICE).eval()
+
+model_pool.register(f"clip:{CLIP_MODEL_ID}", load_clip)
+model_pool.register(f"clip:{SCREEN_CLIP_MODEL_ID}", lambda: load_clip(SCREEN_CLIP_MODEL_ID))
+model_pool.register(f"aesthetic-head:{AESTHETIC_MODEL_ID}", load_aesthetic_head)
+
+class ClipImageEncoder(torch.nn.Module):
+    def __init__(self, clip: CLIPModel):
+        """CLIP vision tower and projection, i.e. CLIPModel.get_image_features as one exportable module."""
+        super().__init__()
+        self.vision_model = clip.vision_model
+        self.visual_projection = clip.visual_projection
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.visual_projection(self.vision_model(pixel_values=pixel_values)[1])
+
+class ClipTextEncoder(torch.nn.Module):
+    def __init__(self, clip: CLIPModel):
+        """CLIP text tower and projection, i.e. CLIPModel.get_text_features as one exportable module."""
+        super().__init__()
+        self.text_model = clip.text_model
+        self.text_projection = clip.text_projection
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        return self.text_projection(self.text_model(input_ids=input_ids, attention_mask=attention_mask)[1])
+
+def _clip_metadata(clip: CLIPModel) -> dict:
+    return {"logit_scale": float(clip.logit_scale.exp()), "projection_dim": clip.config.projection_dim}
+
+def _reference_modules(clip_model_id: str):
+    """Float32 CPU encoders, the starting point for quantization and export."""
+    clip = CLIPModel.from_pretrained(clip_model_id).float().eval()
+    return {"image": ClipImageEncoder(clip), "text": ClipTextEncoder(clip)}, _clip_metadata(clip)
+
+def _pool_entry(clip_model_id: str, backend: str,
+                artifacts_dir: Optional[str]) -> Tuple[str, Callable[[], Any]]:
+    """Name and loader of the CLIP encoders on a backend in the shared model pool."""
+    if backend == DEFAULT_BACKEND:
+        return f"clip:{clip_model_id}", lambda: load_clip(clip_model_id)
+    return f"clip:{clip_model_id}#{backend}", lambda: load_optimized_encoders(
+        clip_model_id, backend, lambda: _reference_modules(clip_model_id), CLIPProcessor.from_pretrained, artifacts_dir
+    )
+
+def _encoder_set(pooled: Any, backend: str) -> EncoderSet:
+    if backend == DEFAULT_BACKEND:
+        clip, processor = pooled
+        return EncoderSet({
+            "image": TorchEncoder(ClipImageEncoder(clip), DEVICE, clip.dtype),
+            "text": TorchEncoder(ClipTextEncoder(clip), DEVICE),
+        }, processor, _clip_metadata(clip))
+    return pooled
+
+def get_clip_encoders(clip_model_id: str = CLIP_MODEL_ID, backend: str = DEFAULT_BACKEND,
+                      artifacts_dir: Optional[str] = None) -> EncoderSet:
+    """
+    Get the CLIP encoders on a backend from the shared model pool, loading them on first use.
+
+    Args:
+        clip_model_id: Hugging Face id of the CLIP model
+        backend: One of core.backends.BACKENDS
+        artifacts_dir: Directory of exported encoders, used by the optimized backends
+    """
+    return _encoder_set(model_pool.get(*_pool_entry(clip_model_id, backend, artifacts_dir)), backend)
+
+@contextmanager
+def checkout_clip_encoders(clip_model_id: str = CLIP_MODEL_ID, backend: str = DEFAULT_BACKEND,
+                           artifacts_dir: Optional[str] = None) -> Iterator[EncoderSet]:
+    """Like get_clip_encoders, but the model pool does not evict the model until the block exits."""
+    with model_pool.checkout(*_pool_entry(clip_model_id, backend, artifacts_dir)) as pooled:
+        yield _encoder_set(pooled, backend)
+
+def export(backend: str, artifacts_dir: str, clip_model_id: str = CLIP_MODEL_ID) -> str:
+    """Export the CLIP encoders for an optimized backend and return the directory they were written to."""
+    processor = CLIPProcessor.from_pretrained(clip_model_id)
+    size = processor_input_size(processor.image_processor)
+    pixel_values = processor(images=[Image.new("RGB", (size, size))] * 2, return_tensors="pt")["pixel_values"]
+    text = processor(text=["a photo of a dog", "a photo of friends at the beach"], return_tensors="pt", padding=True)
+    return export_encoders(
+        clip_model_id, backend, lambda: _reference_modules(clip_model_id), processor,
+        example_inputs={
+            "image": {"pixel_values": pixel_values},
+            "text": {"input_ids": text["input_ids"], "attention_mask": text["attention_mask"]},
+        },
+        artifacts_dir=artifacts_dir,
+        dynamic_axes={"text": {"input_ids": {1: "sequence"}, "attention_mask": {1: "sequence"}}}
+    )
+
+def encode_clip_text(texts: List[str], clip_model_id: str = CLIP_MODEL_ID, backend: str = DEFAULT_BACKEND,
+                     artifacts_dir: Optional[str] = None) -> np.ndarray:
+    """
+    Encode free-text queries with the pooled CLIP text tower, without loading the aesthetic head.
+
+    Args:
+        texts: Queries to encode; longer ones are truncated to CLIP's context length
+        clip_model_id: Hugging Face id of the CLIP model the image embeddings came from
+        backend: Backend the image embeddings came from
+        artifacts_dir: Directory of exported encoders, used by the optimized backends
+
+    Returns:
+        Float32 text embeddings of shape (len(texts), embed_dim)
+    """
+    encoders = get_clip_encoders(clip_model_id, backend, artifacts_dir)
+    text_inputs = encoders.processor(text=texts, return_tensors="pt", padding=True, truncation=True)
+    return encoders["text"](text_inputs["input_ids"], text_inputs["attention_mask"]).numpy()
+
+def encode_images(encoders: EncoderSet, photo_paths: List[str], batch_size: int,
+                  cache: Optional[EmbeddingCache] = None, cache_id: Optional[str] = None,
+                  progress: Optional[Callable[[int, int], None]] = None) -> torch.Tensor:
+    """
+    CLIP image embeddings of many photos, reading from the cache where possible.
+
+    Photos missing from the cache are decoded and downscaled on worker threads ahead
+    of the vision tower, which runs in batches of `batch_size`.
+
+    Args:
+        encoders: CLIP encoders from get_clip_encoders
+        photo_paths: Photos to encode
+        batch_size: Number of photos to run through the vision tower at once
+        cache: Optional embedding cache
+        cache_id: Model id the embeddings are cached under, from core.backends.cache_model_id
+        progress: Optional function called with (photos done, total photos) after each batch
+
+    Returns:
+        Float32 CPU embeddings of shape (num_photos, embed_dim), in the order of `photo_paths`
+    """
+    clip_embeds = {}
+    if cache:
+        clip_embeds = cache.get_many(photo_paths, cache_id, PREPROCESS_VERSION, "clip_image_embeds")
+    missing = [path for path in photo_paths if path not in clip_embeds]
+    num_cached = len(photo_paths) - len(missing)
+    if progress:
+        progress(num_cached, len(photo_paths))
+
+    done = num_cached
+    loader = PrefetchLoader(missing, batch_size, min_side=processor_input_size(encoders.processor.image_processor))
+    for batch_paths, images in loader:
+        with stage_timer.stage("preprocess"):
+            clip_inputs = encoders.processor(images=images, return_tensors="pt")
+        image_embeds = encoders["image"](clip_inputs["pixel_values"])
+
+        batch_embeds = dict(zip(batch_paths, image_embeds.numpy()))
+        if cache:
+            cache.put_many(batch_embeds, cache_id, PREPROCESS_VERSION, "clip_image_embeds")
+        clip_embeds.update(batch_embeds)
+        done += len(batch_paths)
+        if progress:
+            progress(done, len(photo_paths))
+
+    if not photo_paths:
+        return torch.zeros(0, encoders.metadata["projection_dim"])
+    return torch.from_numpy(np.stack([clip_embeds[path] for path in photo_paths]))
+
+def clip_logits(encoders: EncoderSet, image_embeds: torch.Tensor, text_embeds: torch.Tensor) -> torch.Tensor:
+    """Photos x prompts CLIP logits, computed the same way as CLIPModel's logits_per_image."""
+    logit_scale = encoders.metadata["logit_scale"]
+    return logit_scale * F.normalize(image_embeds, dim=-1) @ F.normalize(text_embeds, dim=-1).t()
+
+def encode_prompts(encoders: EncoderSet, prompts: List[str]) -> torch.Tensor:
+    """Tokenize and encode each prompt once, returning float32 CLIP text embeddings on the CPU."""
+    text_inputs = encoders.processor(text=prompts, return_tensors="pt", padding=True)
+    return encoders["text"](text_inputs["input_ids"], text_inputs["attention_mask"])
+
 class AestheticClipSelector:
     def __init__(
         self,
-        aestethic_model_id: str = "shunk031/aesthetics-predictor-v1-vit-large-patch14",
-        clip_model_id: str = "openai/clip-vit-large-patch14"
+        aestethic_model_id: str = AESTHETIC_MODEL_ID,
+        clip_model_id: str = CLIP_MODEL_ID,
+        cache: Optional[EmbeddingCache] = None,
+        backend: str = DEFAULT_BACKEND,
+        artifacts_dir: Optional[str] = None
     ):
-        """Initialize the aesthetic predictor model."""
-        self.device = "cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu"
-        self.predictor = AestheticsPredictorV1.from_pretrained(aestethic_model_id).to(self.device)
-        self.clip = CLIPModel.from_pretrained(clip_model_id).to(self.device)
-        self.predictor_processor = CLIPProcessor.from_pretrained(aestethic_model_id)
-        self.clip_processor = CLIPProcessor.from_pretrained(clip_model_id)
+        """Initialize the aesthetic predictor model.
+
+        The aesthetics predictor is a linear head on top of the CLIP ViT-L/14 image
+        embedding, so only its head is kept and both scores are computed from a single
+        pass through the CLIP vision tower.
+
+        Args:
+            aestethic_model_id: Hugging Face id of the aesthetics predictor
+            clip_model_id: Hugging Face id of the CLIP model used for prompt similarity
+            cache: Optional embedding cache used to skip forward passes for photos seen before
+            backend: Inference backend of the CLIP encoders, one of core.backends.BACKENDS
+            artifacts_dir: Directory of exported encoders, used by the optimized backends
+        """
+        self.device = DEVICE
+        self.aestethic_model_id = aestethic_model_id
+        self.clip_model_id = clip_model_id
+        self.cache = cache
+        self.backend = backend
+        self.artifacts_dir = artifacts_dir
+        self.cache_id = cache_model_id(clip_model_id, backend)
+        # Shared across selectors; only the first one in the process pays the load
+        self.encoders = get_clip_encoders(clip_model_id, backend, artifacts_dir)
+        self.clip_processor = self.encoders.processor
+        self.aesthetic_head = model_pool.get(*self._aesthetic_head_entry())
+        projection_dim = self.encoders.metadata["projection_dim"]
+        if self.aesthetic_head.projection_dim != projection_dim:
+            raise ValueError(
+                f"{aestethic_model_id} expects {self.aesthetic_head.projection_dim}-d embeddings "
+                f"but {clip_model_id} produces {projection_dim}-d embeddings"
+            )
+
+    def _aesthetic_head_entry(self) -> Tuple[str, Callable[[], torch.nn.Module]]:
+        return f"aesthetic-head:{self.aestethic_model_id}", lambda: load_aesthetic_head(self.aestethic_model_id)
+
+    @contextmanager
+    def _checkout(self) -> Iterator[None]:
+        """Keep CLIP and the aesthetic head checked out of the model pool while photos are encoded."""
+        with checkout_clip_encoders(self.clip_model_id, self.backend, self.artifacts_dir) as self.encoders:
+            with model_pool.checkout(*self._aesthetic_head_entry()) as self.aesthetic_head:
+                yield
+
+    def _encode_photos(self, photo_paths: List[str], batch_size: Optional[int],
+                       progress: Optional[Callable[[int, int], None]] = None) -> tuple:
+        """
+        Get aesthetic scores and CLIP image embeddings for many photos, reading from the cache where possible.
+
+        Photos missing from the cache are decoded and downscaled on worker threads ahead
+        of the CLIP vision tower, which runs in batches of `batch_size`. Aesthetic scores
+        come from applying the aesthetic head to the same normalized embeddings.
+
+        Args:
+            photo_paths: Photos to encode
+            batch_size: Number of photos to run through the vision tower at once; None uses the
+                size tuned for this machine
+            progress: Optional function called with (photos done, total photos) after each batch
+
+        Returns:
+            Tuple of (aesthetic scores of shape (num_photos,), CLIP image embeddings of shape (num_photos, embed_dim)),
+            both float32 on the CPU and in the order of `photo_paths`
+        """
+        with self._checkout():
+            image_embeds = encode_images(
+                self.encoders, photo_paths,
+                batch_size or device_profile.batch_size(self.clip_model_id, DEFAULT_BATCH_SIZE),
+                self.cache, self.cache_id, progress
+            )
+            return self._aesthetic_scores(image_embeds), image_embeds
+
+    def image_embeddings(self, photo_paths: List[str], batch_size: Optional[int] = None,
+                         progress: Optional[Callable[[int, int], None]] = None) -> np.ndarray:
+        """CLIP image embeddings of shape (len(photo_paths), embed_dim), e.g. for building a search index."""
+        _, image_embeds = self._encode_photos(photo_paths, batch_size, progress)
+        return image_embeds.numpy()
+
+    def _aesthetic_scores(self, image_embeds: torch.Tensor) -> torch.Tensor:
+        """Apply the aesthetic head to CLIP image embeddings, as AestheticsPredictorV1 does after its vision tower."""
+        with torch.no_grad():
+            normalized = F.normalize(image_embeds, dim=-1).to(self.device, next(self.aesthetic_head.parameters()).dtype)
+            return self.aesthetic_head(normalized).float().cpu().reshape(-1)
+
+    def _encode_prompts(self, prompts: List[str]) -> torch.Tensor:
+        return encode_prompts(self.encoders, prompts)
+
+    def _clip_logits(self, image_embeds: torch.Tensor, text_embeds: torch.Tensor) -> torch.Tensor:
+        return clip_logits(self.encoders, image_embeds, text_embeds)
 
     def _get_aesthetic_clip_score(
         self,
@@ -112,81 +441,149 @@ class AestheticClipSelector:
         aestethic_weight: float = 0.3
     ) -> float:
         """Get aesthetic score for a single photo."""
-        with Image.open(photo_path) as img:
-            img = img.convert('RGB')
-            # Get aesthetic score
-            aesthetic_inputs = self.predictor_processor(images=img, return_tensors="pt")
-            aesthetic_inputs = {k: v.to(self.device) for k, v in aesthetic_inputs.items()}
-            
-            # Get CLIP score
-            clip_inputs = self.clip_processor(
-                text=[clip_prompt], 
-                images=img, 
-                return_tensors="pt",
-                padding=True
-            )
-            clip_inputs = {k: v.to(self.device) for k, v in clip_inputs.items()}
-            
-            with torch.no_grad():
-                # Get aesthetic score
-                aesthetic_outputs = self.predictor(**aesthetic_inputs)
-                aesthetic_score = float(aesthetic_outputs.logits[0])
-                
-                # Get CLIP score
-                clip_outputs = self.clip(**clip_inputs)
-                clip_score = float(clip_outputs.logits_per_image[0][0])
-                
-                # Combine scores using convex combination
-                final_score = aestethic_weight * aesthetic_score + (1 - aestethic_weight) * clip_score
-                
-                return final_score
+        aesthetic_scores, image_embeds = self._encode_photos([photo_path], batch_size=1)
+        clip_score = float(self._clip_logits(image_embeds, self._encode_prompts([clip_prompt]))[0, 0])
+
+        # Combine scores using convex combination
+        return aestethic_weight * float(aesthetic_scores[0]) + (1 - aestethic_weight) * clip_score
+
+    def score_components(self, photos: Dict[str, List[str]], batch_size: Optional[int] = None,
+                         progress: Optional[Callable[[int, int], None]] = None) -> tuple:
+        """Compute the aesthetic score of every photo and its CLIP score against each of its categories.
+
+        Images are encoded once across all categories, even if a photo appears in
+        several of them, and each distinct category prompt is tokenized once.
+
+        Args:
+            photos: Dictionary mapping categories to lists of photo paths
+            batch_size: Number of photos to run through the models at once; None uses the size tuned for this machine
+            progress: Optional function called with (photos done, total photos) after each batch
+
+        Returns:
+            Tuple of (dictionary mapping photo paths to aesthetic scores,
+            dictionary mapping categories to dictionaries of photo path -> CLIP score)
+        """
+        unique_photos = list(dict.fromkeys(photo for category_photos in photos.values() for photo in category_photos))
+        row_of = {photo: i for i, photo in enumerate(unique_photos)}
+        aesthetic_scores, image_embeds = self._encode_photos(unique_photos, batch_size, progress)
+
+        prompts = list(photos.keys())
+        clip_by_category = {category: {} for category in prompts}
+        if not unique_photos:
+            return {}, clip_by_category
+        clip_scores = self._clip_logits(image_embeds, self._encode_prompts(prompts))
+
+        for column, (category, category_photos) in enumerate(photos.items()):
+            rows = [row_of[photo] for photo in category_photos]
+            clip_by_category[category] = dict(zip(category_photos, clip_scores[rows, column].tolist()))
+        return dict(zip(unique_photos, aesthetic_scores.tolist())), clip_by_category
+
+    def score_photos(self, photos: Dict[str, List[str]], batch_size: Optional[int] = None,
+                     aesthetic_weight: float = 0.3,
+                     progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, List[tuple]]:
+        """Score every photo in every category by aesthetic and CLIP scores.
+
+        Args:
+            photos: Dictionary mapping categories to lists of photo paths
+            batch_size: Number of photos to run through the models at once; None uses the size tuned for this machine
+            aesthetic_weight: Weight given to aesthetic score vs CLIP score
+            progress: Optional function called with (photos done, total photos) after each batch
+
+        Returns:
+            Dictionary mapping categories to lists of (photo path, score) tuples, in input order
+        """
+        aesthetic_scores, clip_scores = self.score_components(photos, batch_size, progress)
+        return {
+            category: [
+                (photo, combine_scores(aesthetic_scores[photo], clip_scores[category][photo], aesthetic_weight))
+                for photo in category_photos
+            ]
+            for category, category_photos in photos.items()
+        }
 
-    def rank_photos(self, photos: Dict[str, List[str]], batch_size: int = 1,
+    def rank_photos(self, photos: Dict[str, List[str]], batch_size: Optional[int] = None,
                    pre_filter: int = 100, keep_top_k: int = 10,
                    aesthetic_weight: float = 0.3,
-                   save_path: Optional[str] = None) -> Dict[str, List[str]]:
+                   save_path: Optional[str] = None,
+                   progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, List[str]]:
         """Rank photos in each category by aesthetic and CLIP scores.
         
         Args:
             photos: Dictionary mapping categories to lists of photo paths
-            batch_size: Number of photos to process at once
+            batch_size: Number of photos to process at once; None uses the size tuned for this machine
             pre_filter: Number of photos to pre-filter per category 
             keep_top_k: Number of top photos to keep per category
             aesthetic_weight: Weight given to aesthetic score vs CLIP score
             save_path: Optional path to save scores
+            progress: Optional function called with (photos done, total photos) after each batch
             
         Returns:
             Dictionary mapping categories to lists of top ranked photos
         """
-        ranked_categories = {}
-        scored_categories = {}
-        
-        filtered_photos = {
-            category: photos[:pre_filter] if pre_filter else photos
-            for category, photos in photos.items() 
-            if category != "None"
-        }
-        
-        for category, category_photos in filtered_photos.items():
-            scored_photos = []
-            for i in range(0, len(category_photos), batch_size):
-                batch_photos = category_photos[i:i + batch_size]
-                for photo in batch_photos:
-                    score = self._get_aesthetic_clip_score(photo, clip_prompt=f"{category}", aestethic_weight=aesthetic_weight)
-                    scored_photos.append((photo, score))
-                    
-            scored_photos.sort(key=lambda x: x[1], reverse=True)
-            ranked_categories[category] = [photo for photo, _ in scored_photos[:keep_top_k]]
-            scored_categories[category] = {
-                photo: score for photo, score in scored_photos[:keep_top_k]
-            }
-            
-        if save_path:
-            import json
-            with open(save_path, 'w') as f:
-                json.dump({
-                    category: {
-                        photo: score for photo, score in photos.items()
-                    } for category, photos in scored_categories.items()
-                }, f, indent=2)
-        return ranked_categories
+        all_scores = self.score_photos(
+            pre_filter_candidates(photos, pre_filter),
+            batch_size=batch_size, aesthetic_weight=aesthetic_weight, progress=progress
+        )
+        return select_top_photos(all_scores, keep_top_k, save_path)
+
+class ClipScreener:
+    def __init__(
+        self,
+        clip_model_id: str = SCREEN_CLIP_MODEL_ID,
+        cache: Optional[EmbeddingCache] = None,
+        backend: str = DEFAULT_BACKEND,
+        artifacts_dir: Optional[str] = None
+    ):
+        """Initialize the cheap first stage of the ranking cascade.
+
+        A small CLIP model scores photos on the same two signals as
+        AestheticClipSelector: a zero-shot quality margin between QUALITY_PROMPTS in place
+        of the aesthetic head, and similarity to the category prompt. Only its best
+        photos per category are then scored by the expensive selector.
+
+        Args:
+            clip_model_id: Hugging Face id of the small CLIP model
+            cache: Optional embedding cache used to skip forward passes for photos seen before
+            backend: Inference backend of the CLIP encoders, one of core.backends.BACKENDS
+            artifacts_dir: Directory of exported encoders, used by the optimized backends
+        """
+        self.clip_model_id = clip_model_id
+        self.cache = cache
+        self.backend = backend
+        self.artifacts_dir = artifacts_dir
+        self.cache_id = cache_model_id(clip_model_id, backend)
+        self.encoders = get_clip_encoders(clip_model_id, backend, artifacts_dir)
+
+    def score_components(self, photos: Dict[str, List[str]], batch_size: Optional[int] = None,
+                         progress: Optional[Callable[[int, int], None]] = None) -> tuple:
+        """Compute the quality margin of every photo and its CLIP score against each of its categories.
+
+        Args:
+            photos: Dictionary mapping categories to lists of photo paths
+            batch_size: Number of photos to run through the model at once; None uses the size tuned for this machine
+            progress: Optional function called with (photos done, total photos) after each batch
+
+        Returns:
+            Tuple of (dictionary mapping photo paths to quality margins,
+            dictionary mapping categories to dictionaries of photo path -> CLIP score)
+        """
+        unique_photos = list(dict.fromkeys(photo for category_photos in photos.values() for photo in category_photos))
+        row_of = {photo: i for i, photo in enumerate(unique_photos)}
+        with checkout_clip_encoders(self.clip_model_id, self.backend, self.artifacts_dir) as self.encoders:
+            image_embeds = encode_images(
+                self.encoders, unique_photos,
+                batch_size or device_profile.batch_size(self.clip_model_id, SCREEN_BATCH_SIZE),
+                self.cache, self.cache_id, progress
+            )
+
+        prompts = list(photos.keys())
+        if not unique_photos:
+            return {}, {category: {} for category in prompts}
+        logits = clip_logits(self.encoders, image_embeds, encode_prompts(self.encoders, list(QUALITY_PROMPTS) + prompts))
+        quality = (logits[:, 0] - logits[:, 1]).tolist()
+
+        clip_by_category = {}
+        for column, (category, category_photos) in enumerate(photos.items(), start=len(QUALITY_PROMPTS)):
+            rows = [row_of[photo] for photo in category_photos]
+            clip_by_category[category] = dict(zip(category_photos, logits[rows, column].tolist()))
+        return dict(zip(unique_photos, quality)), clip_by_category
@@ -0,0 +1,84 @@
+import time
+from typing import Callable, Dict, Optional
+
+ProgressCallback = Callable[[Dict], None]
+
+
+class ProgressTracker:
+    def __init__(self, stage: str, callback: Optional[ProgressCallback], min_interval: float = 0.5):
+        """
+        Turn per-batch updates of a pipeline stage into rate-limited progress events.
+
+        Events look like {"status": "progress", "stage": ..., "done": ..., "total": ...,
+        "skipped": ..., "images_per_sec": ..., "eta_seconds": ..., "elapsed_seconds": ...}.
+        At most one event is emitted every `min_interval` seconds, plus the first and the
+        final one.
+
+        The first update of a stage is sent before anything is computed and reports the
+        images that needed no work, such as embedding cache hits. Those, and images passed
+        to `skip`, count as done but not towards the rate, so on a warm run the rate is
+        that of the images actually computed and the ETA is the remaining images at that rate.
+
+        Args:
+            stage: Name of the pipeline stage (e.g. "categorize")
+            callback: Function receiving progress events; None disables reporting
+            min_interval: Minimum number of seconds between two events
+        """
+        self.stage = stage
+        self.callback = callback
+        self.min_interval = min_interval
+        self.started_at = time.monotonic()
+        self.skipped = 0
+        self._measured_from = None
+        self._last_emit = None
+
+    def skip(self, count: int):
+        """Record that `count` more images of this stage are done without having been computed."""
+        self.skipped += count
+
+    def part(self, offset: int, total: int) -> Callable[[int, int], None]:
+        """
+        Progress function for a part of this stage that starts with `offset` images done.
+
+        Like a stage, the part's first report is taken as images that needed no work.
+        """
+        first = True
+
+        def report(done: int, _):
+            nonlocal first
+            if first:
+                self.skip(done)
+                first = False
+            self.update(min(offset + done, total), total)
+        return report
+
+    def update(self, done: int, total: int):
+        """Report that `done` out of `total` images of this stage are finished."""
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if self._measured_from is None:
+            self._measured_from = now
+            self.skipped = max(self.skipped, done)
+        finished = done >= total
+        if not finished and self._last_emit is not None and now - self._last_emit < self.min_interval:
+            return
+        self._last_emit = now
+
+        computed = max(0, done - self.skipped)
+        measured = now - self._measured_from
+        rate = computed / measured if computed and measured > 0 else 0.0
+        if finished:
+            eta = 0.0
+        else:
+            eta = round((total - done) / rate, 1) if rate > 0 else None
+        self.callback({
+            "status": "progress",
+            "stage": self.stage,
+            "done": done,
+            "total": total,
+            "skipped": min(self.skipped, done),
+            "images_per_sec": round(rate, 2),
+            "eta_seconds": eta,
+            "elapsed_seconds": round(now - self.started_at, 1),
+        })
@@ -0,0 +1,190 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .embedding_cache import EmbeddingCache
+from .backends import DEFAULT_BACKEND
+from .autotune import device_profile
+from .model_pool import model_pool
+
+SHARD_BATCHES = 4  # Batches per task: small enough for even load and progress, large enough to amortize IPC
+DEFAULT_SHARD_SIZE = 32  # Photos per task when workers use their tuned batch sizes
+
+# Per-process state of a worker, set up by _init_worker
+_worker: dict = {}
+
+
+def threads_per_worker(num_workers: int) -> int:
+    """Split the machine's cores evenly between worker processes."""
+    return max(1, (os.cpu_count() or 1) // max(1, num_workers))
+
+
+def _init_worker(num_threads: int, cache_dir: Optional[str], backend: str, artifacts_dir: Optional[str]):
+    import torch
+    # Workers use the profile the parent resolved, sent with each task; benchmarking in all of
+    # them at once would only measure contention
+    device_profile.enabled = False
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Already set by an earlier parallel region
+    _worker["cache"] = EmbeddingCache(cache_dir) if cache_dir else None
+    _worker["categorizers"] = {}
+    _worker["selector"] = None
+    _worker["backend"] = {"backend": backend, "artifacts_dir": artifacts_dir}
+
+
+def _categorizer(categories_file: str):
+    """Categorizer for the current contents of `categories_file`, so prompts are encoded once per worker."""
+    from .blip_categorizer import BlipCategorizer
+    key = (categories_file, os.stat(categories_file).st_mtime_ns)
+    if key not in _worker["categorizers"]:
+        _worker["categorizers"] = {key: BlipCategorizer(categories_file, cache=_worker["cache"], **_worker["backend"])}
+    return _worker["categorizers"][key]
+
+
+def _selector():
+    from .photo_ranker import AestheticClipSelector
+    if _worker["selector"] is None:
+        _worker["selector"] = AestheticClipSelector(cache=_worker["cache"], **_worker["backend"])
+    return _worker["selector"]
+
+
+def _task(fn: Callable, profile: Dict[str, dict], *args):
+    device_profile.use(profile)
+    return fn(*args)
+
+
+def _predict_probabilities(categories_file: str, paths: List[str], batch_size: Optional[int]) -> np.ndarray:
+    return _categorizer(categories_file).predict_probabilities(paths, batch_size)
+
+
+def _score_components(photos: Dict[str, List[str]], batch_size: Optional[int]) -> tuple:
+    return _selector().score_components(photos, batch_size)
+
+
+def _image_embeddings(paths: List[str], batch_size: Optional[int]) -> np.ndarray:
+    return _selector().image_embeddings(paths, batch_size)
+
+
+class ShardPool:
+    def __init__(self, num_workers: int, cache_dir: Optional[str] = None, num_threads: Optional[int] = None,
+                 backend: str = DEFAULT_BACKEND, artifacts_dir: Optional[str] = None):
+        """
+        Run model inference for an album on several worker processes.
+
+        Each worker loads its own copy of the models on first use and runs PyTorch with
+        `num_threads` intra-op threads, which scales better on many-core CPUs than one
+        process using every core for small batches. Work is split into shards of a few
+        batches; results are put back together in input order, so the output does not
+        depend on which worker finished first. Workers are started with "spawn", which
+        is safe with threads and CUDA in the parent. They never autotune themselves: a
+        model missing from the device profile is tuned once in the parent before its
+        first shard, and every shard carries the parent's profile. Workers share the
+        on-disk embedding cache with the parent, each writing one transaction per batch.
+
+        Args:
+            num_workers: Number of worker processes
+            cache_dir: Directory of the on-disk embedding cache workers read and write, or None
+            num_threads: PyTorch threads per worker; defaults to an even split of the cores
+            backend: Inference backend of the encoders, one of core.backends.BACKENDS
+            artifacts_dir: Directory of exported encoders, used by the optimized backends
+        """
+        self.num_workers = num_workers
+        self.num_threads = num_threads or threads_per_worker(num_workers)
+        self.backend = backend
+        self._executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.num_threads, cache_dir, backend, artifacts_dir)
+        )
+
+    def _tune(self, pool_name: str, profile_name: str):
+        """Tune a model in this process if the device profile does not have it, so workers get its configuration."""
+        if self.backend != DEFAULT_BACKEND or not device_profile.enabled or device_profile.get(profile_name):
+            return
+        loaded = model_pool.status().get(pool_name, {}).get("loaded", False)
+        model_pool.get(pool_name)  # Loading a model tunes it
+        if not loaded:
+            model_pool.evict(pool_name)
+
+    @staticmethod
+    def _shards(items: List[str], batch_size: Optional[int]) -> List[List[str]]:
+        size = max(1, batch_size * SHARD_BATCHES) if batch_size else DEFAULT_SHARD_SIZE
+        return [items[i:i + size] for i in range(0, len(items), size)]
+
+    def _run(self, fn: Callable, tasks: List[Tuple[tuple, int]],
+             progress: Optional[Callable[[int, int], None]] = None) -> list:
+        """Submit (args, number of photos) tasks and return their results in task order."""
+        total = sum(size for _, size in tasks)
+        profile = device_profile.snapshot()
+        futures = {self._executor.submit(_task, fn, profile, *args): i for i, (args, _) in enumerate(tasks)}
+        results = [None] * len(tasks)
+        done = 0
+        if progress:
+            progress(done, total)
+        try:
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                done += tasks[i][1]
+                if progress:
+                    progress(done, total)
+        except BaseException:
+            # Cancelled or failed: drop shards that have not started yet
+            for future in futures:
+                future.cancel()
+            raise
+        return results
+
+    def predict_probabilities(self, categories_file: str, paths: List[str], batch_size: Optional[int] = None,
+                              progress: Optional[Callable[[int, int], None]] = None) -> np.ndarray:
+        """Sharded BlipCategorizer.predict_probabilities."""
+        from .blip_categorizer import MODEL_ID
+        self._tune(MODEL_ID, MODEL_ID)
+        tasks = [((categories_file, shard, batch_size), len(shard)) for shard in self._shards(paths, batch_size)]
+        return np.concatenate(self._run(_predict_probabilities, tasks, progress), axis=0)
+
+    def score_components(self, photos: Dict[str, List[str]], batch_size: Optional[int] = None,
+                         progress: Optional[Callable[[int, int], None]] = None) -> tuple:
+        """Sharded AestheticClipSelector.score_components; each photo is encoded by exactly one worker."""
+        from .photo_ranker import CLIP_MODEL_ID
+        self._tune(f"clip:{CLIP_MODEL_ID}", CLIP_MODEL_ID)
+        unique_photos = list(dict.fromkeys(photo for category_photos in photos.values() for photo in category_photos))
+        tasks = []
+        for shard in self._shards(unique_photos, batch_size):
+            members = set(shard)
+            shard_photos = {
+                category: [photo for photo in category_photos if photo in members]
+                for category, category_photos in photos.items()
+            }
+            shard_photos = {category: shard_photos[category] for category in shard_photos if shard_photos[category]}
+            tasks.append(((shard_photos, batch_size), len(shard)))
+
+        aesthetic_scores, clip_scores = {}, {category: {} for category in photos}
+        for shard_aesthetic, shard_clip in self._run(_score_components, tasks, progress):
+            aesthetic_scores.update(shard_aesthetic)
+            for category, scores in shard_clip.items():
+                clip_scores[category].update(scores)
+        return (
+            {photo: aesthetic_scores[photo] for photo in unique_photos},
+            {category: {photo: clip_scores[category][photo] for photo in category_photos}
+             for category, category_photos in photos.items()}
+        )
+
+    def image_embeddings(self, paths: List[str], batch_size: Optional[int] = None,
+                         progress: Optional[Callable[[int, int], None]] = None) -> np.ndarray:
+        """Sharded AestheticClipSelector.image_embeddings."""
+        from .photo_ranker import CLIP_MODEL_ID
+        self._tune(f"clip:{CLIP_MODEL_ID}", CLIP_MODEL_ID)
+        tasks = [((shard, batch_size), len(shard)) for shard in self._shards(paths, batch_size)]
+        return np.concatenate(self._run(_image_embeddings, tasks, progress), axis=0)
+
+    def shutdown(self):
+        """Stop the workers, dropping queued shards."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,98 +1,367 @@
+import copy
+import logging
 import os
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
+import numpy as np
 import torch
+import transformers
 from PIL import Image
-from transformers import AutoProcessor, AutoModelForVision2Seq
+from transformers import AutoProcessor, AutoModelForVision2Seq, DynamicCache
 from transformers.image_utils import load_image
 from utils.image import resize_image
-from utils.prompts import build_classification_prompt, add_description_to_prompt, build_description_prompt, add_assistant_prompt_classification
+from utils.prompts import build_prefixed_classification_prompt, add_description_to_prompt, build_description_prompt, add_assistant_prompt_classification
 from utils.parsing import process_model_responses, extract_description
+from utils.utils import load_categories
+from .autotune import DEVICE, device_profile
+from .model_pool import model_pool
 
 MODEL_NAME = "HuggingFaceTB/SmolVLM-256M-Instruct"
-DEVICE = "mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu"
+DEFAULT_BATCH_SIZE = 4  # Used until the model has been autotuned on this machine
+DESCRIPTION_MAX_NEW_TOKENS = 1024
+CLASSIFICATION_MAX_NEW_TOKENS = 64  # The answer is a category name; stop runaway generations early
+_DESCRIPTION_SLOT = "\x00description\x00"  # Stands in for the description when splitting the classification prompt
+
+logger = logging.getLogger(__name__)
 
 def load_model():
+    """Load SmolVLM and its processor, in the dtype tuned for this machine."""
     processor = AutoProcessor.from_pretrained(MODEL_NAME)
-    model = AutoModelForVision2Seq.from_pretrained(
-        MODEL_NAME,
-        torch_dtype=torch.bfloat16,
-        device_map="auto"
-    ).to(DEVICE)
-    return processor, model
+    model = AutoModelForVision2Seq.from_pretrained(MODEL_NAME, torch_dtype=torch.float32).eval()
+    prompt = processor.apply_chat_template(build_description_prompt(), add_generation_prompt=True)
+    image = Image.new("RGB", (512, 512), (127, 127, 127))
+    dtype = device_profile.resolve(
+        MODEL_NAME, model,
+        lambda n: dict(processor(images=[[image]] * n, text=[prompt] * n, return_tensors="pt", padding=True)),
+        forward=lambda m, inputs: m(**inputs).logits[:, -1]
+    )
+    return processor, model.to(DEVICE, dtype)
+
+model_pool.register(MODEL_NAME, load_model)
+
+def get_model():
+    """Get the processor and model from the shared model pool, loading them on first use."""
+    return model_pool.get(MODEL_NAME)
+
+def checkout_model():
+    """Like get_model, but the model pool does not evict the model until the `with` block exits."""
+    return model_pool.checkout(MODEL_NAME)
 
+def _load_images(photos: List[str]) -> List[list]:
+    """Decode and resize a batch of photos, one image list per prompt."""
+    return [[resize_image(load_image(photo))] for photo in photos]
 
-def describe_photos(photos: List[str], batch_size: int = 4) -> Dict[str, str]:
+def _describe_batch(processor, model, images: List[list]) -> List[str]:
+    """Describe a batch of decoded images."""
+    prompt = add_description_to_prompt(
+        processor.apply_chat_template(build_description_prompt(), add_generation_prompt=True)
+    )
+    # only saved model outputs text
+    inputs = processor(images=images, text=[prompt] * len(images), return_tensors="pt", padding=True).to(DEVICE, dtype=model.dtype)
+    outputs = model.generate(**inputs, max_new_tokens=DESCRIPTION_MAX_NEW_TOKENS, repetition_penalty=1.2)
+    responses = processor.batch_decode(outputs, skip_special_tokens=True)
+    return [extract_description(response) for response in responses]
+
+def describe_photos(photos: List[str], batch_size: Optional[int] = None) -> Dict[str, str]:
     """
     Describe photos.
     """
-    processor, model = load_model()
-    prompt = build_description_prompt()
-    out = {}
+    with checkout_model() as (processor, model):
+        batch_size = batch_size or device_profile.batch_size(MODEL_NAME, DEFAULT_BATCH_SIZE)
+        out = {}
 
-    # process photos in batches
-    for i in range(0, len(photos), batch_size):
-        batch_photos = photos[i:i+batch_size]
-        messages = [prompt] * len(batch_photos)
-        images = [[resize_image(load_image(photo))] for photo in batch_photos]  
-
-        prompts = [
-            add_description_to_prompt(
-                processor.apply_chat_template(message, add_generation_prompt=True)
-            ) 
-            for message in messages
-        ]   
-        # only saved model outputs text
-        inputs = processor(images=images, text=prompts, return_tensors="pt", padding=True).to(DEVICE, dtype=torch.float32)
-        outputs = model.generate(**inputs, max_new_tokens=1024, repetition_penalty=1.2)
-        responses = processor.batch_decode(outputs, skip_special_tokens=True)
-        for response, photo in zip(responses, batch_photos):
-            description = extract_description(response)
-            out[photo] = description
-            print(description)
+        # process photos in batches
+        for i in range(0, len(photos), batch_size):
+            batch_photos = photos[i:i+batch_size]
+            for photo, description in zip(batch_photos, _describe_batch(processor, model, _load_images(batch_photos))):
+                out[photo] = description
+                logger.debug("%s: %s", photo, description)
 
-    return out
+        return out
+
+def _classification_prompt_parts(processor, categories: str) -> tuple:
+    """
+    Split the chat-formatted classification prompt around the image and the description.
+
+    Returns:
+        Tuple of the prefix shared by all photos, the text from the image token up to the
+        description, and the text after the description
+    """
+    prompt = add_assistant_prompt_classification(
+        processor.apply_chat_template(
+            build_prefixed_classification_prompt(categories, _DESCRIPTION_SLOT),
+            add_generation_prompt=True
+        )
+    )
+    image_token = str(getattr(processor, "image_token", "<image>"))
+    prefix, rest = prompt.split(image_token, 1)
+    before, after = rest.split(_DESCRIPTION_SLOT)
+    return prefix, image_token + before, after
+
+def _image_features(model, pixel_values: torch.Tensor, pixel_attention_mask: Optional[torch.Tensor]) -> torch.Tensor:
+    """
+    Features SmolVLM puts in place of the image tokens: the vision encoder followed by the connector.
+
+    Transformers computes them inside the model's forward pass, where they are only merged
+    into the prompt when the KV cache is empty, so they are computed here for prompts that
+    continue a cached prefix. Newer versions expose this as `get_image_features`; older ones
+    (such as 4.49) get the same steps as their forward pass.
+
+    Raises:
+        RuntimeError: If the installed transformers lays out the model differently
+    """
+    vlm = model.model
+    if not hasattr(vlm, "inputs_merger"):
+        raise RuntimeError(
+            f"Classifying after a cached prompt prefix is not supported with transformers {transformers.__version__}: "
+            f"{type(vlm).__name__} has no inputs_merger"
+        )
+    if hasattr(vlm, "get_image_features"):
+        return vlm.get_image_features(pixel_values, pixel_attention_mask)
+    if not (hasattr(vlm, "vision_model") and hasattr(vlm, "connector")):
+        raise RuntimeError(
+            f"Classifying after a cached prompt prefix is not supported with transformers {transformers.__version__}: "
+            f"{type(vlm).__name__} has neither get_image_features nor a vision_model and connector"
+        )
+
+    batch, num_images = pixel_values.shape[:2]
+    pixel_values = pixel_values.to(dtype=vlm.dtype).view(batch * num_images, *pixel_values.shape[2:])
+    # Padding images are all zeros
+    real_images = (pixel_values == 0.0).sum(dim=(-1, -2, -3)) != pixel_values.shape[1:].numel()
+    pixel_values = pixel_values[real_images].contiguous()
+    if pixel_attention_mask is None:
+        pixel_attention_mask = torch.ones(
+            (pixel_values.size(0), pixel_values.size(2), pixel_values.size(3)), dtype=torch.bool, device=pixel_values.device
+        )
+    else:
+        pixel_attention_mask = pixel_attention_mask.view(batch * num_images, *pixel_attention_mask.shape[2:])
+        pixel_attention_mask = pixel_attention_mask[real_images].contiguous()
+    patch_size = vlm.config.vision_config.patch_size
+    patches = pixel_attention_mask.unfold(1, patch_size, patch_size).unfold(2, patch_size, patch_size)
+    patch_attention_mask = (patches.sum(dim=(-1, -2)) > 0).bool()
+    hidden_states = vlm.vision_model(pixel_values=pixel_values, patch_attention_mask=patch_attention_mask).last_hidden_state
+    return vlm.connector(hidden_states)
+
+def _suffix_embeddings(model, inputs) -> List[tuple]:
+    """
+    Token ids and input embeddings of each photo's prompt suffix, with the image features
+    in place of its image tokens.
+
+    Args:
+        model: SmolVLM
+        inputs: Processor output for the suffixes, with "input_ids", "attention_mask",
+            "pixel_values" and optionally "pixel_attention_mask"
+    """
+    with torch.no_grad():
+        features = _image_features(model, inputs["pixel_values"], inputs.get("pixel_attention_mask"))
+        embeds = model.get_input_embeddings()(inputs["input_ids"])
+        embeds = model.model.inputs_merger(inputs["input_ids"], embeds, features)
+    rows = []
+    for ids, mask, row_embeds in zip(inputs["input_ids"], inputs["attention_mask"].bool(), embeds):
+        rows.append((ids[mask].tolist(), row_embeds[mask]))
+    return rows
+
+def _penalize(logits: torch.Tensor, history: List[List[int]], penalty: float) -> torch.Tensor:
+    """Apply the repetition penalty of `generate` to the next-token logits of each row."""
+    for row, ids in enumerate(history):
+        index = torch.tensor(sorted(set(ids)), device=logits.device)
+        scores = logits[row, index]
+        logits[row, index] = torch.where(scores < 0, scores * penalty, scores / penalty)
+    return logits
+
+def _generate_after_prefix(model, prefix_cache, prefix_ids: List[int], rows: List[tuple],
+                           max_new_tokens: int, eos_token_ids: set, repetition_penalty: float = 1.0) -> List[List[int]]:
+    """
+    Greedily generate after a cached prefix for a batch of suffixes of different lengths.
+
+    Suffixes are right-aligned so the newly generated tokens line up, and the padding
+    between the prefix and the shorter suffixes is masked out. Each row gets its own
+    position ids, so its suffix continues right after the prefix as if it had not been
+    padded, and the output matches generating from the unpadded prompt.
+
+    Args:
+        model: Causal language model accepting input embeddings, position ids and a KV cache
+        prefix_cache: KV cache of `prefix_ids` for a batch of one; it is not modified
+        prefix_ids: Token ids of the shared prefix
+        rows: Token ids and input embeddings of each suffix
+        max_new_tokens: Maximum number of tokens to generate per row
+        eos_token_ids: Token ids ending a row's generation
+        repetition_penalty: Penalty for tokens already in the prompt or the generated text
+
+    Returns:
+        Generated token ids of each row, up to and including the end token
+    """
+    batch, prefix_length = len(rows), len(prefix_ids)
+    width = max(len(ids) for ids, _ in rows)
+    embeds = rows[0][1].new_zeros((batch, width, rows[0][1].shape[-1]))
+    attention_mask = torch.zeros((batch, prefix_length + width), dtype=torch.long, device=embeds.device)
+    attention_mask[:, :prefix_length] = 1
+    for row, (ids, row_embeds) in enumerate(rows):
+        embeds[row, width - len(ids):] = row_embeds
+        attention_mask[row, prefix_length + width - len(ids):] = 1
+    position_ids = prefix_length - 1 + attention_mask[:, prefix_length:].cumsum(1)
+
+    cache = copy.deepcopy(prefix_cache)
+    cache.batch_repeat_interleave(batch)
+    history = [list(prefix_ids) + list(ids) for ids, _ in rows]
+    generated = [[] for _ in rows]
+    finished = [False] * batch
+    with torch.no_grad():
+        logits = model(inputs_embeds=embeds, attention_mask=attention_mask, position_ids=position_ids,
+                       past_key_values=cache, use_cache=True).logits[:, -1]
+        for _ in range(max_new_tokens):
+            tokens = _penalize(logits.float(), history, repetition_penalty).argmax(-1)
+            for row, token in enumerate(tokens.tolist()):
+                if not finished[row]:
+                    generated[row].append(token)
+                    history[row].append(token)
+                    finished[row] = token in eos_token_ids
+            if all(finished):
+                break
+            attention_mask = torch.cat([attention_mask, attention_mask.new_ones((batch, 1))], dim=1)
+            position_ids = position_ids[:, -1:] + 1
+            logits = model(input_ids=tokens[:, None], attention_mask=attention_mask, position_ids=position_ids,
+                           past_key_values=cache, use_cache=True).logits[:, -1]
+    return generated
+
+def _encode_prefix(processor, model, categories: str) -> tuple:
+    """
+    Encode the part of the classification prompt shared by all photos.
 
-def from_description_to_category(descriptions: Dict[str, str], categories: str, batch_size: int = 4) -> Dict[str, str]:
+    Returns:
+        Tuple of the prefix token ids, their KV cache, the suffix text before and after
+        the description, and the token ids ending generation
+    """
+    prefix, before_description, after_description = _classification_prompt_parts(processor, categories)
+    prefix_ids = processor.tokenizer(prefix, return_tensors="pt")["input_ids"].to(DEVICE)
+    with torch.no_grad():
+        prefix_cache = model(
+            input_ids=prefix_ids, attention_mask=torch.ones_like(prefix_ids),
+            past_key_values=DynamicCache(), use_cache=True
+        ).past_key_values
+    eos_token_ids = model.generation_config.eos_token_id
+    if not isinstance(eos_token_ids, list):
+        eos_token_ids = [eos_token_ids]
+    return prefix_ids[0].tolist(), prefix_cache, before_description, after_description, set(eos_token_ids)
+
+def _classify_batch(processor, model, prefix: tuple, images: List[list], descriptions: List[str],
+                    categories: str) -> List[int]:
+    """Category numbers of a batch of decoded images with their descriptions, after the prefix from _encode_prefix."""
+    prefix_ids, prefix_cache, before_description, after_description, eos_token_ids = prefix
+    texts = [before_description + description + after_description for description in descriptions]
+    inputs = processor(images=images, text=texts, return_tensors="pt", padding=True,
+                       add_special_tokens=False).to(DEVICE, dtype=model.dtype)
+    outputs = _generate_after_prefix(
+        model, prefix_cache, prefix_ids, _suffix_embeddings(model, inputs),
+        CLASSIFICATION_MAX_NEW_TOKENS, eos_token_ids, repetition_penalty=1.2
+    )
+    responses = processor.batch_decode(outputs, skip_special_tokens=True)
+    for response in responses:
+        logger.debug("Classification: %s", response)
+    return [process_model_responses([response], categories) for response in responses]
+
+def from_description_to_category(descriptions: Dict[str, str], categories: str,
+                                 batch_size: Optional[int] = None) -> Dict[str, int]:
     """
     Convert a description to a category number. Given a description and a list of categories,
     use the VLM model to classify the description into a category number.
 
+    Every prompt starts with the same chat template and category list, followed by the
+    image and its description. The KV cache of that prefix is computed once and copied
+    into each batch, so only the image and the description are encoded per photo.
+    describe_and_categorize does both passes without decoding the photos twice.
+
     Args:
         descriptions: Dictionary of photo path and the description
         categories: String containing numbered list of categories
+        batch_size: Number of photos to process in each batch; None uses the size tuned for this machine
 
     Returns:
         out: Dictionary of photo path and the category it is classified into
     """
-    processor, model = load_model()
-    out = {}
+    with checkout_model() as (processor, model):
+        batch_size = batch_size or device_profile.batch_size(MODEL_NAME, DEFAULT_BATCH_SIZE)
+        out = {}
+        if not descriptions:
+            return out
+        prefix = _encode_prefix(processor, model, categories)
 
-    # process descriptions in batches
-    photo_paths = list(descriptions.keys())
-    for i in range(0, len(photo_paths), batch_size):
-        batch_photos = photo_paths[i:i+batch_size]
-        images = [[resize_image(load_image(photo))] for photo in batch_photos]
-        prompts = [
-            add_assistant_prompt_classification(
-                processor.apply_chat_template(
-                    build_classification_prompt(categories, descriptions[photo]),
-                    add_generation_prompt=True
-                )
+        # process photos in batches
+        photo_paths = list(descriptions.keys())
+        for i in range(0, len(photo_paths), batch_size):
+            batch_photos = photo_paths[i:i+batch_size]
+            category_numbers = _classify_batch(
+                processor, model, prefix, _load_images(batch_photos),
+                [descriptions[photo] for photo in batch_photos], categories
             )
-            for photo in batch_photos
-        ]
-        inputs = processor(text=prompts, 
-                           images=images, 
-                           return_tensors="pt", padding=True).to(DEVICE, dtype=torch.float32)
-        inputs_length = inputs.input_ids.shape[1]
-        outputs = model.generate(**inputs, max_new_tokens=1024, repetition_penalty=1.2)
-        responses = processor.batch_decode(outputs[:, inputs_length:], skip_special_tokens=True)
-        for response, photo in zip(responses, batch_photos):
-            print(response)
-            category = process_model_responses([response], categories)
-            out[photo] = category
+            out.update(zip(batch_photos, category_numbers))
+        return out
+
+def describe_and_categorize(photos: List[str], categories: str, batch_size: Optional[int] = None,
+                            progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, dict]:
+    """
+    Describe photos and classify them from their image and description, with one model load.
+
+    Each batch of photos is decoded once, described, and classified from the same images
+    right away, after the shared prompt prefix encoded once for all batches.
+
+    Args:
+        photos: Paths of the photos
+        categories: String containing numbered list of categories
+        batch_size: Number of photos to process in each batch; None uses the size tuned for this machine
+        progress: Optional function called with (photos done, total photos) after each batch
+
+    Returns:
+        Dictionary mapping photo paths to their description and category number
+    """
+    out = {}
+    if progress:
+        progress(0, len(photos))
+    if not photos:
+        return out
+    with checkout_model() as (processor, model):
+        batch_size = batch_size or device_profile.batch_size(MODEL_NAME, DEFAULT_BATCH_SIZE)
+        prefix = _encode_prefix(processor, model, categories)
+        for i in range(0, len(photos), batch_size):
+            batch_photos = photos[i:i+batch_size]
+            images = _load_images(batch_photos)
+            descriptions = _describe_batch(processor, model, images)
+            category_numbers = _classify_batch(processor, model, prefix, images, descriptions, categories)
+            for photo, description, category_number in zip(batch_photos, descriptions, category_numbers):
+                logger.debug("%s: %s -> %d", photo, description, category_number)
+                out[photo] = {"description": description, "categoryNumber": category_number}
+            if progress:
+                progress(min(i + batch_size, len(photos)), len(photos))
     return out
 
+class SmolVLMCategorizer:
+    def __init__(self, categories_file: str):
+        """
+        Categorizer with the interface of BlipCategorizer that describes and classifies photos with SmolVLM.
+
+        Slower than BLIP, but it reads each photo's content before choosing its category.
+
+        Args:
+            categories_file: Path to text file containing numbered categories
+        """
+        with open(categories_file, 'r') as f:
+            self.categories = f.read()
+        self.num_categories = len(load_categories(categories_file))
+
+    def predict_probabilities(self, image_paths: List[str], batch_size: Optional[int] = None,
+                              progress: Optional[Callable[[int, int], None]] = None) -> np.ndarray:
+        """
+        One-hot category probabilities of the photos, with column 0 for photos matching no category.
+
+        Returns:
+            Array of shape (len(image_paths), number of categories + 1)
+        """
+        results = describe_and_categorize(image_paths, self.categories, batch_size, progress)
+        probs = np.zeros((len(image_paths), self.num_categories), dtype=np.float32)
+        for row, photo in enumerate(image_paths):
+            category_number = results[photo]["categoryNumber"]
+            probs[row, category_number if 0 < category_number < self.num_categories else 0] = 1.0
+        return probs
+
 def save_results(results: Dict[str, int], output_file: str):
     """
     Save the results to a JSON file.
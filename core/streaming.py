@@ -0,0 +1,196 @@
+import os
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from .album_state import AlbumState, ALBUM_STATE_FILE
+from .blip_categorizer import assign_categories
+from .photo_dumper import PhotoDumper, state_signature
+from .photo_ranker import combine_scores, select_top_photos
+from .progress import ProgressTracker, ProgressCallback
+from utils.streaming import Journal, TopK, chunked, count_images, iter_images
+from utils.telemetry import images_processed
+from utils.timing import stage_timer
+from utils.utils import load_categories
+
+STREAM_JOURNAL_FILE = "stream_journal.jsonl"
+STREAM_CHUNK_SIZE = 256  # Photos read, scored and journaled at a time
+
+# Photo path -> (size, mtime_ns, category index, probability of that category)
+Categorized = Dict[str, Tuple[int, int, int, float]]
+# Photo path -> {category: (aesthetic score, CLIP score)}
+Scored = Dict[str, Dict[str, Tuple[float, float]]]
+
+
+class StreamingPhotoDumper(PhotoDumper):
+    """
+    PhotoDumper for albums too large to hold in memory, such as whole camera-roll exports.
+
+    The album, followed by `sources`, is read lazily in chunks of STREAM_CHUNK_SIZE
+    photos. Each chunk's results are appended to a JSONL journal in `output_dir` as
+    soon as they exist. Images, embeddings and probabilities are never held for more
+    than a chunk, and candidates and the final selection are kept in bounded heaps of
+    `pre_filter` and `keep_top_k` photos per category.
+
+    Memory is not constant in the album size, though: the path, size, modification
+    time and best category of every photo, the set of photos still present and the
+    scores of every candidate are kept in dictionaries, a few hundred bytes per photo
+    (some 300 MB for a million photos).
+
+    Re-running after a crash or interruption replays the journal and only processes
+    photos it does not cover, or whose size or modification time changed. Duplicate
+    detection and the ranking cascade need the whole album at once and are skipped, and
+    the per-photo JSON files of PhotoDumper are replaced by the journal.
+    """
+
+    def _run(self, progress_callback: Optional[ProgressCallback]):
+        categories = load_categories(self.categories_file)
+        journal = Journal(os.path.join(self.output_dir, STREAM_JOURNAL_FILE), {
+            "signature": state_signature(self.backend, self.categorizer_model),
+            "categories": list(categories.values()),
+        })
+        categorized, scored = self._replay(journal) if self.incremental else ({}, {})
+        journal.open(self._records(categorized, scored))
+        try:
+            # Step 1: Categorize photos the journal does not cover
+            present = self._categorize(journal, categorized, scored, categories, progress_callback)
+
+            # Step 2: Keep the most likely `pre_filter` photos of each category
+            with stage_timer.stage("grouping"):
+                candidates = self._candidates(categorized, present, categories)
+            ProgressTracker("group", progress_callback).update(len(present), len(present))
+
+            # Step 3: Score candidates without journaled scores
+            self._score(journal, candidates, scored, ProgressTracker("rank", progress_callback))
+        finally:
+            journal.close()
+
+        # Step 4: Rank from the journaled scores, keeping only `keep_top_k` photos per category in memory
+        with stage_timer.stage("ranking"):
+            ranked_categories = select_top_photos(
+                {category: self._top_photos(photos, category, scored) for category, photos in candidates.items()},
+                self.keep_top_k,
+                save_path=os.path.join(self.output_dir, "ranked_categories.json")
+            )
+
+        # Drop records of photos that left the album, now that the run is complete
+        journal.open(self._records(
+            {path: entry for path, entry in categorized.items() if path in present},
+            {path: entry for path, entry in scored.items() if path in present}
+        ))
+        journal.close()
+
+        # Step 5: Index the scored photos for free-text search from the embeddings ranking cached
+        if self.search_index:
+            with stage_timer.stage("index"):
+                self._build_search_index([path for path in scored if path in present],
+                                         ProgressTracker("index", progress_callback))
+
+        # Step 6: Link or copy selected photos into category folders
+        state = AlbumState.load(
+            os.path.join(self.output_dir, ALBUM_STATE_FILE), state_signature(self.backend, self.categorizer_model)
+        )
+        with stage_timer.stage("copy"):
+            self._sync_output(ranked_categories, state, ProgressTracker("copy", progress_callback))
+        state.save()
+        return ranked_categories
+
+    @staticmethod
+    def _replay(journal: Journal) -> Tuple[Categorized, Scored]:
+        """Results of earlier runs, later records of a photo replacing earlier ones."""
+        categorized, scored = {}, {}
+        for record in journal.replay():
+            path = record["path"]
+            if record["type"] == "categorized":
+                categorized[path] = (record["size"], record["mtime_ns"], record["category"], record["probability"])
+                scored.pop(path, None)  # Scores of an older version of the file
+            elif record["type"] == "scored" and path in categorized:
+                scored.setdefault(path, {})[record["category"]] = (record["aesthetic"], record["clip"])
+        return categorized, scored
+
+    @staticmethod
+    def _records(categorized: Categorized, scored: Scored) -> Iterator[dict]:
+        for path, (size, mtime_ns, category, probability) in categorized.items():
+            yield {"type": "categorized", "path": path, "size": size, "mtime_ns": mtime_ns,
+                   "category": category, "probability": probability}
+        for path, scores in scored.items():
+            for category, (aesthetic, clip) in scores.items():
+                yield {"type": "scored", "path": path, "category": category, "aesthetic": aesthetic, "clip": clip}
+
+    def _categorize(self, journal: Journal, categorized: Categorized, scored: Scored, categories: Dict[int, str],
+                    progress_callback: Optional[ProgressCallback]) -> Set[str]:
+        """Categorize new and changed photos chunk by chunk, journaling each chunk; returns every photo in the album."""
+        progress = ProgressTracker("categorize", progress_callback)
+        total = count_images(self.album_path) + len(self.sources)
+        present = set()
+        done = 0
+        for chunk in chunked(self._iter_photos(), STREAM_CHUNK_SIZE):
+            stats = {}
+            for path, stat in chunk:
+                present.add(path)
+                entry = categorized.get(path)
+                if entry is None or entry[:2] != (stat.st_size, stat.st_mtime_ns):
+                    stats[path] = stat
+            images_processed.inc(len(chunk), stage="album")
+            progress.skip(len(chunk) - len(stats))
+            if stats:
+                paths = list(stats)
+                with stage_timer.stage("categorize"):
+                    probabilities = self._predict_probabilities(paths, progress.part(done, total))
+                images_processed.inc(len(paths), stage="categorize")
+                for path, result in assign_categories(paths, probabilities, categories).items():
+                    entry = (stats[path].st_size, stats[path].st_mtime_ns, result["categoryNumber"], result["probability"])
+                    categorized[path] = entry
+                    scored.pop(path, None)
+                    journal.append({"type": "categorized", "path": path, "size": entry[0], "mtime_ns": entry[1],
+                                    "category": entry[2], "probability": entry[3]})
+                journal.flush()
+            done += len(chunk)
+            progress.update(min(done, total), total)
+        return present
+
+    def _iter_photos(self) -> Iterator[Tuple[str, os.stat_result]]:
+        """Lazily yield (path, stat) of the photos in the album, then of `sources` that still exist."""
+        yield from iter_images(self.album_path)
+        for path in self.sources:
+            try:
+                yield path, os.stat(path)
+            except FileNotFoundError:
+                continue
+
+    def _candidates(self, categorized: Categorized, present: Set[str],
+                    categories: Dict[int, str]) -> Dict[str, List[str]]:
+        """The `pre_filter` most likely photos of each real category, by descending probability."""
+        heaps: Dict[str, TopK] = {}
+        for path, (_, _, category, probability) in categorized.items():
+            if path in present and categories[category] != "None":
+                heaps.setdefault(categories[category], TopK(self.pre_filter)).add(path, probability)
+        return {category: [path for path, _ in heap.items()] for category, heap in heaps.items()}
+
+    def _score(self, journal: Journal, candidates: Dict[str, List[str]], scored: Scored, progress: ProgressTracker):
+        """Score candidates chunk by chunk with the full scorer, journaling each chunk."""
+        unscored = [
+            (category, path) for category, photos in candidates.items()
+            for path in photos if category not in scored.get(path, {})
+        ]
+        done = 0
+        for chunk in chunked(unscored, STREAM_CHUNK_SIZE):
+            photos: Dict[str, List[str]] = {}
+            for category, path in chunk:
+                photos.setdefault(category, []).append(path)
+            with stage_timer.stage("score"):
+                aesthetic_scores, clip_scores = self._score_components(photos, progress.part(done, len(unscored)))
+            images_processed.inc(len(aesthetic_scores), stage="score")
+            for category, path in chunk:
+                scores = (aesthetic_scores[path], clip_scores[category][path])
+                scored.setdefault(path, {})[category] = scores
+                journal.append({"type": "scored", "path": path, "category": category,
+                                "aesthetic": scores[0], "clip": scores[1]})
+            journal.flush()
+            done += len(chunk)
+        progress.update(len(unscored), len(unscored))
+
+    def _top_photos(self, photos: List[str], category: str, scored: Scored) -> List[tuple]:
+        top = TopK(self.keep_top_k)
+        for path in photos:
+            aesthetic, clip = scored[path][category]
+            top.add(path, combine_scores(aesthetic, clip, self.aesthetic_weight))
+        return top.items()
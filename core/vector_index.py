@@ -0,0 +1,124 @@
+import os
+import uuid
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+SEARCH_INDEX_FILE = "search_index.npz"
+IVF_MIN_SIZE = 20000  # Below this many photos an exact scan takes only a few milliseconds
+DEFAULT_NPROBE = 8    # Inverted lists scanned per query
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLES_PER_LIST = 256
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _spherical_kmeans(vectors: np.ndarray, num_lists: int, iterations: int = KMEANS_ITERATIONS,
+                      seed: int = 0) -> np.ndarray:
+    """Cluster unit vectors by cosine similarity; trains on a sample to bound the cost."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), num_lists * KMEANS_SAMPLES_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, num_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = (sample @ centroids.T).argmax(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        counts = np.bincount(assignment, minlength=num_lists)
+        empty = counts == 0
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]  # Re-seed empty lists
+        centroids = _normalize(sums)
+    return centroids
+
+
+class VectorIndex:
+    def __init__(self, ids: List[str], vectors: np.ndarray, num_lists: Optional[int] = None):
+        """
+        Cosine-similarity index over photo embeddings.
+
+        Small albums are searched exactly with one matrix-vector product. From
+        IVF_MIN_SIZE photos on, vectors are grouped into inverted lists around
+        k-means centroids and a query only scans the lists closest to it.
+
+        Args:
+            ids: Identifier (photo path) of each vector
+            vectors: Embeddings of shape (len(ids), dim); they are normalized here
+            num_lists: Number of inverted lists; None picks sqrt(len(ids)) for large
+                albums and an exact index otherwise, 0 forces an exact index
+        """
+        if len(ids) != len(vectors):
+            raise ValueError(f"Got {len(ids)} ids for {len(vectors)} vectors")
+        vectors = _normalize(vectors).reshape(len(ids), -1)
+        if num_lists is None:
+            num_lists = int(np.sqrt(len(ids))) if len(ids) >= IVF_MIN_SIZE else 0
+        num_lists = min(num_lists, len(ids))
+
+        self.centroids = None
+        self.offsets = None
+        ids = np.asarray(ids, dtype=str)
+        if num_lists > 0:
+            self.centroids = _spherical_kmeans(vectors, num_lists)
+            assignment = (vectors @ self.centroids.T).argmax(axis=1)
+            order = np.argsort(assignment, kind="stable")
+            vectors, ids = vectors[order], ids[order]
+            # Vectors of list i are vectors[offsets[i]:offsets[i + 1]]
+            self.offsets = np.searchsorted(assignment[order], np.arange(num_lists + 1))
+        self.ids = ids
+        self.vectors = vectors
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: np.ndarray, k: int = 20, nprobe: int = DEFAULT_NPROBE) -> List[Tuple[str, float]]:
+        """
+        Find the vectors most similar to a query.
+
+        Args:
+            query: Query embedding of shape (dim,)
+            k: Number of results
+            nprobe: Number of inverted lists to scan; ignored by exact indexes
+
+        Returns:
+            Up to k (id, cosine similarity) tuples, best first
+        """
+        query = _normalize(query).reshape(-1)
+        if self.centroids is None:
+            candidates = None
+            scores = self.vectors @ query
+        else:
+            nprobe = min(nprobe, len(self.centroids))
+            lists = np.argpartition(self.centroids @ query, -nprobe)[-nprobe:]
+            candidates = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in lists])
+            scores = self.vectors[candidates] @ query
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        rows = top if candidates is None else candidates[top]
+        return [(str(self.ids[row]), float(scores[i])) for row, i in zip(rows, top)]
+
+    def save(self, path: str):
+        """Write the index to an .npz file, atomically."""
+        arrays = {"ids": self.ids, "vectors": self.vectors}
+        if self.centroids is not None:
+            arrays.update(centroids=self.centroids, offsets=self.offsets)
+        temp_path = f"{path}.{uuid.uuid4().hex}.part.npz"
+        np.savez(temp_path, **arrays)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "VectorIndex":
+        """Read an index written by `save`."""
+        with np.load(path) as data:
+            index = cls.__new__(cls)
+            index.ids = data["ids"]
+            index.vectors = data["vectors"]
+            index.centroids = data["centroids"] if "centroids" in data else None
+            index.offsets = data["offsets"] if "offsets" in data else None
+        return index
@@ -92,6 +92,7 @@ class App {
         this.websocket.connect();
         const filesCount = await this.fileHandler.loadExistingPhotos();
         this.updateStartButton();
+        await this.resultsHandler.loadSelection();
     }
 
     updateStartButton() {
@@ -153,25 +154,15 @@ class App {
         }
     }
 
-    async downloadResults() {
-        try {
-            const response = await fetch('/download');
-            if (!response.ok) throw new Error('Download failed');
-            
-            const blob = await response.blob();
-            const url = window.URL.createObjectURL(blob);
-            const a = document.createElement('a');
-            a.style.display = 'none';
-            a.href = url;
-            a.download = "images.zip";
-            document.body.appendChild(a);
-            a.click();
-            document.body.removeChild(a);
-            window.URL.revokeObjectURL(url);
-        } catch (error) {
-            console.error('Download error:', error);
-            UIManager.showNotification('Failed to download results', 'error');
-        }
+    downloadResults() {
+        // Let the browser stream the ZIP straight to disk instead of buffering it in a Blob
+        const a = document.createElement('a');
+        a.style.display = 'none';
+        a.href = '/download';
+        a.download = 'images.zip';
+        document.body.appendChild(a);
+        a.click();
+        document.body.removeChild(a);
     }
 
     handleBeforeUnload(event) {
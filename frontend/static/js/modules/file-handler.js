@@ -47,7 +47,7 @@ export class FileHandler {
             const data = await response.json();
             data.files.forEach(filename => {
                 if (!document.querySelector(`[data-filename="${filename}"]`)) {
-                    this.displayPreviewFromPath(`/uploads/${filename}`);
+                    this.displayPreviewFromPath(`/uploads/${filename}`, data.hashes?.[filename]);
                 }
             });
 
@@ -66,8 +66,12 @@ export class FileHandler {
         }
     }
 
-    displayPreviewFromPath(path) {
+    displayPreviewFromPath(path, hash = null) {
         const filename = path.split('/').pop();
+        // Grid tiles and the modal use server-side derivatives; pinning the URL to the
+        // content hash lets the browser cache them without revalidating
+        const version = hash ? `?v=${hash}` : '';
+        const fullSrc = `/thumbnails/large/${encodeURIComponent(filename)}${version}`;
         const imgContainer = document.createElement('div');
         imgContainer.className = 'img-container preview';
         imgContainer.dataset.filename = filename;
@@ -81,11 +85,13 @@ export class FileHandler {
         };
         
         const img = document.createElement('img');
-        img.src = path;
+        img.src = `/thumbnails/small/${encodeURIComponent(filename)}${version}`;
+        img.dataset.full = fullSrc;
         img.alt = filename;
         img.loading = 'lazy';
+        img.decoding = 'async';
         img.onclick = () => {
-            const event = new CustomEvent('openModal', { detail: { src: path } });
+            const event = new CustomEvent('openModal', { detail: { src: fullSrc } });
             document.dispatchEvent(event);
         };
         
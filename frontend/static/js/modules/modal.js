@@ -74,7 +74,7 @@ export class ModalManager {
             ? document.getElementById('preview-grid')
             : document.getElementById('results-grid');
         
-        this.modalImages = Array.from(container.querySelectorAll('img')).map(img => img.src);
+        this.modalImages = Array.from(container.querySelectorAll('img')).map(img => img.dataset.full || img.src);
         this.currentModalImageIndex = this.modalImages.indexOf(imageSrc);
         
         const img = new Image();
@@ -32,12 +32,16 @@ export class ResultsHandler {
                 
                 const img = document.createElement('img');
                 const filename = photoPath.split('/').pop();
-                img.src = `/uploads/${filename}`;
+                // Photos of registered folders are looked up by path; uploads by name
+                const query = `?path=${encodeURIComponent(photoPath)}`;
+                img.src = `/thumbnails/medium/${encodeURIComponent(filename)}${query}`;
+                img.dataset.full = `/thumbnails/large/${encodeURIComponent(filename)}${query}`;
                 img.alt = `${category} - ${filename}`;
                 img.loading = 'lazy';
+                img.decoding = 'async';
                 img.onclick = () => {
                     const event = new CustomEvent('openModal', { 
-                        detail: { src: img.src }
+                        detail: { src: img.dataset.full }
                     });
                     document.dispatchEvent(event);
                 };
@@ -53,6 +57,21 @@ export class ResultsHandler {
         document.getElementById('download-button').disabled = false;
     }
 
+    async loadSelection() {
+        // Show the selection of the last run, e.g. after a page reload
+        try {
+            const response = await fetch('/selection');
+            if (!response.ok) return;
+            const selection = await response.json();
+            const results = Object.fromEntries(
+                Object.entries(selection.categories).map(([category, photos]) => [category, photos.map(photo => photo.source)])
+            );
+            if (Object.values(results).some(photos => photos.length)) this.displayResults(results);
+        } catch (error) {
+            console.error('Selection load error:', error);
+        }
+    }
+
     async startProcessing(categories) {
         if (this.processing) {
             const event = new CustomEvent('notification', {
@@ -73,7 +92,8 @@ export class ResultsHandler {
             });
 
             if (!response.ok) throw new Error('Processing failed');
-            const results = await response.json();
+            const { job_id: jobId } = await response.json();
+            const results = await this.waitForJob(jobId);
             this.displayResults(results);
         } catch (error) {
             console.error('Processing error:', error);
@@ -87,6 +107,19 @@ export class ResultsHandler {
         }
     }
 
+    async waitForJob(jobId, intervalMs = 2000) {
+        // The WebSocket usually delivers results first; polling covers dropped connections
+        while (true) {
+            const response = await fetch(`/jobs/${jobId}/result`);
+            if (response.status === 200) return response.json();
+            if (response.status !== 202) {
+                const data = await response.json().catch(() => ({}));
+                throw new Error(data.error || 'Processing failed');
+            }
+            await new Promise(resolve => setTimeout(resolve, intervalMs));
+        }
+    }
+
     updateStatus(data) {
         switch (data.status) {
             case 'categorizing':
@@ -97,6 +130,11 @@ export class ResultsHandler {
             case 'processing':
                 this.statusText.textContent = 'Processing and ranking photos...';
                 break;
+
+            case 'progress':
+                this.processingSection.classList.remove('hidden');
+                this.statusText.textContent = this.formatProgress(data);
+                break;
                 
             case 'complete':
                 this.processingSection.classList.add('hidden');
@@ -129,6 +167,27 @@ export class ResultsHandler {
         }
     }
 
+    formatProgress({ stage, done, total, images_per_sec: rate, eta_seconds: eta }) {
+        const labels = {
+            dedupe: 'Finding duplicates',
+            categorize: 'Categorizing photos',
+            group: 'Grouping photos',
+            screen: 'Screening candidates',
+            rank: 'Ranking photos',
+            index: 'Indexing for search',
+            copy: 'Saving selection'
+        };
+        let text = `${labels[stage] || stage}: ${done}/${total}`;
+        if (rate) text += ` (${rate.toFixed(1)} img/s`;
+        if (rate && eta !== null && done < total) {
+            const minutes = Math.floor(eta / 60);
+            const seconds = Math.round(eta % 60);
+            text += `, ~${minutes ? `${minutes}m ` : ''}${seconds}s left`;
+        }
+        if (rate) text += ')';
+        return text;
+    }
+
     reset() {
         this.hasResults = false;
         this.processing = false;
@@ -1,22 +1,52 @@
 import os
 import shutil
 import json
-import zipfile
-from io import BytesIO
+import asyncio
+import threading
 from datetime import datetime
 from typing import List, Dict
 from pathlib import Path
 
 from fastapi import FastAPI, UploadFile, File, Form, WebSocket, WebSocketDisconnect, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-
-from core.photo_dumper import PhotoDumper
+from fastapi.concurrency import run_in_threadpool
+
+from core.photo_dumper import PhotoDumper, DEFAULT_CATEGORIZER_MODEL
+from core.photo_ranker import encode_clip_text
+from core.model_pool import model_pool
+from core.embedding_cache import EmbeddingCache, MemoryEmbeddingCache
+from core.vector_index import VectorIndex, SEARCH_INDEX_FILE
+from core.sharding import ShardPool
+from core.autotune import PROFILE_FILE, device_profile
 from utils.cleanup import remove_temp_files, clear_directory
+from utils.jobs import JobManager, JobCancelled
+from utils.uploads import save_upload
+from utils.zipstream import stream_zip, archive_name
+from utils.materialize import DEFAULT_OUTPUT_MODE, read_selection
+from utils.folders import FolderRegistry, REGISTRY_FILE
+from utils.thumbnails import (
+    THUMBNAIL_SIZES, THUMBNAIL_DIR_NAME, THUMBNAIL_MEDIA_TYPE, ensure_thumbnail, thumbnail_headers, is_not_modified
+)
+from utils.telemetry import telemetry
 
 UPLOADS_DIR = "uploads"  # Main directory for all uploaded files
 OUTPUT_DIR = "output"    # Directory for processed results
+CACHE_DIR = "cache"      # Persistent embedding cache, kept across /clear
+MODEL_IDLE_TIMEOUT = float(os.environ.get("PHOTODUMP_MODEL_IDLE_TIMEOUT", 1800))  # Seconds before unused models are freed
+PRELOAD_MODELS = os.environ.get("PHOTODUMP_PRELOAD_MODELS", "0") == "1"  # Load all models at startup
+UPLOAD_CONCURRENCY = 8   # Files of one multipart request written to disk at the same time
+SEARCH_MAX_RESULTS = 100
+NUM_WORKERS = int(os.environ.get("PHOTODUMP_NUM_WORKERS", 1))  # Inference processes; >1 shards each album across them
+BACKEND = os.environ.get("PHOTODUMP_BACKEND", "torch")  # Encoder backend: torch, int8, onnx or onnx-int8
+ARTIFACTS_DIR = os.environ.get("PHOTODUMP_ARTIFACTS_DIR", "artifacts")  # Encoders exported with optimize.py
+MEMORY_CACHE_MB = float(os.environ.get("PHOTODUMP_MEMORY_CACHE_MB", 1024))  # Image embeddings kept in RAM between runs
+TRACE_DIR = os.environ.get("PHOTODUMP_TRACE_DIR")  # If set, a Chrome trace of each job is written here
+OUTPUT_MODE = os.environ.get("PHOTODUMP_OUTPUT_MODE", DEFAULT_OUTPUT_MODE)  # auto, reflink, hardlink, symlink or copy
+SCAN_LIST_LIMIT = 100    # Paths of added, changed and removed photos listed in a folder scan response
+CATEGORIZER = os.environ.get("PHOTODUMP_CATEGORIZER", DEFAULT_CATEGORIZER_MODEL)  # blip, or smolvlm to describe photos first
+SCREEN_KEEP = int(os.environ.get("PHOTODUMP_SCREEN_KEEP", 0))  # Candidates per category passed to the full scorer; 0 scores all
 
 def setup_directories():
     """Create necessary directories and remove redundant ones."""
@@ -48,12 +78,47 @@ BASE_DIR = Path(__file__).resolve().parent
 FRONTEND_DIR = BASE_DIR / "frontend"
 UPLOADS_DIR = BASE_DIR / UPLOADS_DIR
 OUTPUT_DIR = BASE_DIR / OUTPUT_DIR
+CACHE_DIR = BASE_DIR / CACHE_DIR
+# Dtype and batch size of each model, tuned on the first load and kept across restarts
+device_profile.path = os.environ.get("PHOTODUMP_DEVICE_PROFILE", str(CACHE_DIR / PROFILE_FILE))
+THUMBNAILS_DIR = UPLOADS_DIR / THUMBNAIL_DIR_NAME  # Derivatives live next to the uploads and are cleared with them
+
+# Shared with uploads so file hashes computed while streaming are reused by the pipeline.
+# The in-memory layer keeps the album's image embeddings between runs, so re-processing
+# with an edited category list only has to encode the new prompts.
+embedding_cache = MemoryEmbeddingCache(EmbeddingCache(str(CACHE_DIR)), max_size_mb=MEMORY_CACHE_MB)
+# Local folders processed in place by /upload-folder?mode=register, kept across restarts until /clear
+folder_registry = FolderRegistry(str(CACHE_DIR / REGISTRY_FILE))
 
 # Mount static files with proper cache control
 app.mount("/uploads", StaticFiles(directory=str(UPLOADS_DIR), check_dir=False), name="uploads")
 app.mount("/output", StaticFiles(directory=str(OUTPUT_DIR), check_dir=False), name="output")
 app.mount("/static", StaticFiles(directory=str(FRONTEND_DIR / "static")), name="static")
 
+@app.on_event("startup")
+async def start_model_pool():
+    """Start evicting idle models and optionally preload them in the background"""
+    model_pool.idle_timeout = MODEL_IDLE_TIMEOUT if MODEL_IDLE_TIMEOUT > 0 else None
+    model_pool.start_reaper()
+    if PRELOAD_MODELS:
+        threading.Thread(target=model_pool.preload, name="model-preload", daemon=True).start()
+
+@app.on_event("shutdown")
+async def stop_model_pool():
+    model_pool.stop_reaper()
+    jobs.shutdown()
+    if shard_pool is not None:
+        shard_pool.shutdown()
+
+shard_pool = None  # Started on the first /process so workers keep their models between runs
+
+def get_shard_pool():
+    """Return the inference worker pool, or None when running the models in this process"""
+    global shard_pool
+    if NUM_WORKERS > 1 and shard_pool is None:
+        shard_pool = ShardPool(NUM_WORKERS, cache_dir=str(CACHE_DIR), backend=BACKEND, artifacts_dir=ARTIFACTS_DIR)
+    return shard_pool
+
 @app.middleware("http")
 async def file_serving_middleware(request: Request, call_next):
     """Middleware to ensure files are properly served during cleanup operations"""
@@ -108,6 +173,11 @@ class ConnectionManager:
         self._last_status = None
         self.has_results = False  # Track if we have processed results
         self._cleanup_lock = False  # Add lock to prevent concurrent cleanups
+        self.current_job_id = None  # Job whose results should be published
+        # Latest undelivered progress event and sender task per connection, so a slow
+        # client only ever has one event queued and never holds up the others
+        self._pending_progress: Dict[WebSocket, dict] = {}
+        self._progress_senders: Dict[WebSocket, asyncio.Task] = {}
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
@@ -123,7 +193,7 @@ class ConnectionManager:
         # Only clean up if this was the last connection and no results exist
         if not self.active_connections and not self.has_results:
             if self.processing:
-                self.stop_processing()
+                self.cancel_current_job()
             await self.cleanup_temp_files()
 
     async def cleanup_temp_files(self):
@@ -158,6 +228,36 @@ class ConnectionManager:
     def disconnect(self, websocket: WebSocket):
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
+        self._pending_progress.pop(websocket, None)
+        self._progress_senders.pop(websocket, None)
+
+    def publish_progress(self, event: dict):
+        """Queue a progress event, replacing any older one a client has not received yet.
+
+        Must be called on the event loop thread (use loop.call_soon_threadsafe from workers).
+        """
+        if not self.processing:
+            return
+        self._last_status = event
+        for connection in self.active_connections:
+            self._pending_progress[connection] = event
+            sender = self._progress_senders.get(connection)
+            if sender is None or sender.done():
+                self._progress_senders[connection] = asyncio.ensure_future(self._send_progress(connection))
+
+    async def _send_progress(self, connection: WebSocket):
+        while connection in self._pending_progress:
+            event = self._pending_progress.pop(connection)
+            try:
+                await connection.send_json(event)
+            except Exception as e:
+                print(f"Error sending progress to connection: {e}")
+                self.disconnect(connection)
+                return
+
+    def drop_pending_progress(self):
+        """Forget undelivered progress events, e.g. once results are ready"""
+        self._pending_progress.clear()
 
     async def broadcast(self, message: dict):
         self._last_status = message
@@ -181,8 +281,41 @@ class ConnectionManager:
     def stop_processing(self):
         self.processing = False
         self._last_status = None
+        self.drop_pending_progress()
+
+    def cancel_current_job(self):
+        """Stop processing and make sure the running job's results are discarded"""
+        job = jobs.get(self.current_job_id) if self.current_job_id else None
+        if job is not None:
+            job.cancel()
+        self.current_job_id = None
+        self.stop_processing()
 
 manager = ConnectionManager()
+jobs = JobManager(max_workers=1)  # Processing is CPU-bound; run one album at a time off the event loop
+
+# Values read when /metrics is scraped
+jobs_finished = telemetry.counter("photodump_jobs_total", "Finished processing jobs", ["status"])
+telemetry.register_callback(
+    "photodump_job_queue_depth", "Processing jobs queued or running",
+    lambda: len(jobs.active())
+)
+telemetry.register_callback(
+    "photodump_model_memory_bytes", "Memory held by the parameters of each loaded model",
+    lambda: {(name,): size for name, size in model_pool.memory_bytes().items()}, labels=["model"]
+)
+CACHE_METRICS = (
+    ("hits", "photodump_embedding_cache_hits_total", "Embedding cache lookups that found a value", "counter"),
+    ("misses", "photodump_embedding_cache_misses_total", "Embedding cache lookups that found nothing", "counter"),
+    ("evictions", "photodump_embedding_cache_evictions_total", "Embedding cache entries evicted", "counter"),
+    ("size_mb", "photodump_embedding_cache_size_mb", "Size of the values in the embedding cache", "gauge"),
+)
+for stat, name, help_text, kind in CACHE_METRICS:
+    telemetry.register_callback(
+        name, help_text,
+        lambda stat=stat: {("memory",): embedding_cache.stats()[stat], ("disk",): embedding_cache.backing.stats()[stat]},
+        kind=kind, labels=["layer"]
+    )
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -197,9 +330,10 @@ async def websocket_endpoint(websocket: WebSocket):
 async def upload_photos(request: Request, files: List[UploadFile] = File(...)):
     """Handle individual file uploads"""
     try:
-        saved_paths = []
         skipped_files = []
-        
+        to_save = []
+        reserved = set()
+
         for file in files:
             if not file.filename:
                 continue
@@ -208,58 +342,117 @@ async def upload_photos(request: Request, files: List[UploadFile] = File(...)):
             if not file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
                 continue
                 
-            file_path = UPLOADS_DIR / file.filename
+            filename = os.path.basename(file.filename)
+            file_path = UPLOADS_DIR / filename
             # Skip if file already exists
-            if file_path.exists():
-                skipped_files.append(file.filename)
+            if file_path.exists() or filename in reserved:
+                skipped_files.append(filename)
                 continue
-                
-            # Save file
-            content = await file.read()
-            with open(file_path, "wb") as buffer:
-                buffer.write(content)
-            saved_paths.append(str(file_path))
+            reserved.add(filename)
+            to_save.append((file, file_path))
+
+        # Stream files to disk concurrently, hashing them on the way
+        semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+        async def save(file, file_path):
+            async with semaphore:
+                digest, size = await save_upload(file, file_path)
+            await run_in_threadpool(
+                embedding_cache.remember_hash, str(file_path), digest, size, file_path.stat().st_mtime_ns
+            )
+            return file_path.name, digest
+
+        saved = await asyncio.gather(*(save(file, path) for file, path in to_save))
         
         return JSONResponse({
-            "message": f"Successfully uploaded {len(saved_paths)} files",
-            "uploaded": len(saved_paths),
-            "files": [os.path.basename(p) for p in saved_paths],
+            "message": f"Successfully uploaded {len(saved)} files",
+            "uploaded": len(saved),
+            "files": [name for name, _ in saved],
+            "hashes": dict(saved),
             "skipped": len(skipped_files),
             "skipped_files": skipped_files
         })
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
+def copy_folder(folder_path: str) -> dict:
+    """Copy the images directly inside a folder into the uploads directory, skipping names already there"""
+    copied_files = []
+    skipped_files = []
+    for filename in os.listdir(folder_path):
+        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
+            src = os.path.join(folder_path, filename)
+            dst = os.path.join(UPLOADS_DIR, filename)
+            # Skip if file already exists
+            if os.path.exists(dst):
+                skipped_files.append(filename)
+                continue
+            shutil.copy2(src, dst)
+            copied_files.append(filename)
+    return {
+        "message": f"Successfully copied {len(copied_files)} images",
+        "files": copied_files,
+        "skipped": len(skipped_files),
+        "skipped_files": skipped_files
+    }
+
+def registration_summary(scan: dict) -> dict:
+    """Counts of a folder scan, with at most SCAN_LIST_LIMIT of the added, changed and removed paths"""
+    summary = {"folder": scan["folder"], "photos": scan["photos"]}
+    for key in ("added", "changed", "removed"):
+        summary[key] = len(scan[key])
+        summary[f"{key}_files"] = scan[key][:SCAN_LIST_LIMIT]
+    return summary
+
 @app.post("/upload-folder")
-async def upload_folder(folder_path: str = Form(...)):
-    """Handle folder uploads by copying image files to uploads directory"""
+async def upload_folder(folder_path: str = Form(...), mode: str = Form("copy")):
+    """Add a local folder to the album, either by copying its images or by registering it in place
+
+    mode=copy copies the images directly inside the folder into the uploads directory.
+    mode=register scans the folder and its subfolders and processes the photos where they
+    are, without copying any bytes; registering the same folder again rescans it.
+    """
     try:
-        if not os.path.exists(folder_path):
+        if not os.path.isdir(folder_path):
             return JSONResponse({"error": "Path does not exist"}, status_code=404)
+        if mode == "copy":
+            return JSONResponse(await run_in_threadpool(copy_folder, folder_path))
+        if mode != "register":
+            return JSONResponse({"error": "Unknown mode, expected 'copy' or 'register'"}, status_code=400)
+
+        scan = await run_in_threadpool(folder_registry.register, folder_path)
+        summary = registration_summary(scan)
+        return JSONResponse({"message": f"Registered {scan['photos']} images in place", **summary})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
 
-        copied_files = []
-        skipped_files = []
-        
-        for filename in os.listdir(folder_path):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                src = os.path.join(folder_path, filename)
-                dst = os.path.join(UPLOADS_DIR, filename)
-                # Skip if file already exists
-                if os.path.exists(dst):
-                    skipped_files.append(filename)
-                    continue
-                shutil.copy2(src, dst)
-                copied_files.append(filename)
+@app.get("/folders")
+async def list_folders():
+    """List the folders registered in place and their number of photos as of the last scan"""
+    photos = await run_in_threadpool(folder_registry.photos)
+    return JSONResponse({
+        "folders": [
+            {"folder": root, "photos": sum(1 for photo in photos if photo.startswith(root + os.sep))}
+            for root in folder_registry.folders()
+        ]
+    })
 
-        return JSONResponse({
-            "message": f"Successfully copied {len(copied_files)} images",
-            "files": copied_files,
-            "skipped": len(skipped_files),
-            "skipped_files": skipped_files
-        })
+@app.post("/rescan-folders")
+async def rescan_folders():
+    """Rescan every registered folder and report which photos were added, changed or removed"""
+    try:
+        scans = await run_in_threadpool(folder_registry.rescan)
+        return JSONResponse({"folders": [registration_summary(scan) for scan in scans]})
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
+@app.delete("/folders")
+async def unregister_folder(folder_path: str):
+    """Stop processing a registered folder; its photos are left untouched"""
+    if not await run_in_threadpool(folder_registry.unregister, folder_path):
+        return JSONResponse({"error": "Folder is not registered"}, status_code=404)
+    return JSONResponse({"message": "Folder unregistered"})
+
 @app.get("/categories")
 async def get_categories():
     """Generate category list automatically"""
@@ -275,7 +468,7 @@ async def get_categories():
 
 @app.post("/process")
 async def process_photos(request: Request):
-    """Process uploaded photos"""
+    """Queue processing of the uploaded photos and return the job id immediately"""
     try:
         if manager.processing:
             return JSONResponse(
@@ -293,53 +486,149 @@ async def process_photos(request: Request):
         with open(categories_file, "w") as f:
             f.write(categories_text)
 
-        # Initialize photo dumper with the uploads directory
-        dumper = PhotoDumper(
-            album_path=str(UPLOADS_DIR),
-            categories_file=categories_file,
-            batch_size=4,
-            pre_filter=100,
-            keep_top_k=1,
-            output_dir=str(OUTPUT_DIR)
-        )
+        loop = asyncio.get_running_loop()
+
+        def run_pipeline(job):
+            def on_progress(event):
+                # Runs on the worker thread: never await clients here, just hand the event over
+                if job.cancel_event.is_set():
+                    raise JobCancelled("Processing cancelled")
+                loop.call_soon_threadsafe(manager.publish_progress, {**event, "job_id": job.id})
+
+            if TRACE_DIR:
+                with telemetry.trace() as trace:
+                    try:
+                        return process(on_progress)
+                    finally:
+                        trace.save(os.path.join(TRACE_DIR, f"{job.id}.trace.json"))
+            return process(on_progress)
+
+        def process(on_progress):
+            # Pick up photos added to, changed in or removed from registered folders since their last scan
+            folder_registry.rescan()
+            # Initialize photo dumper with the uploads directory and the registered folders
+            dumper = PhotoDumper(
+                album_path=str(UPLOADS_DIR),
+                categories_file=categories_file,
+                batch_size=None,
+                pre_filter=100,
+                keep_top_k=1,
+                output_dir=str(OUTPUT_DIR),
+                cache=embedding_cache,
+                search_index=True,
+                shard_pool=get_shard_pool(),
+                backend=BACKEND,
+                artifacts_dir=ARTIFACTS_DIR,
+                screen_keep=SCREEN_KEEP,
+                output_mode=OUTPUT_MODE,
+                sources=folder_registry.photos(),
+                categorizer_model=CATEGORIZER
+            )
+            return dumper.process(progress_callback=on_progress)
 
-        await manager.broadcast({"status": "categorizing"})
-        ranked_categories = dumper.process()
-        
+        def finish(job):
+            # Runs on the worker thread; hand results back to the event loop
+            jobs_finished.inc(status=job.status)
+            asyncio.run_coroutine_threadsafe(finish_job(job), loop)
+
+        job = jobs.submit("process", run_pipeline, on_done=finish)
+        manager.current_job_id = job.id
+        await manager.broadcast({"status": "categorizing", "job_id": job.id})
+        return JSONResponse({"job_id": job.id, "status": job.status}, status_code=202)
+    except Exception as e:
+        manager.stop_processing()
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def finish_job(job):
+    """Publish the outcome of a processing job to connected clients"""
+    if manager.current_job_id != job.id:
+        return  # Superseded by /clear or a newer job
+    manager.stop_processing()  # Also drops progress events that have not been delivered yet
+    if job.status == "completed":
         # Mark that we have results to prevent premature cleanup
         manager.set_has_results(True)
-        
         await manager.broadcast({
             "status": "complete",
-            "results": ranked_categories
+            "job_id": job.id,
+            "results": job.result
         })
-
-        manager.stop_processing()
-        return JSONResponse(ranked_categories)
-    except Exception as e:
-        manager.stop_processing()
-        return JSONResponse({"error": str(e)}, status_code=500)
+    elif job.status == "failed":
+        await manager.broadcast({"status": "error", "job_id": job.id, "message": job.error})
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Return the status of a processing job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return JSONResponse(job.to_dict())
+
+@app.get("/jobs/{job_id}/trace")
+async def get_job_trace(job_id: str):
+    """Return the Chrome trace of a job, when traces are enabled with PHOTODUMP_TRACE_DIR"""
+    path = os.path.join(TRACE_DIR, f"{job_id}.trace.json") if TRACE_DIR else None
+    if path is None or not os.path.exists(path):
+        return JSONResponse({"error": "Trace not found"}, status_code=404)
+    return FileResponse(path, media_type="application/json", filename=f"{job_id}.trace.json")
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Return the ranked categories of a completed job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    if job.status == "completed":
+        return JSONResponse(job.result)
+    if job.status == "failed":
+        return JSONResponse({"error": job.error, "status": job.status}, status_code=500)
+    if job.status == "cancelled":
+        return JSONResponse({"error": "Job was cancelled", "status": job.status}, status_code=410)
+    return JSONResponse({"status": job.status}, status_code=202)
+
+@app.get("/selection")
+async def get_selection():
+    """Return the selection manifest of the last run: category -> photos with their source and output paths"""
+    selection = read_selection(str(OUTPUT_DIR))
+    if selection is None:
+        return JSONResponse({"error": "No selection"}, status_code=404)
+    return JSONResponse(selection)
+
+def selection_entries() -> list:
+    """(file to read, name in the archive) of every selected photo, from the manifest or the category folders"""
+    selection = read_selection(str(OUTPUT_DIR))
+    if selection is not None:
+        # Read the originals, which stay valid even if a link in the output folder was removed
+        entries = []
+        for category, photos in sorted(selection["categories"].items()):
+            for entry in photos:
+                source = entry["source"] if os.path.exists(entry["source"]) else str(OUTPUT_DIR / entry["path"])
+                if os.path.exists(source):
+                    entries.append((source, archive_name(category, entry["file"])))
+        return entries
+
+    # Output of a run from before the manifest existed
+    entries = []
+    for category_dir in (sorted(OUTPUT_DIR.iterdir()) if OUTPUT_DIR.exists() else []):
+        if not category_dir.is_dir():
+            continue
+        for image in sorted(category_dir.iterdir()):
+            if image.is_file() and image.name.lower().endswith((".png", ".jpg", ".jpeg")):
+                entries.append((str(image), archive_name(category_dir.name, image.name)))
+    return entries
 
 @app.get("/download")
 async def download_selection():
-    """Copy all images from OUTPUT_DIR to the user's Downloads/photodump folder"""
-    # user's download folder
-    home = Path.home()
-    OUTPUT_FOLDER = home / "Downloads"
-    ZIP_FILENAME = "images.zip"
-    zip_path = os.path.join(OUTPUT_FOLDER, ZIP_FILENAME)
-
-    # Create ZIP file
-    # assert output dir is not empty 
-    assert os.path.exists(OUTPUT_DIR) and os.listdir(OUTPUT_DIR), "No images to download"
-    with zipfile.ZipFile(zip_path, "w") as zipf:
-        for root, _, files in os.walk(OUTPUT_DIR):
-            for file in files:
-                if file.endswith((".png", ".jpg", ".jpeg")):
-                    zipf.write(os.path.join(root, file), file)
-
-    # Serve the ZIP file for download
-    return FileResponse(zip_path, filename="images.zip", media_type="application/zip")
+    """Stream the selected images as a ZIP, keeping their category folders"""
+    entries = selection_entries()
+    if not entries:
+        return JSONResponse({"error": "No images to download"}, status_code=404)
+
+    # A sync generator is iterated in the threadpool, so file reads stay off the event loop
+    return StreamingResponse(
+        stream_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="images.zip"'}
+    )
     
 @app.post("/clear")
 async def clear_data():
@@ -347,7 +636,7 @@ async def clear_data():
     try:
         if manager.processing:
             await manager.broadcast({"status": "cancelled"})
-            manager.stop_processing()
+            manager.cancel_current_job()
 
         # Clear main directories
         downloads_dir = BASE_DIR / "downloads"
@@ -361,6 +650,7 @@ async def clear_data():
                 
         clear_directory(UPLOADS_DIR)
         clear_directory(OUTPUT_DIR)
+        folder_registry.clear()  # Registered folders are forgotten, never deleted
         
         # Clear all temporary files
         temp_paths = [
@@ -371,7 +661,8 @@ async def clear_data():
             "uploads/categories.txt",
             "output/category_results.json",
             "output/category_list.json",
-            "output/ranked_categories.json"
+            "output/ranked_categories.json",
+            "output/selection.json"
         ]
         
         remove_temp_files(BASE_DIR, temp_paths)
@@ -387,6 +678,93 @@ async def clear_data():
             status_code=500
         )
 
+@app.get("/metrics")
+async def metrics():
+    """Expose stage timings, throughput, cache, queue and model memory metrics to Prometheus"""
+    text = await run_in_threadpool(telemetry.render)
+    return Response(text, media_type="text/plain; version=0.0.4")
+
+@app.get("/models")
+async def list_models():
+    """Report which models are loaded in the shared pool"""
+    return JSONResponse(model_pool.status())
+
+@app.post("/models/preload")
+async def preload_models():
+    """Load all registered models now so the next /process does not pay for it"""
+    try:
+        loaded = await run_in_threadpool(model_pool.preload)
+        return JSONResponse({"message": f"Loaded {len(loaded)} models", "models": loaded})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.get("/thumbnails/{size}/{filename}")
+async def get_thumbnail(size: str, filename: str, request: Request, v: str = None, path: str = None):
+    """Serve a downscaled copy of an uploaded photo, generating it on first request.
+
+    Derivatives are keyed by content hash, so the ETag never changes for the same bytes.
+    When the client pins the URL to the hash with ?v=<sha256>, the response is cacheable forever.
+    Photos of registered folders are served from ?path=<their path>, which must be registered.
+    """
+    if size not in THUMBNAIL_SIZES:
+        return JSONResponse({"error": f"Unknown size, expected one of {sorted(THUMBNAIL_SIZES)}"}, status_code=400)
+    if path and await run_in_threadpool(folder_registry.contains, path):
+        source = Path(path)
+    else:
+        source = UPLOADS_DIR / filename
+    if filename.startswith(".") or os.path.basename(filename) != filename or not source.is_file():
+        return JSONResponse({"error": "File not found"}, status_code=404)
+
+    try:
+        digest = await run_in_threadpool(embedding_cache.content_hash, str(source))
+        headers = thumbnail_headers(digest, size, v)
+        if is_not_modified(request.headers.get("if-none-match"), headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+        thumbnail = await run_in_threadpool(ensure_thumbnail, source, digest, size, THUMBNAILS_DIR)
+        return FileResponse(str(thumbnail), media_type=THUMBNAIL_MEDIA_TYPE, headers=headers)
+    except Exception as e:
+        print(f"Thumbnail error for {filename}: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+_search_index = {"mtime_ns": None, "index": None}
+
+def load_search_index():
+    """Return the index written by the last /process run, re-reading it only when the file changed"""
+    path = OUTPUT_DIR / SEARCH_INDEX_FILE
+    if not path.exists():
+        return None
+    mtime_ns = path.stat().st_mtime_ns
+    if _search_index["mtime_ns"] != mtime_ns:
+        _search_index["index"] = VectorIndex.load(str(path))
+        _search_index["mtime_ns"] = mtime_ns
+    return _search_index["index"]
+
+@app.get("/search")
+async def search_photos(q: str, k: int = 20):
+    """Find the processed photos that best match a free-text query"""
+    if not q.strip():
+        return JSONResponse({"error": "Empty query"}, status_code=400)
+    try:
+        index = await run_in_threadpool(load_search_index)
+        if index is None:
+            return JSONResponse({"error": "No search index, process the photos first"}, status_code=404)
+
+        query = await run_in_threadpool(
+            lambda: encode_clip_text([q], backend=BACKEND, artifacts_dir=ARTIFACTS_DIR)
+        )
+        hits = index.search(query[0], k=max(1, min(k, SEARCH_MAX_RESULTS)))
+        return JSONResponse({
+            "query": q,
+            # The path tells apart photos of the same name and is what /thumbnails?path= expects
+            "results": [
+                {"filename": os.path.basename(path), "path": path, "score": score} for path, score in hits
+            ]
+        })
+    except Exception as e:
+        print(f"Search error: {str(e)}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
 @app.get("/list-uploads")
 async def list_uploads():
     """List all files in the uploads directory"""
@@ -421,6 +799,7 @@ async def clear_uploads():
     """Clear all files from uploads directory"""
     try:
         clear_directory(UPLOADS_DIR)
+        folder_registry.clear()
         # Only remove image files, keep other system files
         for item in UPLOADS_DIR.iterdir():
             if item.is_file() and item.name.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
@@ -436,7 +815,7 @@ async def cleanup_on_unload():
         # Only clean up if we don't have results
         if not manager.has_results:
             if manager.processing:
-                manager.stop_processing()
+                manager.cancel_current_job()
                 await manager.broadcast({"status": "cancelled"})
             
             # Clear only temporary files
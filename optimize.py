@@ -0,0 +1,81 @@
+import json
+import os
+import click
+from core.backends import BACKENDS, DEFAULT_ARTIFACTS_DIR
+from core.autotune import PROFILE_FILE, device_profile
+
+@click.group()
+def main():
+    """Tune the models for this machine, export them to optimized CPU backends and check their accuracy."""
+
+@main.command()
+@click.option('--backend', type=click.Choice(BACKENDS[1:]), required=True, help='Backend to export for')
+@click.option('--artifacts-dir', default=DEFAULT_ARTIFACTS_DIR, help='Directory to write the exported encoders to')
+@click.option('--model', 'models', type=click.Choice(['blip', 'clip', 'screen']), multiple=True,
+              help='Model to export (default: blip and clip)')
+def export(backend, artifacts_dir, models):
+    """Export the encoders so the pipeline can load them with --backend."""
+    from core import blip_categorizer, photo_ranker
+    exporters = {
+        'blip': blip_categorizer.export,
+        'clip': photo_ranker.export,
+        'screen': lambda backend, artifacts_dir: photo_ranker.export(
+            backend, artifacts_dir, photo_ranker.SCREEN_CLIP_MODEL_ID
+        ),
+    }
+    for name in models or ('blip', 'clip'):
+        click.echo(f"Exporting {name} for {backend}...")
+        click.echo(f"  -> {exporters[name](backend, artifacts_dir)}")
+
+@main.command()
+@click.option('--cache-dir', default='cache', help='Directory holding the device profile')
+@click.option('--model', 'models', type=click.Choice(['blip', 'clip', 'screen', 'smolvlm']), multiple=True,
+              help='Model to tune (default: blip and clip)')
+def tune(cache_dir, models):
+    """Benchmark dtypes and batch sizes of the models on this machine and save the fastest to the profile."""
+    from core import blip_categorizer, photo_ranker, smolvlm_categorizer
+    loaders = {
+        'blip': (blip_categorizer.MODEL_ID, blip_categorizer.load_model),
+        'clip': (photo_ranker.CLIP_MODEL_ID, photo_ranker.load_clip),
+        'screen': (photo_ranker.SCREEN_CLIP_MODEL_ID, lambda: photo_ranker.load_clip(photo_ranker.SCREEN_CLIP_MODEL_ID)),
+        'smolvlm': (smolvlm_categorizer.MODEL_NAME, smolvlm_categorizer.load_model),
+    }
+    device_profile.path = os.path.join(cache_dir, PROFILE_FILE)
+    device_profile.enabled = True
+    for name in models or ('blip', 'clip'):
+        model_id, load = loaders[name]
+        device_profile.forget(model_id)
+        load()
+        config = device_profile.get(model_id)
+        click.echo(f"{model_id}: {config['dtype']}, batch size {config['batch_size']} "
+                   f"({config['items_per_second']:.1f} items/s)")
+    click.echo(f"Saved to {device_profile.path}")
+
+@main.command()
+@click.argument('album_path', type=click.Path(exists=True))
+@click.argument('categories_file', type=click.Path(exists=True), default='defaults/photodump_list.txt')
+@click.option('--backend', type=click.Choice(BACKENDS), required=True, help='Backend to check')
+@click.option('--reference', type=click.Choice(BACKENDS), default='torch', help='Backend taken as ground truth')
+@click.option('--artifacts-dir', default=DEFAULT_ARTIFACTS_DIR, help='Directory of the exported encoders')
+@click.option('--batch-size', type=int, default=None, help='Number of images to process in each batch (default: tuned per model)')
+@click.option('--keep-top-k', default=3, help='Size of the per-category rankings to compare')
+@click.option('--report', type=click.Path(), default=None, help='Optional path to save the full report as JSON')
+def check(album_path, categories_file, backend, reference, artifacts_dir, batch_size, keep_top_k, report):
+    """Compare category assignments and top-k rankings of BACKEND against the reference on an album."""
+    from core.backend_check import check_backend
+    result = check_backend(album_path, categories_file, backend, artifacts_dir=artifacts_dir, reference=reference,
+                           batch_size=batch_size, keep_top_k=keep_top_k)
+    click.echo(f"{result['photos']} photos, {backend} vs {reference}")
+    click.echo(f"  Category agreement:   {result['category_agreement']:.1%}")
+    click.echo(f"  Max probability diff: {result['max_probability_diff']:.4f}")
+    click.echo(f"  Top-1 agreement:      {result['top1_agreement']:.1%}")
+    click.echo(f"  Top-{keep_top_k} overlap:        {result['topk_overlap']:.1%}")
+    if report:
+        with open(report, 'w') as f:
+            json.dump(result, f, indent=2)
+    click.echo("PASSED" if result['passed'] else "FAILED")
+    if not result['passed']:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
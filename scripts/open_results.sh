@@ -1,7 +1,7 @@
 #!/bin/bash
 
-# Read the ranked categories JSON file
-json_file="output/ranked_categories.json"
+# Read the selection manifest written by the last run
+json_file="${1:-output}/selection.json"
 
 # Check if the file exists
 if [ ! -f "$json_file" ]; then
@@ -9,8 +9,8 @@ if [ ! -f "$json_file" ]; then
     exit 1
 fi
 
-# For each category and image in the JSON, open the image
-cat "$json_file" | jq -r 'to_entries[] | "\(.key)\t\(.value | keys[])"' | while IFS=$'\t' read -r category image; do
+# For each category and image in the manifest, open the original photo
+jq -r '.categories | to_entries[] | .key as $category | .value[] | "\($category)\t\(.source)"' "$json_file" | while IFS=$'\t' read -r category image; do
     echo "Opening $image from category: $category"
     # Use xdg-open on Linux, open on macOS, or start on Windows
     if command -v xdg-open &> /dev/null; then
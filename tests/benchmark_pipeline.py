@@ -0,0 +1,202 @@
+"""
+End-to-end and per-stage speed benchmark of the photo pipeline on a synthetic album.
+
+    python tests/benchmark_pipeline.py --photos 200 --resolution 4032x3024 --output bench.json
+    python tests/benchmark_pipeline.py --baseline tests/benchmark_baseline.json   # flag regressions
+    python tests/benchmark_pipeline.py --update-baseline                          # store a new baseline
+
+Models are loaded before anything is timed and the embedding cache is disabled, so
+every run measures the same work. Results are written as JSON: per-run wall time,
+images/sec and a breakdown into decode, preprocess, forward, grouping, ranking and
+copy time, plus peak RSS. Decode time is summed over the decoding threads.
+"""
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import click
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.timing import stage_timer  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+DEFAULT_CATEGORIES = "defaults/photodump_list.txt"
+DEFAULT_TOLERANCE = 0.15      # Slowdown, as a fraction of the baseline, reported as a regression
+MIN_REGRESSION_SECONDS = 0.05  # Ignore differences below this, which are timer noise
+RUNS = ("decode", "dedupe", "categorize", "score", "end_to_end")
+
+
+def make_synthetic_album(directory: str, num_photos: int, width: int, height: int, seed: int = 0) -> List[str]:
+    """
+    Write `num_photos` JPEGs of smooth random color fields with fine noise.
+
+    They compress and decode like real photos rather than flat images, and every
+    run with the same seed produces the same album.
+
+    Returns:
+        Paths of the written photos
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(num_photos):
+        coarse = Image.fromarray(rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)).resize((width, height), Image.BICUBIC)
+        noise = rng.normal(0, 12, (height, width, 3))
+        pixels = np.clip(np.asarray(coarse, dtype=np.float32) + noise, 0, 255).astype(np.uint8)
+        path = os.path.join(directory, f"IMG_{i:05d}.jpg")
+        Image.fromarray(pixels).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process and its finished children, in megabytes."""
+    scale = 1 if platform.system() == "Darwin" else 1024  # ru_maxrss is in bytes on macOS, KiB elsewhere
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak * scale / (1024 * 1024)
+
+
+def timed_run(fn: Callable[[], object], num_photos: int) -> Dict[str, object]:
+    """Run `fn` once and report its wall time, throughput and the stage breakdown it recorded."""
+    stage_timer.reset()
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+    return {
+        "seconds": seconds,
+        "images_per_second": num_photos / seconds if seconds > 0 else None,
+        "stages": stage_timer.snapshot(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def flatten_metrics(report: Dict[str, object]) -> Dict[str, float]:
+    """Comparable metrics of a report: every duration, keyed like "runs.end_to_end.stages.forward", and peak RSS."""
+    metrics = {"peak_rss_mb": report["peak_rss_mb"]}
+    for run, result in report["runs"].items():
+        metrics[f"runs.{run}"] = result["seconds"]
+        for stage, totals in result["stages"].items():
+            metrics[f"runs.{run}.stages.{stage}"] = totals["seconds"]
+    return metrics
+
+
+def compare_to_baseline(report: Dict[str, object], baseline: Dict[str, object],
+                        tolerance: float = DEFAULT_TOLERANCE) -> List[Tuple[str, float, float]]:
+    """
+    Find metrics that got worse than the baseline by more than `tolerance`.
+
+    Returns:
+        (metric, baseline value, current value) tuples of the regressions
+    """
+    if report["config"] != baseline["config"]:
+        raise click.UsageError(f"Baseline was measured with {baseline['config']}, not {report['config']}")
+    current, previous = flatten_metrics(report), flatten_metrics(baseline)
+    regressions = []
+    for metric, value in current.items():
+        old = previous.get(metric)
+        if old is None:
+            continue
+        floor = 0.0 if metric == "peak_rss_mb" else MIN_REGRESSION_SECONDS
+        if value > old * (1 + tolerance) and value - old > floor:
+            regressions.append((metric, old, value))
+    return regressions
+
+
+def run_benchmark(album: str, photos: List[str], categories_file: str, batch_size: Optional[int],
+                  runs: List[str], work_dir: str) -> Dict[str, Dict[str, object]]:
+    """Time each requested run on the album, with models loaded up front."""
+    results = {}
+    if "decode" in runs:
+        from utils.prefetch import PrefetchLoader
+        results["decode"] = timed_run(lambda: sum(1 for _ in PrefetchLoader(photos, batch_size or 16, 224)), len(photos))
+    if "dedupe" in runs:
+        from core.dedupe import find_duplicate_groups
+        results["dedupe"] = timed_run(lambda: find_duplicate_groups(photos), len(photos))
+    if not {"categorize", "score", "end_to_end"} & set(runs):
+        return results
+
+    # Model runs need PyTorch; import them only when asked for
+    from core.blip_categorizer import BlipCategorizer
+    from core.photo_dumper import PhotoDumper
+    from core.photo_ranker import AestheticClipSelector
+
+    start = time.perf_counter()
+    categorizer = BlipCategorizer(categories_file) if {"categorize", "end_to_end"} & set(runs) else None
+    selector = AestheticClipSelector() if {"score", "end_to_end"} & set(runs) else None
+    results["model_load"] = {"seconds": time.perf_counter() - start, "stages": {}, "peak_rss_mb": peak_rss_mb()}
+    if "categorize" in runs:
+        results["categorize"] = timed_run(lambda: categorizer.predict_probabilities(photos, batch_size), len(photos))
+    if "score" in runs:
+        results["score"] = timed_run(lambda: selector.score_components({"all": photos}, batch_size), len(photos))
+    if "end_to_end" in runs:
+        output_dir = os.path.join(work_dir, "output")
+        dumper = PhotoDumper(album, categories_file, batch_size=batch_size, output_dir=output_dir,
+                             cache_dir=None, incremental=False, categorizer=categorizer, selector=selector)
+        results["end_to_end"] = timed_run(dumper.process, len(photos))
+    return results
+
+
+@click.command()
+@click.option('--photos', 'num_photos', default=100, help='Number of photos in the synthetic album')
+@click.option('--resolution', default='4032x3024', help='WIDTHxHEIGHT of the synthetic photos')
+@click.option('--categories-file', default=DEFAULT_CATEGORIES, type=click.Path(exists=True))
+@click.option('--batch-size', type=int, default=None, help='Batch size (default: tuned per model)')
+@click.option('--run', 'runs', type=click.Choice(RUNS), multiple=True, help='Runs to time (default: all)')
+@click.option('--output', type=click.Path(), default=None, help='Where to write the JSON report (default: stdout)')
+@click.option('--baseline', type=click.Path(), default=DEFAULT_BASELINE, help='Baseline report to compare against')
+@click.option('--tolerance', default=DEFAULT_TOLERANCE, help='Allowed slowdown as a fraction of the baseline')
+@click.option('--update-baseline', is_flag=True, help='Save this report as the new baseline')
+@click.option('--keep-album', type=click.Path(), default=None, help='Directory to write (and keep) the album in')
+def main(num_photos, resolution, categories_file, batch_size, runs, output, baseline, tolerance, update_baseline,
+         keep_album):
+    """Benchmark the pipeline on a synthetic album and flag regressions against a baseline."""
+    width, height = (int(x) for x in resolution.lower().split("x"))
+    runs = list(runs or RUNS)
+    work_dir = tempfile.mkdtemp(prefix="photodump-bench-")
+    album = keep_album or os.path.join(work_dir, "album")
+    try:
+        click.echo(f"Writing {num_photos} {width}x{height} photos to {album}...", err=True)
+        photos = make_synthetic_album(album, num_photos, width, height)
+        report = {
+            "config": {"photos": num_photos, "resolution": [width, height], "batch_size": batch_size,
+                       "categories_file": os.path.basename(categories_file)},
+            "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                        "cpu_count": os.cpu_count()},
+            "runs": run_benchmark(album, photos, categories_file, batch_size, runs, work_dir),
+        }
+        report["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text)
+    else:
+        click.echo(text)
+
+    if update_baseline:
+        with open(baseline, 'w') as f:
+            f.write(text)
+        click.echo(f"Saved baseline to {baseline}", err=True)
+    elif os.path.exists(baseline):
+        with open(baseline, 'r') as f:
+            regressions = compare_to_baseline(report, json.load(f), tolerance)
+        for metric, old, new in regressions:
+            click.echo(f"REGRESSION {metric}: {old:.3f} -> {new:.3f} (+{(new / old - 1) * 100:.0f}%)", err=True)
+        if regressions:
+            sys.exit(1)
+        click.echo(f"No regressions beyond {tolerance:.0%} of {baseline}", err=True)
+
+
+if __name__ == "__main__":
+    main()
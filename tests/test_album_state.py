@@ -0,0 +1,45 @@
+import pytest
+from core.album_state import AlbumState
+
+SIGNATURE = {"blip": "blip@1", "clip": "clip@1"}
+
+@pytest.fixture
+def state(tmp_path):
+    """Fixture to provide a saved state with two scored photos"""
+    state = AlbumState(str(tmp_path / "album_state.json"), SIGNATURE)
+    state.set_categories(["None", "beach", "food"])
+    for digest in ("a", "b"):
+        state.set_probabilities(digest, [0.1, 0.7, 0.2])
+        state.set_aesthetic(digest, 5.0)
+        state.set_clip_score(digest, "beach", 25.0)
+    state.save()
+    return state
+
+def test_round_trip_and_prune(state):
+    loaded = AlbumState.load(state.path, SIGNATURE)
+    assert loaded.probabilities("a") == pytest.approx([0.1, 0.7, 0.2])
+    assert loaded.clip_score("b", "beach") == 25.0
+
+    assert loaded.prune(["a"]) == 1
+    assert loaded.aesthetic("b") is None
+
+def test_category_change_keeps_image_scores(state):
+    loaded = AlbumState.load(state.path, SIGNATURE)
+    assert loaded.set_categories(["None", "beach", "city"])
+    assert loaded.probabilities("a") is None
+    assert loaded.aesthetic("a") == 5.0
+    assert loaded.clip_score("a", "beach") == 25.0
+
+def test_other_models_discard_state(state):
+    loaded = AlbumState.load(state.path, {**SIGNATURE, "clip": "clip@2"})
+    assert loaded.photos == {}
+
+def test_screen_scores_round_trip(state):
+    state.set_screen_quality("a", 0.4)
+    state.set_screen_clip_score("a", "beach", 22.0)
+    state.save()
+    loaded = AlbumState.load(state.path, SIGNATURE)
+    assert loaded.screen_quality("a") == 0.4
+    assert loaded.screen_clip_score("a", "beach") == 22.0
+    assert loaded.screen_clip_score("a", "food") is None
+    assert loaded.screen_quality("b") is None
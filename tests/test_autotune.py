@@ -0,0 +1,37 @@
+import torch
+from core.autotune import DeviceProfile, autotune
+
+def make_inputs(batch_size):
+    return {"input": torch.randn(batch_size, 32, generator=torch.Generator().manual_seed(0))}
+
+def test_autotune_picks_a_measured_configuration():
+    """The chosen configuration is one of the measured trials and float32 is always acceptable"""
+    module = torch.nn.Sequential(torch.nn.Linear(32, 64), torch.nn.ReLU(), torch.nn.Linear(64, 8))
+    config = autotune(module, make_inputs, forward=lambda m, inputs: m(inputs["input"]),
+                      device="cpu", dtypes=["float32"], batch_sizes=(1, 4))
+
+    assert config["dtype"] == "float32"
+    assert config["cosine"] > 0.999
+    assert {k: config[k] for k in ("dtype", "batch_size")} in [
+        {k: trial[k] for k in ("dtype", "batch_size")} for trial in config["trials"]
+    ]
+    assert module[0].weight.dtype == torch.float32
+
+def test_profile_is_persisted_and_reused(tmp_path):
+    """A tuned model is saved to disk and not tuned again by a later profile"""
+    path = str(tmp_path / "device_profile.json")
+    module = torch.nn.Linear(32, 8)
+    calls = []
+
+    def forward(m, inputs):
+        calls.append(len(inputs["input"]))
+        return m(inputs["input"])
+
+    assert DeviceProfile(path).resolve("tiny", module, make_inputs, forward) in (torch.float32, torch.bfloat16)
+    tuned_calls = len(calls)
+    reloaded = DeviceProfile(path)
+    reloaded.resolve("tiny", module, make_inputs, forward)
+
+    assert len(calls) == tuned_calls
+    assert reloaded.batch_size("tiny", default=99) != 99
+    assert DeviceProfile(path, enabled=False).batch_size("other", default=7) == 7
@@ -0,0 +1,134 @@
+import os
+import numpy as np
+import pytest
+import torch
+from click.testing import CliRunner
+import optimize
+from core import backend_check
+from core.backends import (
+    DEFAULT_BACKEND, METADATA_FILE, artifacts_path, cache_model_id, export_encoders, load_optimized_encoders
+)
+
+MODEL_ID = "org/tiny-model"
+
+class StubProcessor:
+    def __init__(self, source="built"):
+        self.source = source
+
+    def save_pretrained(self, directory):
+        with open(os.path.join(directory, "processor.txt"), 'w') as f:
+            f.write("saved")
+
+def tiny_modules():
+    torch.manual_seed(0)
+    module = torch.nn.Sequential(torch.nn.Linear(16, 32), torch.nn.ReLU(), torch.nn.Linear(32, 8))
+    return {"image": module}, {"logit_scale": 100.0}
+
+def test_cache_model_id_and_artifacts_path():
+    """Only optimized backends get their own cache id, and artifacts are laid out per model and backend"""
+    assert cache_model_id(MODEL_ID, DEFAULT_BACKEND) == MODEL_ID
+    assert cache_model_id(MODEL_ID, "int8") == f"{MODEL_ID}+int8"
+    assert cache_model_id(MODEL_ID, "onnx") != cache_model_id(MODEL_ID, "onnx-int8")
+    assert artifacts_path("artifacts", MODEL_ID, "onnx") == os.path.join("artifacts", "org--tiny-model", "onnx")
+
+def test_missing_onnx_export_is_a_clear_error(tmp_path):
+    """Loading an onnx backend without an export says which command to run"""
+    for artifacts_dir in (None, str(tmp_path)):
+        with pytest.raises(FileNotFoundError, match="optimize.py export --backend onnx-int8"):
+            load_optimized_encoders(MODEL_ID, "onnx-int8", tiny_modules, StubProcessor, artifacts_dir)
+    with pytest.raises(ValueError):
+        load_optimized_encoders(MODEL_ID, DEFAULT_BACKEND, tiny_modules, StubProcessor)
+
+def test_int8_export_and_load_round_trip(tmp_path):
+    """Exported int8 encoders load from disk with their metadata and stay close to the float module"""
+    directory = export_encoders(MODEL_ID, "int8", tiny_modules, StubProcessor(), {}, str(tmp_path))
+    assert directory == artifacts_path(str(tmp_path), MODEL_ID, "int8")
+    assert sorted(os.listdir(directory)) == sorted([METADATA_FILE, "image.pt", "processor.txt"])
+
+    encoders = load_optimized_encoders(MODEL_ID, "int8", tiny_modules, StubProcessor, str(tmp_path))
+    assert encoders.backend == "int8"
+    assert encoders.processor.source == directory
+    assert encoders.metadata["logit_scale"] == 100.0
+    assert encoders.metadata["encoders"] == ["image"]
+
+    inputs = torch.randn(4, 16, generator=torch.Generator().manual_seed(1))
+    expected = tiny_modules()[0]["image"](inputs)
+    found = encoders["image"](inputs)
+    assert found.dtype == torch.float32
+    assert torch.nn.functional.cosine_similarity(found, expected).min() > 0.99
+
+    # Without an export, int8 quantizes the reference modules on the fly
+    on_the_fly = load_optimized_encoders(MODEL_ID, "int8", tiny_modules, StubProcessor, str(tmp_path / "empty"))
+    assert on_the_fly.processor.source == MODEL_ID
+    torch.testing.assert_close(on_the_fly["image"](inputs), found)
+
+# Per backend, the category each photo gets and the score of each candidate
+STUB_CATEGORIES = {
+    "torch": [1, 1, 2, 2],
+    "int8": [1, 1, 2, 1],
+}
+STUB_SCORES = {
+    "torch": {"a.jpg": 0.9, "b.jpg": 0.8, "c.jpg": 0.7, "d.jpg": 0.6},
+    "int8": {"a.jpg": 0.8, "b.jpg": 0.9, "c.jpg": 0.7, "d.jpg": 0.6},
+}
+
+class StubCategorizer:
+    def __init__(self, categories_file, backend=DEFAULT_BACKEND, artifacts_dir=None):
+        self.backend = backend
+        self.categories = {1: "people", 2: "places"}
+
+    def predict_probabilities(self, photos, batch_size=None):
+        probs = np.zeros((len(photos), 3), dtype=np.float32)
+        for row, category in enumerate(STUB_CATEGORIES[self.backend]):
+            probs[row, category] = 1.0
+        return probs
+
+class StubSelector:
+    def __init__(self, backend=DEFAULT_BACKEND, artifacts_dir=None):
+        self.backend = backend
+
+    def score_photos(self, photos, batch_size=None, aesthetic_weight=0.3):
+        return {category: [(photo, STUB_SCORES[self.backend][os.path.basename(photo)]) for photo in paths]
+                for category, paths in photos.items()}
+
+@pytest.fixture
+def stub_models(monkeypatch):
+    monkeypatch.setattr(backend_check, "list_images", lambda album: ["a.jpg", "b.jpg", "c.jpg", "d.jpg"])
+    monkeypatch.setattr(backend_check, "BlipCategorizer", StubCategorizer)
+    monkeypatch.setattr(backend_check, "AestheticClipSelector", StubSelector)
+
+def test_check_backend_agreement_metrics(stub_models):
+    """Category agreement and top-k overlap are computed on the reference's candidates"""
+    report = backend_check.check_backend("album", "categories.txt", "int8", keep_top_k=1)
+
+    assert report["photos"] == 4
+    assert report["category_agreement"] == 0.75
+    assert report["max_probability_diff"] == 1.0
+    # Ranking is compared on the reference's assignment: people = a, b and places = c, d
+    assert report["per_category"]["people"] == {"top1_match": False, "topk_overlap": 0.0}
+    assert report["per_category"]["places"] == {"top1_match": True, "topk_overlap": 1.0}
+    assert report["top1_agreement"] == 0.5
+    assert report["topk_overlap"] == 0.5
+    assert not report["passed"]
+
+    report = backend_check.check_backend("album", "categories.txt", "torch", keep_top_k=2)
+    assert report["category_agreement"] == 1.0
+    assert report["topk_overlap"] == 1.0
+    assert report["passed"]
+
+def test_optimize_check_exit_code(stub_models, tmp_path):
+    """optimize.py check fails the command when the backend does not pass"""
+    album = tmp_path / "album"
+    album.mkdir()
+    categories = tmp_path / "categories.txt"
+    categories.write_text("1. people\n2. places\n")
+    runner = CliRunner()
+
+    result = runner.invoke(optimize.main, ["check", str(album), str(categories), "--backend", "int8"])
+    assert result.exit_code == 1
+    assert "FAILED" in result.output
+
+    result = runner.invoke(optimize.main, ["check", str(album), str(categories), "--backend", "torch",
+                                           "--keep-top-k", "2"])
+    assert result.exit_code == 0
+    assert "PASSED" in result.output
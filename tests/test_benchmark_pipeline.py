@@ -0,0 +1,26 @@
+from PIL import Image
+
+from benchmark_pipeline import compare_to_baseline, make_synthetic_album
+
+def make_report(forward_seconds, rss=1000.0):
+    return {
+        "config": {"photos": 4, "resolution": [64, 48], "batch_size": None, "categories_file": "list.txt"},
+        "runs": {"end_to_end": {"seconds": 10.0, "stages": {"forward": {"seconds": forward_seconds, "calls": 2}}}},
+        "peak_rss_mb": rss,
+    }
+
+def test_synthetic_album_is_reproducible(tmp_path):
+    """The same seed writes the same photos at the requested resolution"""
+    first = make_synthetic_album(str(tmp_path / "a"), 2, 64, 48)
+    second = make_synthetic_album(str(tmp_path / "b"), 2, 64, 48)
+    with Image.open(first[0]) as img:
+        assert img.size == (64, 48)
+    assert [open(p, "rb").read() for p in first] == [open(p, "rb").read() for p in second]
+
+def test_regressions_are_flagged_beyond_tolerance():
+    """Only metrics slower than the baseline by more than the tolerance are reported"""
+    baseline = make_report(forward_seconds=4.0)
+    assert compare_to_baseline(make_report(forward_seconds=4.4), baseline, tolerance=0.15) == []
+
+    regressions = compare_to_baseline(make_report(forward_seconds=6.0, rss=1500.0), baseline, tolerance=0.15)
+    assert [metric for metric, _, _ in regressions] == ["peak_rss_mb", "runs.end_to_end.stages.forward"]
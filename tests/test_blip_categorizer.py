@@ -1,7 +1,14 @@
 import os
 import json
 import random
+from contextlib import contextmanager
+from types import SimpleNamespace
 import pytest
+import torch
+import torch.nn.functional as F
+from PIL import Image
+from core import blip_categorizer
+from core.backends import EncoderSet
 from core.blip_categorizer import BlipCategorizer
 
 ALBUM_PATH = "/Users/noehsueh/Projects/Personal/photo-dump-ai/test_album"
@@ -35,3 +42,60 @@ def test_categorize_album(categorizer):
     with open("test_blip_results.json", 'r') as f:
         saved_results = json.load(f)
     assert saved_results == results
+
+
+def test_similarity_matches_per_pair_loop():
+    """The single matmul scores each photo and category by its best matching query token"""
+    generator = torch.Generator().manual_seed(0)
+    image_feats = F.normalize(torch.randn(5, 32, 16, generator=generator), dim=-1)
+    text_feats = F.normalize(torch.randn(3, 16, generator=generator), dim=-1)
+
+    expected = torch.empty(5, 3)
+    for i in range(5):
+        for j in range(3):
+            expected[i, j] = max(float(image_feats[i, q] @ text_feats[j]) for q in range(32))
+
+    torch.testing.assert_close(BlipCategorizer.similarity(image_feats, text_feats), expected)
+
+class StubBlipProcessor:
+    image_processor = SimpleNamespace(size={"height": 8, "width": 8})
+
+    def __call__(self, images=None, text=None, return_tensors="pt", padding=False):
+        if images is not None:
+            return {"pixel_values": torch.tensor([img.getpixel((0, 0)) for img in images], dtype=torch.float32)}
+        return {"input_ids": torch.tensor([[len(t)] for t in text]), "attention_mask": torch.ones(len(text), 1)}
+
+def test_category_prompts_are_encoded_once(monkeypatch, tmp_path):
+    """Only the vision side runs per batch; the category prompts are encoded once"""
+    image_batches, text_calls = [], []
+
+    def encode_image(pixel_values):
+        image_batches.append(len(pixel_values))
+        return F.normalize(pixel_values[:, None, :].repeat(1, 2, 1), dim=-1)
+
+    def encode_text(input_ids, attention_mask):
+        text_calls.append(len(input_ids))
+        return F.normalize(torch.eye(len(input_ids), 3), dim=-1)
+
+    encoders = EncoderSet({"image": encode_image, "text": encode_text}, StubBlipProcessor(), {})
+
+    @contextmanager
+    def checkout_encoders(backend, artifacts_dir):
+        yield encoders
+
+    monkeypatch.setattr(blip_categorizer, "get_encoders", lambda backend, artifacts_dir: encoders)
+    monkeypatch.setattr(blip_categorizer, "checkout_encoders", checkout_encoders)
+    categories_file = tmp_path / "categories.txt"
+    categories_file.write_text("1. Red\n2. Green\n")
+    photos = []
+    for i, color in enumerate([(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 0, 0), (0, 255, 0)]):
+        photos.append(str(tmp_path / f"photo_{i}.png"))
+        Image.new("RGB", (8, 8), color).save(photos[-1])
+
+    categorizer = BlipCategorizer(str(categories_file))
+    results = categorizer.categorize_photos(photos, batch_size=2)
+    categorizer.categorize_photos(photos[:2], batch_size=2)
+
+    assert image_batches == [2, 2, 1, 2]
+    assert text_calls == [3]
+    assert [results[photo]["categoryNumber"] for photo in photos] == [0, 1, 2, 0, 1]
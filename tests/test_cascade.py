@@ -0,0 +1,33 @@
+import pytest
+from core.cascade import screen_scores, screen_candidates, cascade_recall
+
+def test_screen_scores_standardize_each_signal():
+    # Quality margins are tiny next to CLIP logits but still count with equal weight
+    quality = {"a": 0.1, "b": 0.3, "c": 0.2}
+    relevance = {"a": 30.0, "b": 10.0, "c": 20.0}
+    scores = screen_scores(quality, relevance, aesthetic_weight=0.5)
+    assert scores["c"] == pytest.approx(0.0)
+    assert scores["a"] == pytest.approx(scores["b"])
+
+    only_relevance = screen_scores(quality, relevance, aesthetic_weight=0.0)
+    assert max(only_relevance, key=only_relevance.get) == "a"
+    assert screen_scores({"a": 1.0}, {"a": 5.0}, 0.5) == {"a": 0.0}
+
+def test_screen_candidates_keeps_best_in_original_order():
+    candidates = {"beach": ["a", "b", "c", "d"], "food": ["e", "f"]}
+    scores = {"beach": {"a": 0.1, "b": 0.9, "c": 0.2, "d": 0.8}}
+    assert screen_candidates(candidates, scores, keep=2) == {"beach": ["b", "d"], "food": ["e", "f"]}
+    assert screen_candidates(candidates, {}, keep=0) == candidates
+
+def test_cascade_recall():
+    full_scores = {
+        "beach": [("a", 5.0), ("b", 4.0), ("c", 3.0), ("d", 1.0)],
+        "food": [("e", 2.0)],
+    }
+    screened = {"beach": ["b", "c", "d"], "food": ["e"]}
+    report = cascade_recall(full_scores, screened, keep_top_k=2)
+
+    assert report["categories"]["beach"] == {"candidates": 4, "screened": 3, "recall": 0.5, "missed": ["a"]}
+    assert report["categories"]["food"]["recall"] == 1.0
+    assert report["recall"] == pytest.approx(2 / 3)
+    assert report["scored_fraction"] == pytest.approx(4 / 5)
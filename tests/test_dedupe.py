@@ -0,0 +1,43 @@
+import shutil
+import numpy as np
+import pytest
+from PIL import Image
+from core.dedupe import dhash, find_duplicate_groups
+
+@pytest.fixture
+def album(tmp_path):
+    """Fixture to provide an album with an exact copy, a near-duplicate and an unrelated photo"""
+    rng = np.random.default_rng(0)
+    scene = (rng.random((48, 64, 3)) * 255).astype(np.uint8)
+    scene = np.asarray(Image.fromarray(scene).resize((640, 480), Image.BILINEAR))
+    other = (rng.random((48, 64, 3)) * 255).astype(np.uint8)
+    other = np.asarray(Image.fromarray(other).resize((640, 480), Image.BILINEAR))
+
+    paths = {
+        "original": tmp_path / "burst_1.jpg",
+        "copy": tmp_path / "burst_1_copy.jpg",
+        "retake": tmp_path / "burst_2.jpg",
+        "other": tmp_path / "other.jpg",
+    }
+    Image.fromarray(scene).save(paths["original"], quality=95)
+    shutil.copy(paths["original"], paths["copy"])
+    Image.fromarray(np.clip(scene.astype(np.int16) + 3, 0, 255).astype(np.uint8)).save(paths["retake"], quality=80)
+    Image.fromarray(other).save(paths["other"], quality=95)
+    return {name: str(path) for name, path in paths.items()}
+
+def test_dhash_is_stable_under_small_changes(album):
+    distance = bin(dhash(album["original"]) ^ dhash(album["retake"])).count("1")
+    assert distance <= 6
+    assert bin(dhash(album["original"]) ^ dhash(album["other"])).count("1") > 6
+
+def test_find_duplicate_groups(album):
+    groups = find_duplicate_groups(list(album.values()))
+    assert len(groups) == 2
+
+    burst = next(group for group in groups.values() if album["original"] in group)
+    assert sorted(burst) == sorted([album["original"], album["copy"], album["retake"]])
+    assert groups[album["other"]] == [album["other"]]
+
+    # The largest file of a group represents it
+    representative = next(rep for rep, group in groups.items() if group is burst)
+    assert representative in (album["original"], album["copy"])
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+from core.embedding_cache import EmbeddingCache, MemoryEmbeddingCache
+
+MODEL_ID = "test/model"
+
+@pytest.fixture
+def photos(tmp_path):
+    """Fixture to provide a few small files standing in for photos"""
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"photo_{i}.jpg"
+        path.write_bytes(f"photo-{i}".encode() * 100)
+        paths.append(str(path))
+    return paths
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache"), max_size_mb=1)
+    yield cache
+    cache.close()
+
+def test_round_trip_and_counters(cache, photos):
+    """Values come back unchanged and lookups are counted"""
+    values = {path: np.full((2, 3), i, dtype=np.float32) for i, path in enumerate(photos)}
+    assert cache.get_many(photos, MODEL_ID, 1, "image_feats") == {}
+    cache.put_many(values, MODEL_ID, 1, "image_feats")
+
+    found = cache.get_many(photos, MODEL_ID, 1, "image_feats")
+    assert set(found) == set(photos)
+    for path in photos:
+        np.testing.assert_array_equal(found[path], values[path])
+
+    stats = cache.stats()
+    assert stats["hits"] == len(photos)
+    assert stats["misses"] == len(photos)
+
+def test_key_includes_content_model_and_version(cache, photos, tmp_path):
+    """Renamed copies hit the cache, other models and versions miss it"""
+    cache.put(photos[0], MODEL_ID, 1, "image_feats", np.ones(3, dtype=np.float32))
+
+    copy = tmp_path / "renamed.jpg"
+    copy.write_bytes(open(photos[0], "rb").read())
+    assert cache.get(str(copy), MODEL_ID, 1, "image_feats") is not None
+    assert cache.get(photos[0], "other/model", 1, "image_feats") is None
+    assert cache.get(photos[0], MODEL_ID, 2, "image_feats") is None
+
+def test_lru_eviction(cache, photos):
+    """Least recently used entries are evicted once the size limit is exceeded"""
+    big = 400 * 1024 // 4  # 400 KiB of float32
+    cache.put(photos[0], MODEL_ID, 1, "image_feats", np.zeros(big, dtype=np.float32))
+    cache.put(photos[1], MODEL_ID, 1, "image_feats", np.zeros(big, dtype=np.float32))
+    cache.get(photos[0], MODEL_ID, 1, "image_feats")  # photo_0 is now the most recently used
+    cache.put(photos[2], MODEL_ID, 1, "image_feats", np.zeros(big, dtype=np.float32))
+
+    assert cache.get(photos[1], MODEL_ID, 1, "image_feats") is None
+    assert cache.get(photos[0], MODEL_ID, 1, "image_feats") is not None
+    assert cache.stats()["evictions"] == 1
+
+def test_memory_layer_serves_repeat_lookups(cache, photos):
+    """Values read through the memory layer are kept in memory and new values reach the disk cache"""
+    cache.put(photos[0], MODEL_ID, 1, "image_feats", np.ones(3, dtype=np.float32))
+    memory = MemoryEmbeddingCache(cache, max_size_mb=1)
+
+    assert set(memory.get_many(photos[:2], MODEL_ID, 1, "image_feats")) == {photos[0]}
+    memory.put(photos[1], MODEL_ID, 1, "image_feats", np.zeros(3, dtype=np.float32))
+    disk_lookups = cache.hits + cache.misses
+
+    assert set(memory.get_many(photos[:2], MODEL_ID, 1, "image_feats")) == set(photos[:2])
+    assert cache.hits + cache.misses == disk_lookups
+    assert cache.get(photos[1], MODEL_ID, 1, "image_feats") is not None
+
+def test_lookups_do_not_write_and_eviction_prunes_digests(cache, photos):
+    """Reads leave the database untouched until the next store, which also drops digests of evicted entries"""
+    big = 700 * 1024 // 4  # 700 KiB of float32, so each store evicts the previous one
+    cache.put(photos[0], MODEL_ID, 1, "image_feats", np.zeros(big, dtype=np.float32))
+    changes = cache._conn.total_changes
+    assert cache.get(photos[0], MODEL_ID, 1, "image_feats") is not None
+    assert cache._conn.total_changes == changes
+
+    cache.put(photos[1], MODEL_ID, 1, "image_feats", np.zeros(big, dtype=np.float32))
+    digests = {row[0] for row in cache._conn.execute("SELECT sha256 FROM files")}
+    assert digests == {cache.content_hash(photos[1])}
+
+def test_size_limit_holds_across_processes(cache, photos):
+    """Stores from another connection (e.g. a shard worker) count towards the size limit"""
+    worker = EmbeddingCache(cache.cache_dir, max_size_mb=1)
+    big = 400 * 1024 // 4  # 400 KiB of float32, so three of them exceed the limit
+    try:
+        cache.put(photos[0], MODEL_ID, 1, "image_feats", np.zeros(big, dtype=np.float32))
+        worker.put(photos[1], MODEL_ID, 1, "image_feats", np.zeros(big, dtype=np.float32))
+        cache.put(photos[2], MODEL_ID, 1, "image_feats", np.zeros(big, dtype=np.float32))
+        worker.put(photos[3], MODEL_ID, 1, "image_feats", np.zeros(big, dtype=np.float32))
+
+        assert cache.stats()["size_mb"] <= 1
+        assert worker.stats()["size_mb"] == cache.stats()["size_mb"]
+        assert cache.evictions + worker.evictions == 2
+    finally:
+        worker.close()
@@ -0,0 +1,45 @@
+import os
+import pytest
+from utils.folders import FolderRegistry, scan_images
+
+@pytest.fixture
+def folder(tmp_path):
+    """Fixture to provide a nested photo folder with a hidden directory and a non-image file"""
+    root = tmp_path / "photos"
+    for relative in ("a.jpg", "2023/b.JPG", "2023/trip/c.png", ".thumbnails/d.jpg", "2023/notes.txt"):
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * 10)
+    return root
+
+def test_scan_is_recursive(folder):
+    listing = scan_images(str(folder), num_workers=4)
+    assert list(listing) == sorted(["a.jpg", os.path.join("2023", "b.JPG"), os.path.join("2023", "trip", "c.png")])
+    assert all(size == 10 for size, _ in listing.values())
+
+def test_rescan_reports_changes(folder, tmp_path):
+    registry = FolderRegistry(str(tmp_path / "registry.json"))
+    first = registry.register(str(folder))
+    assert first["photos"] == 3 and len(first["added"]) == 3
+
+    (folder / "a.jpg").write_bytes(b"y" * 20)
+    (folder / "2023" / "b.JPG").unlink()
+    (folder / "e.jpeg").write_bytes(b"z")
+    reloaded = FolderRegistry(registry.path)
+    (scan,) = reloaded.rescan()
+    assert scan["added"] == ["e.jpeg"]
+    assert scan["changed"] == ["a.jpg"]
+    assert scan["removed"] == [os.path.join("2023", "b.JPG")]
+    assert reloaded.rescan()[0]["changed"] == []
+
+def test_contains_only_registered_photos(folder, tmp_path):
+    registry = FolderRegistry(str(tmp_path / "registry.json"))
+    registry.register(str(folder))
+    assert registry.contains(str(folder / "2023" / "trip" / "c.png"))
+    assert not registry.contains(str(folder / "2023" / "notes.txt"))
+    assert not registry.contains(str(folder / ".." / "registry.json"))
+    assert len(registry.photos()) == 3
+
+    registry.clear()
+    assert registry.photos() == [] and not os.path.exists(registry.path)
+    assert (folder / "a.jpg").exists()
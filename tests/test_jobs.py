@@ -0,0 +1,59 @@
+import threading
+import pytest
+from utils.jobs import JobCancelled, JobManager
+
+TIMEOUT = 5.0
+
+@pytest.fixture
+def manager():
+    manager = JobManager(max_workers=1, keep_finished=2)
+    yield manager
+    manager.shutdown()
+
+def run_to_end(manager, fn):
+    """Submit `fn` and wait until its completion callback ran"""
+    finished = threading.Event()
+    job = manager.submit("test", fn, on_done=lambda _: finished.set())
+    assert finished.wait(TIMEOUT)
+    return job
+
+def test_job_lifecycle(manager):
+    """Jobs queue behind the running one, then complete with their result or fail with their error"""
+    started, release = threading.Event(), threading.Event()
+
+    def blocking(job):
+        started.set()
+        release.wait(TIMEOUT)
+        return "result"
+
+    finished = threading.Event()
+    first = manager.submit("first", blocking, on_done=lambda _: finished.set())
+    assert started.wait(TIMEOUT)
+    second = manager.submit("second", lambda job: None)
+    assert (first.status, second.status) == ("running", "queued")
+    assert manager.active() == [first, second]
+
+    release.set()
+    assert finished.wait(TIMEOUT)
+    assert first.status == "completed" and first.result == "result"
+    assert first.started_at <= first.finished_at
+
+    def failing(job):
+        raise ValueError("broken photo")
+    failed = run_to_end(manager, failing)
+    assert failed.status == "failed" and failed.error == "broken photo"
+    assert manager.get(failed.id).to_dict()["status"] == "failed"
+
+def test_cancellation_and_forgetting(manager):
+    """A job that honours its cancel event ends cancelled, and only the newest finished jobs are kept"""
+    def cancelled(job):
+        job.cancel()
+        if job.cancel_event.is_set():
+            raise JobCancelled("stopped")
+    job = run_to_end(manager, cancelled)
+    assert job.status == "cancelled" and job.error == "stopped"
+
+    later = [run_to_end(manager, lambda job, i=i: i) for i in range(3)]
+    manager.submit("trigger", lambda job: None)  # Old jobs are forgotten when a new one is queued
+    assert manager.get(job.id) is None and manager.get(later[0].id) is None
+    assert manager.get(later[-1].id).result == 2
@@ -0,0 +1,62 @@
+import errno
+import os
+import pytest
+from utils import materialize as m
+
+@pytest.fixture
+def photo(tmp_path):
+    path = tmp_path / "album" / "IMG_0001.jpg"
+    path.parent.mkdir()
+    path.write_bytes(b"\xff\xd8" + os.urandom(1024))
+    (tmp_path / "output").mkdir()
+    return str(path)
+
+def test_hardlink_and_symlink(photo, tmp_path):
+    hardlink = str(tmp_path / "output" / "hard.jpg")
+    assert m.materialize(photo, hardlink, "hardlink") == "hardlink"
+    assert os.path.samefile(photo, hardlink)
+    assert m.is_materialized(photo, hardlink, "hardlink")
+    assert not m.is_materialized(photo, hardlink, "copy")
+
+    symlink = str(tmp_path / "output" / "soft.jpg")
+    assert m.materialize(photo, symlink, "symlink") == "symlink"
+    assert os.path.islink(symlink) and not os.path.isabs(os.readlink(symlink))
+    assert m.link_method(photo, symlink) == "symlink"
+    assert not m.is_materialized(photo, symlink, "auto")
+    assert sorted(os.listdir(tmp_path / "output")) == ["hard.jpg", "soft.jpg"]
+
+def test_falls_back_to_copy(photo, tmp_path, monkeypatch):
+    def cross_device(src, dst):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+    monkeypatch.setattr(m.os, "link", cross_device)
+    monkeypatch.setattr(m, "reflink", cross_device)
+
+    dst = str(tmp_path / "output" / "IMG_0001.jpg")
+    assert m.materialize(photo, dst, "auto") == "copy"
+    assert m.link_method(photo, dst) == "copy"
+    assert m.is_materialized(photo, dst, "auto")
+    assert os.listdir(tmp_path / "output") == ["IMG_0001.jpg"]
+
+    os.utime(photo, ns=(0, 0))
+    assert not m.is_materialized(photo, dst, "auto")
+
+def test_failed_copy_leaves_no_partial_file(photo, tmp_path, monkeypatch):
+    def disk_full(src, dst):
+        with open(dst, 'wb') as f:
+            f.write(b"\xff\xd8")
+        raise OSError(errno.ENOSPC, "No space left on device")
+    monkeypatch.setattr(m.shutil, "copy2", disk_full)
+
+    with pytest.raises(OSError):
+        m.materialize(photo, str(tmp_path / "output" / "IMG_0001.jpg"), "copy")
+    assert os.listdir(tmp_path / "output") == []
+
+def test_selection_round_trip(tmp_path):
+    entries = {"beach": [{"file": "a.jpg", "source": "/album/a.jpg", "path": "beach/a.jpg", "method": "hardlink"}]}
+    m.write_selection(str(tmp_path), "album", entries)
+    selection = m.read_selection(str(tmp_path))
+    assert selection["categories"] == entries
+    assert os.path.isabs(selection["album"])
+
+    (tmp_path / m.SELECTION_FILE).write_text("{broken")
+    assert m.read_selection(str(tmp_path)) is None
@@ -0,0 +1,24 @@
+import time
+from core.model_pool import ModelPool
+
+IDLE_TIMEOUT = 0.05
+
+def test_checked_out_models_are_never_idle():
+    """A model in use for longer than the idle timeout is neither evicted nor loaded a second time"""
+    loads = []
+    pool = ModelPool(idle_timeout=IDLE_TIMEOUT)
+    pool.register("model", lambda: loads.append(object()) or loads[-1])
+
+    with pool.checkout("model") as model:
+        time.sleep(2 * IDLE_TIMEOUT)
+        assert pool.evict_idle() == []
+        with pool.checkout("model") as shared:
+            assert shared is model
+        time.sleep(2 * IDLE_TIMEOUT)
+        assert pool.evict_idle() == []
+        assert pool.status()["model"]["checkouts"] == 1
+
+    assert pool.evict_idle() == []  # Idle time starts when the last caller releases it
+    time.sleep(2 * IDLE_TIMEOUT)
+    assert pool.evict_idle() == ["model"]
+    assert len(loads) == 1
@@ -0,0 +1,73 @@
+import os
+import numpy as np
+import pytest
+from PIL import Image
+from core.backends import cache_model_id
+from core.photo_dumper import PhotoDumper
+from core.photo_ranker import CLIP_MODEL_ID, PREPROCESS_VERSION
+from core.progress import ProgressTracker
+from core.vector_index import VectorIndex, SEARCH_INDEX_FILE
+
+@pytest.fixture
+def album(tmp_path):
+    """Fixture to provide a small album, a category file and an output directory"""
+    album = tmp_path / "album"
+    album.mkdir()
+    for i in range(6):
+        Image.new("RGB", (8, 8), (40 * i, 0, 0)).save(album / f"IMG_{i}.jpg")
+    categories = tmp_path / "categories.txt"
+    categories.write_text("1. beach\n2. food\n")
+    return str(album), str(categories), str(tmp_path / "output")
+
+def test_search_index_reuses_ranking_embeddings(album, tmp_path):
+    """Indexing reads what ranking cached and never runs CLIP itself"""
+    album_path, categories_file, output_dir = album
+    dumper = PhotoDumper(album_path, categories_file, output_dir=output_dir, cache_dir=str(tmp_path / "cache"))
+    dumper._get_selector = lambda: pytest.fail("Indexing must not load CLIP")
+    photos = sorted(os.path.join(album_path, name) for name in os.listdir(album_path))
+    ranked = {photo: np.full(4, i, dtype=np.float32) for i, photo in enumerate(photos[:4], 1)}
+    dumper.cache.put_many(ranked, cache_model_id(CLIP_MODEL_ID, dumper.backend), PREPROCESS_VERSION, "clip_image_embeds")
+
+    dumper._build_search_index(photos, ProgressTracker("index", None))
+    index = VectorIndex.load(os.path.join(output_dir, SEARCH_INDEX_FILE))
+    assert list(index.ids) == photos[:4]
+
+def test_screened_out_photos_never_reach_vit_l(album, tmp_path, monkeypatch):
+    """With the cascade on, photos the screener drops are neither scored by ViT-L nor indexed"""
+    album_path, categories_file, output_dir = album
+    dumper = PhotoDumper(album_path, categories_file, keep_top_k=1, output_dir=output_dir,
+                         cache_dir=str(tmp_path / "cache"), dedupe=False, search_index=True, screen_keep=2,
+                         output_mode="copy")
+    photos = sorted(os.path.join(album_path, name) for name in os.listdir(album_path))
+    rank = {photo: float(i) for i, photo in enumerate(photos)}  # Screening prefers later photos
+    full_scored = []
+
+    class Screener:
+        def score_components(self, candidates, batch_size, progress):
+            paths = {photo for category_photos in candidates.values() for photo in category_photos}
+            relevance = {category: {photo: rank[photo] for photo in category_photos}
+                         for category, category_photos in candidates.items()}
+            return {photo: rank[photo] for photo in paths}, relevance
+
+    def score_components(candidates, progress):
+        """Full scorer, which caches the ViT-L embedding of everything it scores"""
+        paths = sorted({photo for category_photos in candidates.values() for photo in category_photos})
+        full_scored.extend(paths)
+        embeds = {photo: np.full(4, rank[photo], dtype=np.float32) for photo in paths}
+        dumper.cache.put_many(embeds, cache_model_id(CLIP_MODEL_ID, dumper.backend), PREPROCESS_VERSION,
+                              "clip_image_embeds")
+        return {photo: 0.0 for photo in paths}, {category: {photo: 0.0 for photo in category_photos}
+                                                 for category, category_photos in candidates.items()}
+
+    # Even photos are beach, odd ones food
+    monkeypatch.setattr(dumper, "_predict_probabilities", lambda paths, progress: np.array(
+        [[0.0, 0.8, 0.2] if photos.index(photo) % 2 == 0 else [0.0, 0.2, 0.8] for photo in paths]
+    ))
+    monkeypatch.setattr(dumper, "_score_components", score_components)
+    monkeypatch.setattr(dumper, "_get_selector", lambda: pytest.fail("Only the full scorer may run ViT-L"))
+    dumper._screener = Screener()
+    dumper.process()
+
+    assert full_scored == photos[2:]
+    index = VectorIndex.load(os.path.join(output_dir, SEARCH_INDEX_FILE))
+    assert list(index.ids) == photos[2:]
@@ -1,5 +1,13 @@
 import json
+from contextlib import contextmanager
+from types import SimpleNamespace
 import pytest
+import torch
+import torch.nn.functional as F
+from PIL import Image
+from core import photo_ranker
+from core.backends import EncoderSet
+from core.model_pool import ModelPool
 from core.photo_ranker import get_category_list, AestheticClipSelector
 
 @pytest.fixture
@@ -124,3 +132,86 @@ def test_photo_ranker(test_category_results, tmp_path):
     assert test_ranked_categories_file.exists()
 
 
+
+
+EMBED_DIM = 4
+
+class StubClipProcessor:
+    image_processor = SimpleNamespace(size={"shortest_edge": 8})
+
+    def __call__(self, images=None, text=None, return_tensors="pt", padding=False, truncation=False):
+        if images is not None:
+            return {"pixel_values": torch.tensor([img.getpixel((0, 0)) for img in images], dtype=torch.float32)}
+        ids = torch.tensor([[len(t), sum(map(ord, t)) % 17, 1.0] for t in text])
+        return {"input_ids": ids, "attention_mask": torch.ones(len(text), 3)}
+
+@pytest.fixture
+def stub_clip(monkeypatch):
+    """Stub CLIP encoders and aesthetic head recording what they are called with"""
+    calls = {"image_batches": [], "image_embeds": [], "head_inputs": []}
+    generator = torch.Generator().manual_seed(0)
+    image_projection = torch.randn(3, EMBED_DIM, generator=generator)
+    text_projection = torch.randn(3, EMBED_DIM, generator=generator)
+
+    def encode_image(pixel_values):
+        calls["image_batches"].append(len(pixel_values))
+        embeds = pixel_values / 255 @ image_projection
+        calls["image_embeds"].append(embeds)
+        return embeds
+
+    def encode_text(input_ids, attention_mask):
+        return input_ids.float() @ text_projection
+
+    encoders = EncoderSet({"image": encode_image, "text": encode_text}, StubClipProcessor(),
+                          {"logit_scale": 10.0, "projection_dim": EMBED_DIM})
+
+    @contextmanager
+    def checkout_clip_encoders(clip_model_id, backend, artifacts_dir):
+        yield encoders
+
+    head = torch.nn.Linear(EMBED_DIM, 1)
+    head.projection_dim = EMBED_DIM
+    head.register_forward_hook(lambda module, inputs, output: calls["head_inputs"].append(inputs[0]))
+    monkeypatch.setattr(photo_ranker, "model_pool", ModelPool())
+    monkeypatch.setattr(photo_ranker, "load_aesthetic_head", lambda model_id: head)
+    monkeypatch.setattr(photo_ranker, "get_clip_encoders", lambda clip_model_id, backend, artifacts_dir: encoders)
+    monkeypatch.setattr(photo_ranker, "checkout_clip_encoders", checkout_clip_encoders)
+    return calls
+
+@pytest.fixture
+def color_photos(tmp_path):
+    colors = [(250, 10, 10), (10, 250, 10), (10, 10, 250), (200, 200, 20), (20, 200, 200)]
+    paths = []
+    for i, color in enumerate(colors):
+        paths.append(str(tmp_path / f"photo_{i}.png"))
+        Image.new("RGB", (8, 8), color).save(paths[-1])
+    return paths
+
+def test_batched_scores_match_one_photo_at_a_time(stub_clip, color_photos):
+    """Photos are encoded once in batches, with the same scores and order as scoring them one by one"""
+    photos = {"a red photo": color_photos[:3], "a blue photo": color_photos[2:]}
+    selector = AestheticClipSelector()
+
+    scores = selector.score_photos(photos, batch_size=2, aesthetic_weight=0.4)
+    ranked = selector.rank_photos(photos, batch_size=2, keep_top_k=2, aesthetic_weight=0.4)
+    # Five distinct photos, the one shared by both categories encoded once, per call
+    assert stub_clip["image_batches"] == [2, 2, 1] * 2
+
+    for category, category_photos in photos.items():
+        expected = [(photo, selector._get_aesthetic_clip_score(photo, category, 0.4)) for photo in category_photos]
+        assert [photo for photo, _ in scores[category]] == category_photos
+        assert [score for _, score in scores[category]] == pytest.approx([score for _, score in expected], abs=1e-5)
+        assert ranked[category] == [photo for photo, _ in sorted(expected, key=lambda x: x[1], reverse=True)[:2]]
+
+def test_aesthetic_head_reuses_the_clip_embedding(stub_clip, color_photos):
+    """The vision tower runs once per photo and the aesthetic head scores that same normalized embedding"""
+    selector = AestheticClipSelector()
+    aesthetic_scores, image_embeds = selector._encode_photos(color_photos, batch_size=2)
+
+    assert sum(stub_clip["image_batches"]) == len(color_photos)
+    torch.testing.assert_close(image_embeds, torch.cat(stub_clip["image_embeds"]))
+    assert len(stub_clip["head_inputs"]) == 1
+    torch.testing.assert_close(stub_clip["head_inputs"][0], F.normalize(image_embeds, dim=-1))
+    with torch.no_grad():
+        expected = selector.aesthetic_head(F.normalize(image_embeds, dim=-1)).reshape(-1)
+    torch.testing.assert_close(aesthetic_scores, expected)
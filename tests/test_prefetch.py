@@ -0,0 +1,33 @@
+import pytest
+from PIL import Image
+from utils.prefetch import PrefetchLoader
+
+@pytest.fixture
+def photos(tmp_path):
+    """Fixture to provide photos whose width encodes their position"""
+    paths = []
+    for i in range(7):
+        path = tmp_path / f"IMG_{i}.png"
+        Image.new("L", (10 + i, 10)).save(path)
+        paths.append(str(path))
+    return paths
+
+def test_batches_keep_input_order(photos):
+    """Batches come out in input order however the decoding threads finish"""
+    loader = PrefetchLoader(photos, batch_size=3, min_side=64, num_workers=4, prefetch_batches=1)
+    batches = list(loader)
+    assert len(batches) == len(loader) == 3
+    assert [path for paths, _ in batches for path in paths] == photos
+    assert [image.size[0] for _, images in batches for image in images] == [10 + i for i in range(7)]
+    assert all(image.mode == "RGB" for _, images in batches for image in images)
+
+def test_decode_errors_reach_the_consumer(photos, tmp_path):
+    """A photo that cannot be decoded fails its own batch after the earlier ones were delivered"""
+    broken = tmp_path / "broken.jpg"
+    broken.write_bytes(b"not an image")
+    loader = PrefetchLoader(photos[:2] + [str(broken)] + photos[2:], batch_size=2, min_side=64, num_workers=4)
+
+    batches = iter(loader)
+    assert next(batches)[0] == photos[:2]
+    with pytest.raises(OSError):
+        next(batches)
@@ -0,0 +1,27 @@
+import time
+from core.progress import ProgressTracker
+
+def test_rate_and_eta_count_only_computed_images():
+    """Cache hits reported up front count as done but not towards the rate"""
+    events = []
+    tracker = ProgressTracker("categorize", events.append, min_interval=0)
+    tracker.update(90, 100)  # 90 cache hits
+    time.sleep(0.2)
+    tracker.update(95, 100)
+
+    event = events[-1]
+    assert event["done"] == 95 and event["skipped"] == 90
+    assert 5 < event["images_per_sec"] < 30  # 5 images in ~0.2s, not 95
+    assert event["eta_seconds"] > 0.1  # 5 images left at that rate
+
+    tracker.update(100, 100)
+    assert events[-1]["eta_seconds"] == 0.0
+
+def test_updates_are_coalesced():
+    """Within the minimum interval only the first and the final update become events"""
+    events = []
+    tracker = ProgressTracker("rank", events.append, min_interval=60)
+    for done in range(0, 101, 10):
+        tracker.update(done, 100)
+    assert [event["done"] for event in events] == [0, 100]
+    assert all(event["stage"] == "rank" for event in events)
@@ -0,0 +1,42 @@
+import os
+import random
+import time
+import numpy as np
+import pytest
+from core import sharding
+from core.autotune import device_profile
+from core.embedding_cache import EmbeddingCache
+from core.sharding import ShardPool
+
+MODEL_ID = "test/model"
+
+def embed_shard(paths):
+    """Worker task: cache one vector per photo, finishing in random order"""
+    time.sleep(random.random() * 0.05)
+    values = {path: np.full(2, int(path.rsplit("_", 1)[1].split(".")[0]), dtype=np.float32) for path in paths}
+    sharding._worker["cache"].put_many(values, MODEL_ID, 1, "vector")
+    return [(os.path.basename(path), device_profile.batch_size("tiny", 0)) for path in paths]
+
+@pytest.fixture
+def photos(tmp_path):
+    paths = []
+    for i in range(40):
+        path = tmp_path / f"photo_{i}.jpg"
+        path.write_bytes(f"photo-{i}".encode())
+        paths.append(str(path))
+    return paths
+
+def test_results_keep_input_order_and_reach_the_cache(photos, tmp_path, monkeypatch):
+    """Shards come back in input order, workers get the parent's profile and their cache writes land"""
+    cache_dir = str(tmp_path / "cache")
+    monkeypatch.setattr(device_profile, "_models", {"tiny": {"dtype": "float32", "batch_size": 8}})
+    pool = ShardPool(4, cache_dir=cache_dir, num_threads=1)
+    try:
+        tasks = [((shard,), len(shard)) for shard in pool._shards(photos, 2)]
+        results = [row for shard in pool._run(embed_shard, tasks) for row in shard]
+    finally:
+        pool.shutdown()
+
+    assert results == [(os.path.basename(path), 8) for path in photos]
+    cached = EmbeddingCache(cache_dir).get_many(photos, MODEL_ID, 1, "vector")
+    assert [int(cached[path][0]) for path in photos] == list(range(40))
@@ -1,9 +1,17 @@
+import contextlib
 import os
 import json
 import random
 
 import pytest
-from core.smolvlm_categorizer import save_results, describe_photos, from_description_to_category, load_results
+import torch
+from PIL import Image
+from transformers import DynamicCache, Idefics3Config, Idefics3ForConditionalGeneration, LlamaConfig, LlamaForCausalLM
+from core import smolvlm_categorizer
+from core.smolvlm_categorizer import (
+    save_results, describe_photos, from_description_to_category, load_results, describe_and_categorize,
+    _classification_prompt_parts, _generate_after_prefix, _suffix_embeddings
+)
 
 ALBUM_PATH = "/Users/noehsueh/Projects/Personal/photo-dump-ai/test_album"
 CATEGORIES_PATH = "/Users/noehsueh/Projects/Personal/photo-dump-ai/photodump_list.txt"
@@ -54,3 +62,97 @@ def test_from_description_to_category(description_file, sample_categories):
     assert len(categories) == N
 
 
+
+def test_classification_prompts_share_a_prefix(sample_categories):
+    """Only the part from the image on differs between photos, and the image stays in the prompt"""
+    class ChatProcessor:
+        image_token = "<image>"
+
+        def apply_chat_template(self, messages, add_generation_prompt=False):
+            text = "".join(part.get("text", self.image_token) for part in messages[0]["content"])
+            return f"User:{text}<end_of_utterance>\nAssistant:"
+
+    prefix, before_description, after_description = _classification_prompt_parts(ChatProcessor(), sample_categories)
+    assert prefix.startswith("User:Here are some categories:")
+    assert prefix.endswith("does this image belong to?")
+    assert before_description == '<image>Its description: "'
+    assert after_description == '"<end_of_utterance>\nAssistant:'
+
+def test_cached_prefix_generation_matches_uncached():
+    """Generating a padded batch after the cached prefix gives the tokens of generating from each full prompt"""
+    torch.manual_seed(0)
+    config = LlamaConfig(vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+                         num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=128)
+    model = LlamaForCausalLM(config).eval()
+    prefix_ids = [1, 5, 9, 12, 7]
+    suffixes = [[3, 4], [20, 21, 22, 23, 24, 25], [8, 30, 31]]
+    with torch.no_grad():
+        prefix_cache = model(input_ids=torch.tensor([prefix_ids]), past_key_values=DynamicCache(),
+                             use_cache=True).past_key_values
+        rows = [(ids, model.get_input_embeddings()(torch.tensor(ids))) for ids in suffixes]
+
+    cached = _generate_after_prefix(model, prefix_cache, prefix_ids, rows, 8, {config.eos_token_id},
+                                    repetition_penalty=1.2)
+    for ids, tokens in zip(suffixes, cached):
+        prompt = torch.tensor([prefix_ids + ids])
+        expected = model.generate(prompt, attention_mask=torch.ones_like(prompt), max_new_tokens=8, do_sample=False,
+                                  repetition_penalty=1.2, pad_token_id=0)
+        assert tokens == expected[0, prompt.shape[1]:].tolist()
+
+def test_cached_prefix_classification_keeps_the_image():
+    """Classifying images after the cached prefix gives the tokens of generate on each full prompt with its image"""
+    torch.manual_seed(0)
+    config = Idefics3Config(
+        vision_config={"hidden_size": 32, "intermediate_size": 64, "num_hidden_layers": 1, "num_attention_heads": 4,
+                       "image_size": 32, "patch_size": 8},
+        text_config={"vocab_size": 64, "hidden_size": 32, "intermediate_size": 64, "num_hidden_layers": 2,
+                     "num_attention_heads": 4, "num_key_value_heads": 2, "pad_token_id": 0, "eos_token_id": 2},
+        scale_factor=2, image_token_id=60
+    )
+    model = Idefics3ForConditionalGeneration(config).eval()
+    prefix_ids = [1, 5, 9, 12]
+    image_ids = [61] + [60] * 4 + [61]  # 16 patches, 4 image tokens after the pixel shuffle
+    suffixes = [image_ids + [3, 4], image_ids + [20, 21, 22, 23, 24], image_ids + [8]]
+    width = max(len(ids) for ids in suffixes)
+    inputs = {  # Left-padded, as the processor pads
+        "input_ids": torch.tensor([[0] * (width - len(ids)) + ids for ids in suffixes]),
+        "attention_mask": torch.tensor([[0] * (width - len(ids)) + [1] * len(ids) for ids in suffixes]),
+        "pixel_values": torch.randn(len(suffixes), 1, 3, 32, 32),
+    }
+    with torch.no_grad():
+        prefix_cache = model(input_ids=torch.tensor([prefix_ids]), past_key_values=DynamicCache(),
+                             use_cache=True).past_key_values
+
+    cached = _generate_after_prefix(model, prefix_cache, prefix_ids, _suffix_embeddings(model, inputs), 8,
+                                    {config.text_config.eos_token_id}, repetition_penalty=1.2)
+    for row, (ids, tokens) in enumerate(zip(suffixes, cached)):
+        prompt = torch.tensor([prefix_ids + ids])
+        expected = model.generate(prompt, attention_mask=torch.ones_like(prompt),
+                                  pixel_values=inputs["pixel_values"][row:row + 1], max_new_tokens=8,
+                                  do_sample=False, repetition_penalty=1.2, pad_token_id=0)
+        assert tokens == expected[0, prompt.shape[1]:].tolist()
+
+def test_describe_and_categorize_decodes_each_photo_once(monkeypatch):
+    """Both passes work on the same decoded images"""
+    loads = []
+    monkeypatch.setattr(smolvlm_categorizer, "load_image", lambda photo: loads.append(photo) or Image.new("RGB", (8, 8)))
+    monkeypatch.setattr(smolvlm_categorizer, "checkout_model", lambda: contextlib.nullcontext((None, None)))
+    monkeypatch.setattr(smolvlm_categorizer, "_encode_prefix", lambda processor, model, categories: "prefix")
+    described = []
+
+    def describe(processor, model, images):
+        described.append(images)
+        return [f"description {len(described)}"] * len(images)
+
+    def classify(processor, model, prefix, images, descriptions, categories):
+        assert prefix == "prefix" and images is described[-1]
+        return [1] * len(images)
+
+    monkeypatch.setattr(smolvlm_categorizer, "_describe_batch", describe)
+    monkeypatch.setattr(smolvlm_categorizer, "_classify_batch", classify)
+    photos = [f"IMG_{i}.jpg" for i in range(5)]
+    results = describe_and_categorize(photos, "1. beach\n", batch_size=2)
+
+    assert loads == photos
+    assert [len(images) for images in described] == [2, 2, 1]
+    assert results["IMG_4.jpg"] == {"description": "description 3", "categoryNumber": 1}
@@ -0,0 +1,50 @@
+import json
+from utils.streaming import Journal, TopK, chunked, count_images, iter_images
+
+HEADER = {"signature": {"blip": "blip@1"}, "categories": ["None", "beach"]}
+
+def test_top_k_keeps_best_and_first_of_ties():
+    top = TopK(2)
+    for item, score in [("a", 1.0), ("b", 3.0), ("c", 2.0), ("d", 3.0), ("e", 0.5)]:
+        top.add(item, score)
+    assert top.items() == [("b", 3.0), ("d", 3.0)]
+
+    unbounded = TopK(0)
+    for i in range(5):
+        unbounded.add(i, float(i))
+    assert len(unbounded) == 5
+
+def test_chunked_and_album_listing(tmp_path):
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    for name in ("a.jpg", "b.PNG", "notes.txt"):
+        (tmp_path / name).write_bytes(b"x")
+    assert count_images(str(tmp_path)) == 2
+    assert sorted(path for path, _ in iter_images(str(tmp_path))) == [str(tmp_path / "a.jpg"), str(tmp_path / "b.PNG")]
+
+def test_journal_resumes_and_ignores_truncated_line(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = Journal(path, HEADER)
+    journal.open()
+    journal.append({"type": "categorized", "path": "a.jpg"})
+    journal.flush()
+    journal.close()
+    with open(path, 'a') as f:
+        f.write('{"type": "categorized", "pa')  # Crash in the middle of a write
+
+    resumed = Journal(path, HEADER)
+    records = list(resumed.replay())
+    assert records == [{"type": "categorized", "path": "a.jpg"}]
+
+    resumed.open(records)
+    resumed.append({"type": "categorized", "path": "b.jpg"})
+    resumed.close()
+    assert [record["path"] for record in Journal(path, HEADER).replay()] == ["a.jpg", "b.jpg"]
+    with open(path) as f:
+        assert json.loads(f.readline())["version"] == 1
+
+def test_journal_with_other_settings_is_discarded(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = Journal(path, HEADER)
+    journal.open([{"type": "categorized", "path": "a.jpg"}])
+    journal.close()
+    assert list(Journal(path, {**HEADER, "categories": ["None", "food"]}).replay()) == []
@@ -0,0 +1,81 @@
+import os
+import numpy as np
+import pytest
+from PIL import Image
+from core.streaming import StreamingPhotoDumper, STREAM_JOURNAL_FILE
+
+class FakeModels:
+    """Stands in for BLIP and CLIP: photo i goes to "beach" if i is even, and scores i."""
+
+    def __init__(self, fail_after=None):
+        self.categorized = []
+        self.fail_after = fail_after
+
+    def predict_probabilities(self, paths, progress):
+        if self.fail_after is not None and len(self.categorized) + len(paths) > self.fail_after:
+            raise RuntimeError("crash")
+        self.categorized += paths
+        rows = [[0.1, 0.8, 0.1] if self.index(path) % 2 == 0 else [0.1, 0.1, 0.8] for path in paths]
+        return np.array(rows)
+
+    def score_components(self, photos, progress):
+        aesthetic = {path: float(self.index(path)) for paths in photos.values() for path in paths}
+        clip = {category: {path: 0.0 for path in paths} for category, paths in photos.items()}
+        return aesthetic, clip
+
+    @staticmethod
+    def index(path):
+        return int(path.rsplit("_", 1)[1].split(".")[0])
+
+@pytest.fixture
+def album(tmp_path):
+    album = tmp_path / "album"
+    album.mkdir()
+    for i in range(10):
+        Image.new("RGB", (8, 8)).save(album / f"IMG_{i}.jpg")
+    categories = tmp_path / "categories.txt"
+    categories.write_text("1. beach\n2. food\n")
+    return str(album), str(categories), str(tmp_path / "output")
+
+def make_dumper(album, models, monkeypatch):
+    album_path, categories_file, output_dir = album
+    dumper = StreamingPhotoDumper(album_path, categories_file, keep_top_k=2, output_dir=output_dir,
+                                  cache_dir=None, output_mode="copy")
+    monkeypatch.setattr(dumper, "_predict_probabilities", models.predict_probabilities)
+    monkeypatch.setattr(dumper, "_score_components", models.score_components)
+    return dumper
+
+def test_resumes_from_journal_after_crash(album, monkeypatch):
+    monkeypatch.setattr("core.streaming.STREAM_CHUNK_SIZE", 4)
+    crashing = FakeModels(fail_after=8)
+    with pytest.raises(RuntimeError):
+        make_dumper(album, crashing, monkeypatch).process()
+    assert len(crashing.categorized) == 8
+
+    models = FakeModels()
+    ranked = make_dumper(album, models, monkeypatch).process()
+    assert len(models.categorized) == 2
+    assert [os.path.basename(path) for path in ranked["beach"]] == ["IMG_8.jpg", "IMG_6.jpg"]
+    assert [os.path.basename(path) for path in ranked["food"]] == ["IMG_9.jpg", "IMG_7.jpg"]
+
+    rerun = FakeModels()
+    make_dumper(album, rerun, monkeypatch).process()
+    assert rerun.categorized == []
+    _, _, output_dir = album
+    with open(os.path.join(output_dir, STREAM_JOURNAL_FILE)) as f:
+        assert sum(1 for _ in f) == 1 + 10 + 10  # Header, then one categorized and one scored record per photo
+
+def test_sources_are_streamed_after_the_album(album, tmp_path, monkeypatch):
+    monkeypatch.setattr("core.streaming.STREAM_CHUNK_SIZE", 4)
+    folder = tmp_path / "folder"
+    folder.mkdir()
+    sources = [str(folder / f"IMG_{i}.jpg") for i in (10, 11)]
+    for source in sources:
+        Image.new("RGB", (8, 8)).save(source)
+    models = FakeModels()
+    dumper = make_dumper(album, models, monkeypatch)
+    dumper.sources = sources + [str(folder / "IMG_12.jpg")]  # The last one was removed since it was registered
+
+    ranked = dumper.process()
+    assert models.categorized[-2:] == sources
+    assert ranked["beach"][0] == sources[0] and ranked["food"][0] == sources[1]
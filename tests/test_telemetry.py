@@ -0,0 +1,44 @@
+from utils.telemetry import Telemetry
+from utils.timing import StageTimer
+
+def test_spans_feed_histogram_and_trace():
+    """Timed stages are observed in the stage histogram and recorded in an active trace"""
+    telemetry = Telemetry()
+    timer = StageTimer()
+    timer.add_listener(telemetry.record_span)
+
+    with timer.stage("decode"):
+        pass
+    with telemetry.trace() as trace:
+        timer.add("forward", 0.3)
+    timer.add("forward", 2.0)  # After the trace ended
+
+    assert telemetry.stage_seconds.count(stage="decode") == 1
+    assert telemetry.stage_seconds.count(stage="forward") == 2
+    spans = [event for event in trace.to_dict()["traceEvents"] if event["ph"] == "X"]
+    assert [(span["name"], round(span["dur"])) for span in spans] == [("forward", 300000)]
+
+def test_prometheus_text_format():
+    """Counters, cumulative histogram buckets and callback gauges are rendered with their labels"""
+    telemetry = Telemetry()
+    telemetry.counter("photos_total", "Photos", ["stage"]).inc(3, stage="categorize")
+    telemetry.stage_seconds.observe(0.2, stage="copy")
+    telemetry.register_callback("queue_depth", "Queued jobs", lambda: 2)
+    text = telemetry.render()
+
+    assert 'photos_total{stage="categorize"} 3.0' in text
+    assert 'photodump_stage_seconds_bucket{stage="copy",le="0.1"} 0' in text
+    assert 'photodump_stage_seconds_bucket{stage="copy",le="0.25"} 1' in text
+    assert 'photodump_stage_seconds_bucket{stage="copy",le="+Inf"} 1' in text
+    assert 'photodump_stage_seconds_count{stage="copy"} 1' in text
+    assert "# TYPE queue_depth gauge\nqueue_depth 2.0" in text
+
+def test_stage_timer_accumulates_calls():
+    """Timed blocks and added durations of the same stage sum into one total"""
+    timer = StageTimer()
+    with timer.stage("decode"):
+        pass
+    timer.add("decode", 0.5)
+    totals = timer.snapshot()["decode"]
+    assert totals["calls"] == 2
+    assert totals["seconds"] >= 0.5
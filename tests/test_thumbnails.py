@@ -0,0 +1,37 @@
+import hashlib
+import os
+from PIL import Image
+from utils.thumbnails import (
+    PINNED_CACHE_CONTROL, THUMBNAIL_SIZES, ensure_thumbnail, is_not_modified, thumbnail_headers
+)
+
+def test_etag_revalidates_to_304():
+    """The ETag follows the content hash, and a client holding it gets a 304"""
+    headers = thumbnail_headers("abc", "small")
+    etag = headers["ETag"]
+    assert etag == '"abc-small"' and headers["Cache-Control"] == "no-cache"
+    assert thumbnail_headers("abc", "small", version="abc")["Cache-Control"] == PINNED_CACHE_CONTROL
+    assert thumbnail_headers("abc", "small", version="old")["Cache-Control"] == "no-cache"
+
+    assert is_not_modified(etag, etag)
+    assert is_not_modified(f'"other-small", W/{etag}', etag)
+    assert is_not_modified("*", etag)
+    assert not is_not_modified('"abc-medium"', etag)
+    assert not is_not_modified(None, etag)
+
+def test_identical_photos_share_one_derivative(tmp_path):
+    """Derivatives are keyed by content hash, created once and fit the requested size"""
+    photo = tmp_path / "IMG_0001.jpg"
+    Image.new("RGB", (1200, 800), (200, 120, 40)).save(photo)
+    copy = tmp_path / "copy.jpg"
+    copy.write_bytes(photo.read_bytes())
+    digest = hashlib.sha256(photo.read_bytes()).hexdigest()
+    thumbnails_dir = tmp_path / ".thumbnails"
+
+    first = ensure_thumbnail(photo, digest, "small", thumbnails_dir)
+    os.utime(first, ns=(0, 0))
+    assert ensure_thumbnail(copy, digest, "small", thumbnails_dir) == first
+    assert os.stat(first).st_mtime_ns == 0  # Not written again
+    with Image.open(first) as img:
+        assert max(img.size) == THUMBNAIL_SIZES["small"]
+    assert os.listdir(thumbnails_dir) == [first.name]
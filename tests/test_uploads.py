@@ -0,0 +1,22 @@
+import asyncio
+import hashlib
+import io
+import os
+from fastapi import UploadFile
+from utils.uploads import save_upload
+
+def upload(data: bytes, filename: str = "IMG_0001.jpg") -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename=filename)
+
+def test_concurrent_saves_to_the_same_name(tmp_path):
+    """Each upload streams to its own temporary file, so the name ends up with one complete upload"""
+    contents = [bytes([i]) * 10_000 for i in range(8)]
+    destination = tmp_path / "IMG_0001.jpg"
+
+    async def save_all():
+        return await asyncio.gather(*(save_upload(upload(data), destination, chunk_size=512) for data in contents))
+    results = asyncio.run(save_all())
+
+    assert results == [(hashlib.sha256(data).hexdigest(), len(data)) for data in contents]
+    assert destination.read_bytes() in contents
+    assert os.listdir(tmp_path) == ["IMG_0001.jpg"]
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from core.vector_index import VectorIndex
+
+@pytest.fixture
+def embeddings():
+    """Fixture to provide clustered random embeddings and their ids"""
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 32))
+    vectors = centers[rng.integers(0, 20, 2000)] + 0.1 * rng.normal(size=(2000, 32))
+    return [f"photo_{i}.jpg" for i in range(len(vectors))], vectors.astype(np.float32)
+
+def test_exact_search_returns_best_match_first(embeddings):
+    ids, vectors = embeddings
+    index = VectorIndex(ids, vectors)
+    results = index.search(vectors[42], k=5)
+    assert results[0][0] == "photo_42.jpg"
+    assert results[0][1] == pytest.approx(1.0, abs=1e-5)
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+def test_ivf_search_agrees_with_exact_search(embeddings, tmp_path):
+    ids, vectors = embeddings
+    exact = VectorIndex(ids, vectors, num_lists=0)
+    approximate = VectorIndex(ids, vectors, num_lists=16)
+    approximate.save(str(tmp_path / "index.npz"))
+    loaded = VectorIndex.load(str(tmp_path / "index.npz"))
+
+    for row in (0, 500, 1999):
+        expected = {photo for photo, _ in exact.search(vectors[row], k=10)}
+        found = {photo for photo, _ in loaded.search(vectors[row], k=10, nprobe=4)}
+        assert len(expected & found) >= 8
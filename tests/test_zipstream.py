@@ -0,0 +1,41 @@
+import io
+import os
+import struct
+import zipfile
+from utils.zipstream import archive_name, stream_zip
+
+ZIP64_EXTRA_ID = 0x0001
+
+def has_zip64_extra(info: zipfile.ZipInfo) -> bool:
+    extra = info.extra
+    while len(extra) >= 4:
+        header_id, size = struct.unpack("<HH", extra[:4])
+        if header_id == ZIP64_EXTRA_ID:
+            return True
+        extra = extra[4 + size:]
+    return False
+
+def test_round_trip_with_zip64_and_crc(tmp_path, monkeypatch):
+    """The streamed archive reads back through zipfile with matching CRCs, using ZIP64 above the limit"""
+    monkeypatch.setattr(zipfile, "ZIP64_LIMIT", 64 * 1024)  # Stands in for 4 GiB
+    files = {
+        "big.jpg": os.urandom(100 * 1024),
+        "notes.txt": b"beach, food\n" * 1000,
+    }
+    entries = []
+    for name, data in files.items():
+        (tmp_path / name).write_bytes(data)
+        entries.append((str(tmp_path / name), archive_name("beach", name)))
+
+    chunks = list(stream_zip(entries, chunk_size=8 * 1024))
+    assert len(chunks) > 2  # Streamed, not built in one piece
+    monkeypatch.undo()
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ["beach/big.jpg", "beach/notes.txt"]
+        for name, data in files.items():
+            assert zf.read(f"beach/{name}") == data
+        big, notes = zf.infolist()
+        assert big.compress_type == zipfile.ZIP_STORED and has_zip64_extra(big)
+        assert notes.compress_type == zipfile.ZIP_DEFLATED and notes.compress_size < notes.file_size
@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+from .utils import IMAGE_EXTENSIONS
+
+REGISTRY_FILE = "registered_folders.json"
+REGISTRY_VERSION = 1
+DEFAULT_SCAN_WORKERS = 16  # Directories listed at the same time; scanning waits on the disk, not the CPU
+
+# Path relative to the registered folder -> (size, mtime_ns)
+FolderListing = Dict[str, Tuple[int, int]]
+
+
+def _scan_directory(directory: str) -> Tuple[List[Tuple[str, int, int]], List[str]]:
+    """(path, size, mtime_ns) of the images directly inside a directory, and its subdirectories."""
+    files, subdirectories = [], []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                    stat = entry.stat()
+                    files.append((entry.path, stat.st_size, stat.st_mtime_ns))
+    except OSError as e:
+        print(f"Skipping unreadable folder {directory}: {e}")
+    return files, subdirectories
+
+
+def scan_images(root: str, num_workers: int = DEFAULT_SCAN_WORKERS) -> FolderListing:
+    """
+    Find every supported image below a folder, listing its subdirectories in parallel.
+
+    Each directory is listed once with os.scandir, whose entries carry the file type
+    and, on most platforms, the stat results, so no file is opened. Hidden files and
+    directories are skipped and symlinked directories are not followed.
+
+    Args:
+        root: Folder to scan
+        num_workers: Number of directories listed at the same time
+
+    Returns:
+        Dictionary mapping paths relative to `root` to (size, mtime_ns), sorted by path
+    """
+    found: FolderListing = {}
+    with ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="scan") as pool:
+        pending = {pool.submit(_scan_directory, root)}
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                files, subdirectories = future.result()
+                for path, size, mtime_ns in files:
+                    found[os.path.relpath(path, root)] = (size, mtime_ns)
+                pending |= {pool.submit(_scan_directory, subdirectory) for subdirectory in subdirectories}
+    return dict(sorted(found.items()))
+
+
+class FolderRegistry:
+    def __init__(self, path: str):
+        """
+        Local folders whose photos are processed in place instead of being copied into uploads.
+
+        For each registered folder the registry keeps the size and modification time of
+        every image below it, so a rescan reports which photos were added, changed or
+        removed. Processing reads the files where they are; the embedding cache and album
+        state then only re-run the models on photos whose content changed.
+
+        Args:
+            path: JSON file the registry is stored in
+        """
+        self.path = path
+        self._folders: Optional[Dict[str, FolderListing]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, FolderListing]:
+        if self._folders is None:
+            self._folders = {}
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                if data.get("version") == REGISTRY_VERSION:
+                    self._folders = {
+                        root: {name: tuple(entry) for name, entry in files.items()}
+                        for root, files in data.get("folders", {}).items()
+                    }
+            except (OSError, ValueError):
+                pass
+        return self._folders
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.{uuid.uuid4().hex}.part"
+        with open(temp_path, 'w') as f:
+            json.dump({"version": REGISTRY_VERSION, "folders": self._load()}, f)
+        os.replace(temp_path, self.path)
+
+    def register(self, root: str, num_workers: int = DEFAULT_SCAN_WORKERS) -> Dict[str, object]:
+        """
+        Register a folder, or rescan it if it is registered already.
+
+        Args:
+            root: Folder to register
+            num_workers: Number of directories listed at the same time
+
+        Returns:
+            {"folder", "photos", "added", "changed", "removed"}, the last three being
+            paths relative to the folder compared with the previous scan
+        """
+        root = os.path.abspath(root)
+        listing = scan_images(root, num_workers)
+        with self._lock:
+            previous = self._load().get(root, {})
+            self._load()[root] = listing
+            self._save()
+        return {
+            "folder": root,
+            "photos": len(listing),
+            "added": [name for name in listing if name not in previous],
+            "changed": [name for name, entry in listing.items() if name in previous and previous[name] != entry],
+            "removed": [name for name in previous if name not in listing],
+        }
+
+    def rescan(self, num_workers: int = DEFAULT_SCAN_WORKERS) -> List[Dict[str, object]]:
+        """Rescan every registered folder; see `register`."""
+        return [self.register(root, num_workers) for root in self.folders()]
+
+    def unregister(self, root: str) -> bool:
+        with self._lock:
+            removed = self._load().pop(os.path.abspath(root), None) is not None
+            if removed:
+                self._save()
+        return removed
+
+    def clear(self):
+        """Forget every folder; the photos themselves are left alone."""
+        with self._lock:
+            self._folders = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def folders(self) -> List[str]:
+        with self._lock:
+            return list(self._load())
+
+    def photos(self) -> List[str]:
+        """Absolute paths of the photos of every registered folder, as of their last scan."""
+        with self._lock:
+            return [os.path.join(root, name) for root, files in self._load().items() for name in files]
+
+    def contains(self, path: str) -> bool:
+        """Whether `path` is a photo of a registered folder, e.g. before serving it."""
+        path = os.path.abspath(path)
+        with self._lock:
+            for root, files in self._load().items():
+                if path.startswith(root + os.sep) and os.path.relpath(path, root) in files:
+                    return True
+        return False
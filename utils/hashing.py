@@ -0,0 +1,21 @@
+import hashlib
+
+HASH_CHUNK_SIZE = 1024 * 1024  # Read files in 1 MiB chunks
+
+
+def file_sha256(path: str, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """
+    Compute the SHA-256 hex digest of a file without loading it into memory.
+
+    Args:
+        path: Path to the file to hash
+        chunk_size: Number of bytes to read at a time
+
+    Returns:
+        Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -1,12 +1,16 @@
 from PIL import Image
 
+from .telemetry import telemetry
+
+images_resized = telemetry.counter("photodump_images_resized_total", "Images downscaled by resize_image")
+
 def resize_image(image, max_height=1536, max_width=1536):
     """Resize the image only if it exceeds the specified dimensions."""
     original_width, original_height = image.size
     
     # Check if resizing is needed
     if original_width > max_width or original_height > max_height:
-        print(f"Resizing image from {original_width}x{original_height} to {max_width}x{max_height}")
+        images_resized.inc()
         # Calculate the new size maintaining the aspect ratio
         aspect_ratio = original_width / original_height
         if original_width > original_height:
@@ -19,4 +23,42 @@ def resize_image(image, max_height=1536, max_width=1536):
         # Resize the image using LANCZOS for high-quality downscaling
         return image.resize((new_width, new_height), Image.LANCZOS)
     else:
-        return image
\ No newline at end of file
+        return image
+
+def load_image_for_model(path: str, min_side: int) -> Image.Image:
+    """
+    Decode an image at roughly the resolution a model needs instead of at full size.
+
+    JPEGs are decoded with PIL's draft mode, which lets libjpeg scale by 1/2, 1/4 or 1/8
+    while decoding. The result is then downscaled so its shorter side is `min_side`,
+    which is still at least what the model's processor resizes to.
+
+    Args:
+        path: Path to the image file
+        min_side: Smallest allowed length of the shorter side
+
+    Returns:
+        RGB image whose shorter side is at most `min_side` unless the original is smaller
+    """
+    with Image.open(path) as img:
+        img.draft('RGB', (min_side, min_side))
+        img = img.convert('RGB')
+
+    width, height = img.size
+    shorter = min(width, height)
+    if shorter > min_side:
+        scale = min_side / shorter
+        new_size = (max(min_side, round(width * scale)), max(min_side, round(height * scale)))
+        img = img.resize(new_size, Image.BICUBIC, reducing_gap=3.0)
+    return img
+
+def processor_input_size(image_processor) -> int:
+    """Return the largest side length a Hugging Face image processor resizes or crops to."""
+    sides = []
+    for attr in ("size", "crop_size"):
+        value = getattr(image_processor, attr, None)
+        if isinstance(value, dict):
+            sides.extend(v for v in value.values() if isinstance(v, int))
+        elif isinstance(value, int):
+            sides.append(value)
+    return max(sides) if sides else 224
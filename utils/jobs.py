@@ -0,0 +1,131 @@
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+
+class JobCancelled(Exception):
+    """Raised from inside a job function to stop work after cancellation was requested."""
+
+
+class Job:
+    def __init__(self, job_id: str, name: str):
+        """
+        State of a single background job.
+
+        Args:
+            job_id: Unique id returned to clients
+            name: Short description of what the job does
+        """
+        self.id = job_id
+        self.name = name
+        self.status = "queued"  # queued -> running -> completed | failed | cancelled
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def cancel(self):
+        """Request cancellation; the job function decides when to honour it."""
+        self.cancel_event.set()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Status summary without the (possibly large) result."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    def __init__(self, max_workers: int = 1, keep_finished: int = 20):
+        """
+        Run blocking work on a worker pool and track it by job id.
+
+        Args:
+            max_workers: Number of jobs that may run at the same time
+            keep_finished: Number of finished jobs to remember for status queries
+        """
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, name: str, fn: Callable[[Job], Any],
+               on_done: Optional[Callable[[Job], None]] = None) -> Job:
+        """
+        Queue `fn(job)` on the worker pool and return immediately.
+
+        Args:
+            name: Short description of the job
+            fn: Blocking function to run; it receives the job so it can check `job.cancel_event`
+            on_done: Optional callback run on the worker thread once the job has finished
+
+        Returns:
+            The queued job
+        """
+        job = Job(uuid.uuid4().hex, name)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._forget_old_jobs()
+
+        def run():
+            job.started_at = time.time()
+            job.status = "running"
+            try:
+                job.result = fn(job)
+                job.status = "cancelled" if job.cancel_event.is_set() else "completed"
+            except JobCancelled as e:
+                job.error = str(e)
+                job.status = "cancelled"
+            except Exception as e:
+                traceback.print_exc()
+                job.error = str(e)
+                job.status = "cancelled" if job.cancel_event.is_set() else "failed"
+            finally:
+                job.finished_at = time.time()
+            if on_done:
+                try:
+                    on_done(job)
+                except Exception as e:
+                    print(f"Error in job {job.id} completion callback: {e}")
+
+        self._executor.submit(run)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def active(self) -> List[Job]:
+        """Jobs that are queued or running."""
+        return [job for job in self.list() if not job.done]
+
+    def _forget_old_jobs(self):
+        """Drop the oldest finished jobs beyond `keep_finished`. Caller holds the lock."""
+        finished = sorted((job for job in self._jobs.values() if job.done), key=lambda job: job.finished_at)
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job.id]
+
+    def shutdown(self):
+        """Cancel pending jobs and stop accepting new ones."""
+        for job in self.active():
+            job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,165 @@
+import errno
+import json
+import os
+import platform
+import shutil
+import uuid
+from typing import Dict, List, Optional
+
+OUTPUT_MODES = ("auto", "reflink", "hardlink", "symlink", "copy")
+DEFAULT_OUTPUT_MODE = "auto"  # Reflink, else hardlink, else copy
+SELECTION_FILE = "selection.json"
+SELECTION_VERSION = 1
+FICLONE = 0x40049409  # Linux ioctl that shares the extents of one file with another (btrfs, XFS, ...)
+
+# Modes tried in order for each output mode; copy always works as the last resort
+_ATTEMPTS = {
+    "auto": ("reflink", "hardlink", "copy"),
+    "reflink": ("reflink", "copy"),
+    "hardlink": ("hardlink", "copy"),
+    "symlink": ("symlink", "copy"),
+    "copy": ("copy",),
+}
+
+
+def reflink(src: str, dst: str):
+    """
+    Create `dst` as a copy-on-write clone of `src`, sharing its data blocks.
+
+    Raises:
+        OSError: If the filesystem or platform does not support clones
+    """
+    system = platform.system()
+    if system == "Linux":
+        import fcntl
+        with open(src, 'rb') as source, open(dst, 'wb') as target:
+            try:
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            except OSError:
+                target.close()
+                os.remove(dst)
+                raise
+    elif system == "Darwin":
+        import ctypes
+        libc = ctypes.CDLL("libc.dylib", use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code), dst)
+    else:
+        raise OSError(errno.EOPNOTSUPP, f"Reflinks are not supported on {system}", dst)
+    shutil.copystat(src, dst)
+
+
+def _create(src: str, dst: str, method: str):
+    if method == "reflink":
+        reflink(src, dst)
+    elif method == "hardlink":
+        os.link(src, dst)
+    elif method == "symlink":
+        os.symlink(os.path.relpath(os.path.abspath(src), os.path.dirname(os.path.abspath(dst))), dst)
+    else:
+        shutil.copy2(src, dst)
+
+
+def materialize(src: str, dst: str, mode: str = DEFAULT_OUTPUT_MODE) -> str:
+    """
+    Make `dst` show the contents of `src` as cheaply as the filesystem allows.
+
+    Each method of the mode is tried in turn, ending with a plain copy, so a hardlink
+    across devices or a reflink on a filesystem without clones still succeeds. The
+    result is written under a temporary name and moved over `dst`, so an existing
+    `dst` is only replaced once the new one is complete, and nothing is left behind
+    if every method fails.
+
+    Args:
+        src: Original photo
+        dst: Path to create
+        mode: One of OUTPUT_MODES
+
+    Returns:
+        Method that was used: "reflink", "hardlink", "symlink" or "copy"
+    """
+    temp_path = os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}.{uuid.uuid4().hex}.part")
+    try:
+        for method in _ATTEMPTS[mode]:
+            try:
+                _create(src, temp_path, method)
+            except FileNotFoundError:
+                raise
+            except OSError:
+                if method == "copy":
+                    raise
+                continue
+            os.replace(temp_path, dst)
+            return method
+    finally:
+        if os.path.lexists(temp_path):  # A failed copy leaves a partial file behind
+            os.remove(temp_path)
+
+
+def link_method(src: str, dst: str) -> Optional[str]:
+    """
+    How an existing `dst` mirrors `src`, or None if it is missing or out of date.
+
+    Reflinks cannot be told apart from copies and are reported as "copy"; like copies,
+    they are up to date when their size and modification time match `src`.
+    """
+    if os.path.islink(dst):
+        return "symlink" if os.path.exists(dst) and os.path.samefile(src, dst) else None
+    if not os.path.exists(dst):
+        return None
+    if os.path.samefile(src, dst):
+        return "hardlink"
+    src_stat, dst_stat = os.stat(src), os.stat(dst)
+    if src_stat.st_size == dst_stat.st_size and src_stat.st_mtime_ns == dst_stat.st_mtime_ns:
+        return "copy"
+    return None
+
+
+def is_materialized(src: str, dst: str, mode: str = DEFAULT_OUTPUT_MODE) -> bool:
+    """Whether `dst` is an up-to-date result of `materialize(src, dst, mode)` that can be kept as is."""
+    method = link_method(src, dst)
+    if method is None:
+        return False
+    if mode == "auto":
+        return method != "symlink"
+    if mode == "hardlink" and method == "copy":
+        # Copying is the fallback of a hardlink across devices
+        return os.stat(src).st_dev != os.stat(dst).st_dev
+    return method == ("copy" if mode == "reflink" else mode)
+
+
+def write_selection(output_dir: str, album_path: str, entries: Dict[str, List[dict]]) -> str:
+    """
+    Save the manifest of the selection, atomically.
+
+    Args:
+        output_dir: Directory the selection was materialized in
+        album_path: Folder of the original photos
+        entries: Dictionary mapping categories to lists of {"file", "source", "path", "method"}
+            entries, where "path" is relative to `output_dir`
+
+    Returns:
+        Path of the manifest
+    """
+    path = os.path.join(output_dir, SELECTION_FILE)
+    temp_path = f"{path}.{uuid.uuid4().hex}.part"
+    with open(temp_path, 'w') as f:
+        json.dump({"version": SELECTION_VERSION, "album": os.path.abspath(album_path), "categories": entries},
+                  f, indent=2)
+    os.replace(temp_path, path)
+    return path
+
+
+def read_selection(output_dir: str) -> Optional[dict]:
+    """The manifest saved by `write_selection`, or None if there is none or it is unreadable."""
+    path = os.path.join(output_dir, SELECTION_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable selection manifest {path}: {e}")
+        return None
+    return data if data.get("version") == SELECTION_VERSION else None
@@ -0,0 +1,68 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Tuple
+
+from PIL import Image
+
+from .image import load_image_for_model
+from .timing import stage_timer
+
+DEFAULT_DECODE_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def _decode(path: str, min_side: int) -> Image.Image:
+    with stage_timer.stage("decode"):
+        return load_image_for_model(path, min_side)
+
+
+class PrefetchLoader:
+    def __init__(self, paths: List[str], batch_size: int, min_side: int,
+                 num_workers: int = DEFAULT_DECODE_WORKERS, prefetch_batches: int = 2):
+        """
+        Decode and downscale images on a thread pool ahead of the model.
+
+        Pillow releases the GIL while decoding and resizing, so worker threads overlap
+        with inference. At most `prefetch_batches` batches beyond the one being consumed
+        are decoded ahead, which bounds memory use.
+
+        Args:
+            paths: Image paths, in the order batches should be produced
+            batch_size: Number of images per batch
+            min_side: Shorter side the images are downscaled to (see load_image_for_model)
+            num_workers: Number of decoding threads
+            prefetch_batches: Number of batches to keep decoding ahead
+        """
+        self.paths = paths
+        self.batch_size = max(1, batch_size)
+        self.min_side = min_side
+        self.num_workers = max(1, num_workers)
+        self.prefetch_batches = max(1, prefetch_batches)
+
+    def __len__(self) -> int:
+        return (len(self.paths) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self) -> Iterator[Tuple[List[str], List[Image.Image]]]:
+        """Yield (batch paths, decoded RGB images) tuples in input order."""
+        batches = [self.paths[i:i + self.batch_size] for i in range(0, len(self.paths), self.batch_size)]
+        if not batches:
+            return
+
+        with ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="decode") as pool:
+            pending = deque()
+            next_batch = 0
+            try:
+                while next_batch < len(batches) or pending:
+                    # Keep the queue of in-flight batches topped up
+                    while next_batch < len(batches) and len(pending) <= self.prefetch_batches:
+                        batch_paths = batches[next_batch]
+                        futures = [pool.submit(_decode, path, self.min_side) for path in batch_paths]
+                        pending.append((batch_paths, futures))
+                        next_batch += 1
+
+                    batch_paths, futures = pending.popleft()
+                    yield batch_paths, [future.result() for future in futures]
+            finally:
+                for _, futures in pending:
+                    for future in futures:
+                        future.cancel()
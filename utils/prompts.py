@@ -36,6 +36,39 @@ def build_classification_prompt(categories: str, description: str) -> str:
         }
     ]
     
+def build_prefixed_classification_prompt(categories: str, description: str) -> str:
+    """
+    Build the prompt for image classification, with the category list first.
+
+    Every prompt for the same categories then shares the text up to the image,
+    whose KV cache can be computed once.
+
+    Args:
+        categories: String containing numbered list of categories
+        description: String containing the description of the image
+    Returns:
+        Formatted prompt string for the VLM, with the image between the categories and the description
+    """
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": "Here are some categories:\n" + remove_number_prefix(categories) +
+                    "\nTo which of these categories does this image belong to?"
+                },
+                {
+                    "type": "image"
+                },
+                {
+                    "type": "text",
+                    "text": "Its description: \"" + description + "\""
+                }
+            ]
+        }
+    ]
+
 def build_description_prompt() -> str:
     """
     Build the prompt for image description.
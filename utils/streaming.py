@@ -0,0 +1,140 @@
+import heapq
+import itertools
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .utils import IMAGE_EXTENSIONS
+
+JOURNAL_VERSION = 1
+
+
+def iter_images(album_path: str) -> Iterator[Tuple[str, os.stat_result]]:
+    """Lazily yield (path, stat) of the supported images directly inside a folder, in directory order."""
+    with os.scandir(album_path) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                yield entry.path, entry.stat()
+
+
+def count_images(album_path: str) -> int:
+    """Number of supported images directly inside a folder, without keeping their names."""
+    with os.scandir(album_path) as entries:
+        return sum(1 for entry in entries if entry.name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Split an iterable into lists of `size` items, the last one possibly shorter."""
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class TopK:
+    def __init__(self, k: int):
+        """
+        The `k` highest scoring items seen so far, in O(k) memory.
+
+        Ties are broken in favour of the item added first, as a stable sort would.
+
+        Args:
+            k: Number of items to keep, or 0 to keep all
+        """
+        self.k = k
+        self._heap: List[tuple] = []
+        self._counter = itertools.count()
+
+    def add(self, item: Any, score: float):
+        entry = (score, -next(self._counter), item)
+        if not self.k or len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def items(self) -> List[Tuple[Any, float]]:
+        """(item, score) tuples, best first."""
+        return [(item, score) for score, _, item in sorted(self._heap, reverse=True)]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+class Journal:
+    def __init__(self, path: str, header: Dict[str, Any], fsync_every: int = 1):
+        """
+        Append-only JSONL log of per-photo results, so an interrupted run resumes where it stopped.
+
+        The first line is a header describing what the records depend on (models,
+        categories, settings). A journal with a different header is discarded when
+        opened. A line cut short by a crash is ignored, as is everything after it.
+
+        Args:
+            path: JSONL file of the journal
+            header: Settings the records are only valid for
+            fsync_every: Number of `flush` calls between two fsyncs to disk
+        """
+        self.path = path
+        self.header = {"version": JOURNAL_VERSION, **header}
+        self.fsync_every = fsync_every
+        self._file = None
+        self._flushes = 0
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        """Yield the records of a previous run with the same header, in the order they were written."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            first = f.readline()
+            try:
+                if json.loads(first) != self.header:
+                    print(f"Starting over: {self.path} was written with other settings")
+                    return
+            except ValueError:
+                return
+            for line in f:
+                if not line.endswith("\n"):
+                    return  # Cut short by a crash
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    return
+
+    def open(self, records: Optional[Iterable[Dict[str, Any]]] = None):
+        """
+        Start appending, first rewriting the journal as the header plus `records`.
+
+        Rewriting drops stale, duplicate and truncated lines of earlier runs. The new
+        file is written next to the old one and swapped in, so a crash while rewriting
+        keeps the old journal.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.part"
+        with open(temp_path, 'w') as f:
+            f.write(json.dumps(self.header) + "\n")
+            for record in records or ():
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, 'a')
+
+    def append(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record) + "\n")
+
+    def flush(self):
+        """Make appended records survive a crash of this process, and every `fsync_every` calls a power loss."""
+        self._file.flush()
+        self._flushes += 1
+        if self._flushes % self.fsync_every == 0:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
@@ -0,0 +1,232 @@
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple, Union
+
+from .timing import stage_timer
+
+# Upper bounds, in seconds, of the stage duration histogram: from a single decode to a whole album
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+STAGE_SECONDS = "photodump_stage_seconds"
+MAX_TRACE_EVENTS = 1_000_000  # Stop recording a trace beyond this many spans to bound memory
+
+LabelValues = Tuple[str, ...]
+CallbackValue = Union[float, Dict[LabelValues, float]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        """Monotonically increasing count, optionally split by label values."""
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(self.labels, key)} {_format_value(v)}" for key, v in sorted(values.items())]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """Distribution of observed values in cumulative buckets, optionally split by label values."""
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels: str) -> int:
+        return sum(self._counts.get(tuple(str(labels[name]) for name in self.labels), []))
+
+    def render(self) -> List[str]:
+        with self._lock:
+            counts = {key: list(values) for key, values in self._counts.items()}
+            sums = dict(self._sums)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key in sorted(counts):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[key]):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(sums[key])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    def __init__(self, name: str, help: str, kind: str, fn: Callable[[], CallbackValue], labels: Sequence[str] = ()):
+        """
+        Gauge or counter whose value is read from `fn` when metrics are scraped.
+
+        Args:
+            kind: "gauge" or "counter"
+            fn: Returns the value, or {label values: value} when `labels` are given
+        """
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.fn = fn
+        self.labels = tuple(labels)
+
+    def render(self) -> List[str]:
+        try:
+            values = self.fn()
+        except Exception as e:
+            print(f"Error reading metric {self.name}: {e}")
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{self.name}{_format_labels(self.labels, key)} {_format_value(v)}" for key, v in sorted(values.items())]
+        return lines
+
+
+class ChromeTrace:
+    def __init__(self):
+        """Spans recorded while a trace is active, in the Chrome trace event format (chrome://tracing, Perfetto)."""
+        self.origin = time.perf_counter()
+        self.events: List[dict] = []
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, seconds: float):
+        thread = threading.current_thread()
+        with self._lock:
+            if len(self.events) >= MAX_TRACE_EVENTS:
+                return
+            self._threads.setdefault(thread.ident, thread.name)
+            self.events.append({
+                "name": name, "ph": "X", "pid": os.getpid(), "tid": thread.ident,
+                "ts": (start - self.origin) * 1e6, "dur": seconds * 1e6,
+            })
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            names = [
+                {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                for tid, name in self._threads.items()
+            ]
+            return {"traceEvents": names + list(self.events), "displayTimeUnit": "ms"}
+
+    def save(self, path: str):
+        """Write the trace as JSON, atomically."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.part"
+        with open(temp_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(temp_path, path)
+
+
+class Telemetry:
+    def __init__(self):
+        """
+        Process-wide registry of metrics, fed by the pipeline's timed stages.
+
+        Every block timed with `utils.timing.stage_timer` is observed in the
+        photodump_stage_seconds histogram and, while a trace is active, recorded as a
+        span. Spans of models running in ShardPool worker processes stay in those processes.
+        """
+        self._metrics: Dict[str, Union[Counter, Histogram, CallbackMetric]] = {}
+        self._traces: List[ChromeTrace] = []
+        self._lock = threading.Lock()
+        self.stage_seconds = self.histogram(STAGE_SECONDS, "Time spent per call of a pipeline stage", ["stage"])
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        """Get or create a counter."""
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Get or create a histogram."""
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def register_callback(self, name: str, help: str, fn: Callable[[], CallbackValue],
+                          kind: str = "gauge", labels: Sequence[str] = ()):
+        """Expose a value computed at scrape time, e.g. queue depth or cache hits; replaces an earlier one."""
+        with self._lock:
+            self._metrics[name] = CallbackMetric(name, help, kind, fn, labels)
+
+    def record_span(self, name: str, start: float, seconds: float):
+        """Stage listener: observe the duration and add it to active traces."""
+        self.stage_seconds.observe(seconds, stage=name)
+        with self._lock:
+            traces = list(self._traces)
+        for trace in traces:
+            trace.add_span(name, start, seconds)
+
+    @contextmanager
+    def trace(self) -> Iterator[ChromeTrace]:
+        """Record every span of this process, from any thread, while the block runs."""
+        trace = ChromeTrace()
+        with self._lock:
+            self._traces.append(trace)
+        try:
+            yield trace
+        finally:
+            with self._lock:
+                self._traces.remove(trace)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+# Shared by the whole process
+telemetry = Telemetry()
+stage_timer.add_listener(telemetry.record_span)
+images_processed = telemetry.counter(
+    "photodump_images_processed_total", "Photos that went through a pipeline stage", ["stage"]
+)
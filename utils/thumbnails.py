@@ -0,0 +1,83 @@
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps, features
+
+THUMBNAIL_SIZES = {"small": 256, "medium": 640, "large": 1600}  # Longest side in pixels
+THUMBNAIL_DIR_NAME = ".thumbnails"
+THUMBNAIL_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+THUMBNAIL_MEDIA_TYPE = "image/webp" if THUMBNAIL_FORMAT == "WEBP" else "image/jpeg"
+THUMBNAIL_QUALITY = 80
+PINNED_CACHE_CONTROL = "public, max-age=31536000, immutable"  # For URLs pinned to the content hash
+
+
+def thumbnail_path(thumbnails_dir: Path, digest: str, size: str) -> Path:
+    """Location of a derivative; keyed by content hash so identical uploads share it."""
+    extension = "webp" if THUMBNAIL_FORMAT == "WEBP" else "jpg"
+    return Path(thumbnails_dir) / f"{digest}_{size}.{extension}"
+
+
+def thumbnail_headers(digest: str, size: str, version: Optional[str] = None) -> Dict[str, str]:
+    """
+    ETag and Cache-Control headers of a derivative.
+
+    The ETag is derived from the content hash, so it never changes for the same bytes.
+    When the client pins the URL to the hash with `version`, the response is cacheable
+    forever; otherwise it must be revalidated.
+    """
+    return {
+        "ETag": f'"{digest}-{size}"',
+        "Cache-Control": PINNED_CACHE_CONTROL if version is not None and version == digest else "no-cache",
+    }
+
+
+def is_not_modified(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header, possibly a list of weak or strong tags, matches `etag`."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def ensure_thumbnail(source: Path, digest: str, size: str, thumbnails_dir: Path) -> Path:
+    """
+    Create the derivative of an image at one of the fixed sizes, unless it already exists.
+
+    The source is decoded in JPEG draft mode close to the target size, rotated according
+    to its EXIF orientation and downscaled so its longest side fits the size. The result
+    is written to a temporary file and renamed into place, so concurrent requests never
+    serve a partial file.
+
+    Args:
+        source: Original image
+        digest: SHA-256 of the original, used as the cache key
+        size: One of THUMBNAIL_SIZES
+        thumbnails_dir: Directory holding the derivatives
+
+    Returns:
+        Path of the derivative
+    """
+    if size not in THUMBNAIL_SIZES:
+        raise ValueError(f"Unknown thumbnail size '{size}', expected one of {sorted(THUMBNAIL_SIZES)}")
+    destination = thumbnail_path(thumbnails_dir, digest, size)
+    if destination.exists():
+        return destination
+
+    max_side = THUMBNAIL_SIZES[size]
+    with Image.open(source) as img:
+        img.draft("RGB", (max_side, max_side))
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGB")
+    img.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=3.0)
+
+    os.makedirs(thumbnails_dir, exist_ok=True)
+    temp_path = destination.with_name(f".{destination.name}.{uuid.uuid4().hex}.part")
+    try:
+        img.save(temp_path, format=THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY)
+        os.replace(temp_path, destination)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+    return destination
@@ -0,0 +1,60 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+# Called with (stage name, perf_counter() at the start, seconds) after every timed block
+StageListener = Callable[[str, float, float], None]
+
+
+class StageTimer:
+    def __init__(self):
+        """
+        Accumulate wall-clock time and call counts per named pipeline stage.
+
+        Stages may be timed from several threads at once (e.g. decode workers), in
+        which case their total is the sum over threads rather than elapsed time.
+        Listeners see every timed block individually, e.g. to build histograms or traces.
+        """
+        self._seconds: Dict[str, float] = {}
+        self._calls: Dict[str, int] = {}
+        self._listeners: List[StageListener] = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: StageListener):
+        """Call `listener(name, start, seconds)` after every block timed with `stage`."""
+        with self._lock:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as one call of stage `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, start=start)
+
+    def add(self, name: str, seconds: float, calls: int = 1, start: Optional[float] = None):
+        """Record time spent in a stage outside of `stage`; `start` is its perf_counter() start, if known."""
+        with self._lock:
+            self._seconds[name] = self._seconds.get(name, 0.0) + seconds
+            self._calls[name] = self._calls.get(name, 0) + calls
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(name, start if start is not None else time.perf_counter() - seconds, seconds)
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Totals so far, as {stage: {"seconds": ..., "calls": ...}}."""
+        with self._lock:
+            return {name: {"seconds": self._seconds[name], "calls": self._calls[name]} for name in self._seconds}
+
+    def reset(self):
+        with self._lock:
+            self._seconds.clear()
+            self._calls.clear()
+
+
+# Shared by every stage of the pipeline in this process
+stage_timer = StageTimer()
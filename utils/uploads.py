@@ -0,0 +1,58 @@
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Tuple
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Stream uploads in 1 MiB chunks
+
+
+def _write_chunk(f: BinaryIO, digest, chunk: bytes):
+    """Hash and write one chunk; runs on a worker thread (both release the GIL for large buffers)."""
+    digest.update(chunk)
+    f.write(chunk)
+
+
+def _finalize(f: BinaryIO, temp_path: Path, destination: Path) -> int:
+    f.close()
+    os.replace(temp_path, destination)
+    return destination.stat().st_size
+
+
+async def save_upload(upload: UploadFile, destination: Path, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Tuple[str, int]:
+    """
+    Stream an uploaded file to disk while computing its SHA-256.
+
+    The file is written in chunks to a temporary file next to `destination` and renamed
+    into place once complete, so readers never see a partially written photo and the
+    whole upload is never held in memory. Blocking file I/O runs off the event loop.
+
+    Args:
+        upload: File from a multipart request
+        destination: Final path of the file
+        chunk_size: Number of bytes to read and write at a time
+
+    Returns:
+        Tuple of (hex SHA-256 digest, size in bytes)
+    """
+    temp_path = destination.with_name(f".{destination.name}.{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    f = await run_in_threadpool(open, temp_path, "wb")
+    try:
+        while True:
+            chunk = await upload.read(chunk_size)
+            if not chunk:
+                break
+            await run_in_threadpool(_write_chunk, f, digest, chunk)
+        size = await run_in_threadpool(_finalize, f, temp_path, destination)
+    except BaseException:
+        f.close()
+        if temp_path.exists():
+            temp_path.unlink()
+        raise
+    finally:
+        await upload.close()
+    return digest.hexdigest(), size
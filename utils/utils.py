@@ -1,5 +1,8 @@
+import os
 import json
-from typing import Dict
+from typing import Dict, List
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
 
 def save_results(results: Dict[str, str], output_file: str) -> None:
     """Save categorization results to a JSON file.
@@ -21,4 +24,13 @@ def load_categories(categories_file: str) -> Dict[int, str]:
             if '. ' in category:
                 category = category.split('. ')[1]
             categories[i] = category
-    return categories
\ No newline at end of file
+    return categories
+
+
+def list_images(album_path: str) -> List[str]:
+    """List the paths of all supported images directly inside a folder, in name order."""
+    return [
+        os.path.join(album_path, filename)
+        for filename in sorted(os.listdir(album_path))
+        if filename.lower().endswith(IMAGE_EXTENSIONS)
+    ]
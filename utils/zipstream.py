@@ -0,0 +1,72 @@
+import io
+import os
+import zipfile
+from typing import Iterable, Iterator, Tuple
+
+ZIP_CHUNK_SIZE = 256 * 1024
+# Already-compressed formats are stored as-is; deflating them costs CPU for no gain
+STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic')
+
+
+class _StreamSink(io.RawIOBase):
+    """Write-only, unseekable file object that buffers whatever zipfile writes until drained."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def stream_zip(entries: Iterable[Tuple[str, str]], chunk_size: int = ZIP_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Generate a ZIP archive chunk by chunk without building it on disk or in memory.
+
+    Entries are written with data descriptors, so each file is read once and its
+    bytes are yielded as soon as they are written. JPEG/PNG and other compressed
+    images are STORED; anything else is deflated.
+
+    Args:
+        entries: Iterable of (source file path, name inside the archive) tuples
+        chunk_size: Number of bytes read from each source file at a time
+
+    Yields:
+        Consecutive chunks of the ZIP file
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, mode="w") as zf:
+        for source, arcname in entries:
+            zinfo = zipfile.ZipInfo.from_file(source, arcname)
+            stored = source.lower().endswith(STORED_EXTENSIONS)
+            zinfo.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+            force_zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT
+            with open(source, "rb") as src, zf.open(zinfo, mode="w", force_zip64=force_zip64) as dest:
+                for chunk in iter(lambda: src.read(chunk_size), b""):
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    # Central directory, written when the archive is closed
+    yield sink.drain()
+
+
+def archive_name(*parts: str) -> str:
+    """Join path components into a ZIP member name, which always uses forward slashes."""
+    return "/".join(part.replace(os.sep, "/").strip("/") for part in parts if part)